@@ -0,0 +1,211 @@
+"""
+Microphone capture in a helper process
+- CaptureProcess: long-lived child process that keeps one input stream
+  open and writes PCM into a multiprocessing.shared_memory ring buffer
+- RingSource: speech_recognition AudioSource reading live audio from that
+  ring, so `with source:` costs nothing and recorder/recognizer code works
+  unchanged
+
+Ring layout (shared memory):
+  header | PCM bytes (circular)
+The header holds the total number of bytes ever written; the writer copies
+the data first and then publishes the new total, so readers never see
+partially written frames. Reads return memoryviews into the ring (no
+copy unless a read wraps around the end). A reader that falls more than
+the ring's capacity behind skips ahead and counts the overrun.
+"""
+
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import speech_recognition as sr
+
+# CHANGEABLE: seconds of audio the ring holds; must exceed the longest single
+# recording, because recordings keep views into the ring until they finish
+RING_SECONDS = 180
+# Largest input format the ring is sized for (48 kHz, 16-bit mono)
+_MAX_RATE = 48000
+_MAX_WIDTH = 2
+CHUNK = 1024
+# Seconds to wait for the helper to open the microphone
+START_TIMEOUT = 15
+_POLL_SECONDS = 0.005
+
+# write_pos, capacity, sample_rate, sample_width, chunk, status
+_HEADER = struct.Struct("<QQIIII")
+_DATA_OFFSET = 64
+_STARTING, _RUNNING, _STOPPED, _FAILED = range(4)
+
+
+def _open_microphone(device_index, chunk):
+    return sr.Microphone(device_index=device_index, chunk_size=chunk)
+
+
+def _capture_main(shm_name, device_index, chunk, stop, ready, open_source):
+    """Helper process: open the input once and copy blocks into the ring until stopped."""
+    # The parent owns and unlinks the segment (spawned children share the
+    # parent's resource tracker, so attaching here registers nothing new)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    buf = shm.buf
+    try:
+        with open_source(device_index, chunk) as source:
+            width = source.SAMPLE_WIDTH
+            data_size = len(buf) - _DATA_OFFSET
+            capacity = data_size - data_size % width
+            _HEADER.pack_into(buf, 0, 0, capacity, source.SAMPLE_RATE, width, source.CHUNK, _RUNNING)
+            ready.set()
+            write_pos = 0
+            while not stop.is_set():
+                block = source.stream.read(source.CHUNK)
+                n = len(block)
+                at = write_pos % capacity
+                first = min(n, capacity - at)
+                buf[_DATA_OFFSET + at:_DATA_OFFSET + at + first] = block[:first]
+                if first < n:
+                    buf[_DATA_OFFSET:_DATA_OFFSET + n - first] = block[first:]
+                write_pos += n
+                struct.pack_into("<Q", buf, 0, write_pos)
+        struct.pack_into("<I", buf, 28, _STOPPED)
+    except Exception as e:
+        struct.pack_into("<I", buf, 28, _FAILED)
+        print(f"❌ Capture process error: {e}")
+    finally:
+        ready.set()
+        del buf
+        shm.close()
+
+
+class _RingStream:
+    """The `stream` of a RingSource: blocking reads from the shared ring."""
+
+    def __init__(self, capture, start_pos):
+        self.capture = capture
+        self.pos = start_pos
+        self.overruns = 0
+
+    def read(self, size):
+        """Next `size` frames (size * sample_width bytes) as a bytes-like object."""
+        cap = self.capture
+        n = size * cap.sample_width
+        while True:
+            write_pos = cap.write_pos()
+            if write_pos - self.pos > cap.capacity:
+                # fell behind the writer: drop what was overwritten
+                self.overruns += 1
+                self.pos = write_pos - write_pos % cap.sample_width - n
+            if write_pos - self.pos >= n:
+                break
+            if not cap.is_alive():
+                raise OSError("capture process stopped")
+            time.sleep(_POLL_SECONDS)
+        view = cap.view(self.pos, n)
+        self.pos += n
+        return view
+
+    def close(self):
+        pass
+
+
+class RingSource(sr.AudioSource):
+    """
+    AudioSource backed by a CaptureProcess. Entering starts reading at the
+    live edge of the ring; nothing is opened or closed.
+    """
+
+    def __init__(self, capture):
+        self.capture = capture
+        self.SAMPLE_RATE = capture.sample_rate
+        self.SAMPLE_WIDTH = capture.sample_width
+        self.CHUNK = capture.chunk
+        self.format = None
+        self.stream = None
+        # sr.Microphone attributes other code inspects
+        self.device_index = capture.device_index
+        self.pyaudio_module = None
+
+    def __enter__(self):
+        if self.stream is not None:
+            raise RuntimeError("This audio source is already inside a context manager")
+        live = self.capture.write_pos()
+        self.stream = _RingStream(self.capture, live - live % self.SAMPLE_WIDTH)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+
+class CaptureProcess:
+    """
+    Owns the shared ring and the helper process that fills it.
+    start() blocks until the microphone is open (or raises OSError).
+    """
+
+    def __init__(self, device_index=None, chunk=CHUNK, ring_seconds=RING_SECONDS,
+                 open_source=_open_microphone):
+        self.device_index = device_index
+        self.chunk = chunk
+        self.open_source = open_source
+        self.size = _DATA_OFFSET + ring_seconds * _MAX_RATE * _MAX_WIDTH
+        self.shm = None
+        self.process = None
+        self.sample_rate = self.sample_width = self.capacity = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        self.shm = shared_memory.SharedMemory(create=True, size=self.size)
+        _HEADER.pack_into(self.shm.buf, 0, 0, 0, 0, 0, 0, _STARTING)
+        self._stop = ctx.Event()
+        ready = ctx.Event()
+        self.process = ctx.Process(target=_capture_main, name="surahsync-capture", daemon=True,
+                                   args=(self.shm.name, self.device_index, self.chunk, self._stop, ready,
+                                         self.open_source))
+        self.process.start()
+        if not ready.wait(START_TIMEOUT) or self.status() != _RUNNING:
+            self.stop()
+            raise OSError("capture process could not open the microphone")
+        _, self.capacity, self.sample_rate, self.sample_width, self.chunk, _ = _HEADER.unpack_from(self.shm.buf, 0)
+        return self
+
+    def status(self) -> int:
+        return _HEADER.unpack_from(self.shm.buf, 0)[5]
+
+    def write_pos(self) -> int:
+        return struct.unpack_from("<Q", self.shm.buf, 0)[0]
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def view(self, pos: int, n: int):
+        """n bytes of the stream starting at absolute byte position pos."""
+        at = pos % self.capacity
+        start = _DATA_OFFSET + at
+        if at + n <= self.capacity:
+            return self.shm.buf[start:start + n]
+        first = self.capacity - at
+        return bytes(self.shm.buf[start:start + first]) + bytes(self.shm.buf[_DATA_OFFSET:_DATA_OFFSET + n - first])
+
+    def source(self) -> RingSource:
+        return RingSource(self)
+
+    def stop(self):
+        """Stop the helper and release the ring."""
+        with self._lock:
+            if self.process is not None:
+                self._stop.set()
+                self.process.join(2)
+                if self.process.is_alive():
+                    self.process.terminate()
+                self.process = None
+            if self.shm is not None:
+                try:
+                    self.shm.close()
+                except BufferError:
+                    # a recording still holds views into the ring; the
+                    # mapping goes away with the last of them
+                    pass
+                self.shm.unlink()
+                self.shm = None
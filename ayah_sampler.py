@@ -0,0 +1,216 @@
+"""
+Weighted random ayah sampling (Walker/Vose alias tables)
+- AliasTable(weights): O(n) build, O(1) draws
+- AyahSampler: weights over global verse ids, split into blocks of
+  BLOCK_SIZE with one alias table per block and one over the block totals.
+  A draw costs two table lookups; update(verse_id, weight) only marks its
+  block, which is rebuilt (O(BLOCK_SIZE + blocks)) at the next draw
+- sample(k) / sample_distinct(k): batched draws, with or without
+  replacement; neither modifies the sampler
+- uniform_sampler(index, first_surah, last_surah): every verse equally likely
+  (optionally within a surah range), so long surahs are not undersampled
+- weakness_sampler(index, scores): weakest ayahs drawn most; scores maps
+  verse id -> recent score (0-100)
+"""
+
+import random
+from array import array
+
+# Verses per block; updates rebuild one block plus the (small) top table
+BLOCK_SIZE = 64
+# CHANGEABLE: weakness weighting - weight = WEAK_FLOOR + (100 - score) / 100,
+# never-recited ayahs get UNSEEN_WEIGHT
+WEAK_FLOOR = 0.05
+UNSEEN_WEIGHT = 0.5
+# Duplicate draws tolerated per requested item before sample_distinct
+# switches from rejection to zeroing out the chosen weights
+_MAX_REJECTS = 4
+
+
+class AliasTable:
+    """Alias table over weights[0..n-1]; draw(rng) returns an index with probability weight / total."""
+
+    def __init__(self, weights):
+        n = len(weights)
+        self.total = float(sum(weights))
+        self.prob = array("d", bytes(8 * n))
+        self.alias = array("I", bytes(4 * n))
+        if n == 0 or self.total <= 0:
+            return
+        scaled = [w * n / self.total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        prob, alias = self.prob, self.alias
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(large.pop())
+        # leftovers are 1 up to rounding error; zero weights must still never be drawn
+        fallback = next(i for i, w in enumerate(weights) if w > 0)
+        for i in large + small:
+            if weights[i] > 0:
+                prob[i], alias[i] = 1.0, i
+            else:
+                prob[i], alias[i] = 0.0, fallback
+
+    def __len__(self):
+        return len(self.prob)
+
+    def draw(self, rng=random) -> int:
+        u = rng.random() * len(self.prob)
+        i = int(u)
+        return i if u - i < self.prob[i] else self.alias[i]
+
+
+class AyahSampler:
+    """
+    Weighted sampler over verse ids first..last (inclusive). Weights are
+    non-negative; a verse with weight 0 is never drawn. Not thread-safe:
+    give each thread (or tester) its own sampler for updates.
+    """
+
+    def __init__(self, first: int, last: int, weights=None, rng=None):
+        self.first = first
+        self.count = last - first + 1
+        self.rng = rng or random
+        self.weights = array("d", weights if weights is not None else [1.0] * self.count)
+        if len(self.weights) != self.count:
+            raise ValueError(f"expected {self.count} weights, got {len(self.weights)}")
+        blocks = (self.count + BLOCK_SIZE - 1) // BLOCK_SIZE
+        self._blocks = [self._build_block(b) for b in range(blocks)]
+        self._top = AliasTable([t.total for t in self._blocks])
+        self._dirty = set()
+
+    def _build_block(self, b: int) -> AliasTable:
+        return AliasTable(self.weights[b * BLOCK_SIZE:(b + 1) * BLOCK_SIZE])
+
+    def _refresh(self):
+        for b in self._dirty:
+            self._blocks[b] = self._build_block(b)
+        self._dirty.clear()
+        self._top = AliasTable([t.total for t in self._blocks])
+
+    @property
+    def total(self) -> float:
+        if self._dirty:
+            self._refresh()
+        return self._top.total
+
+    def weight(self, verse_id: int) -> float:
+        return self.weights[verse_id - self.first]
+
+    def update(self, verse_id: int, weight: float):
+        """Set one verse's weight; takes effect at the next draw."""
+        if weight < 0:
+            raise ValueError("weights must be non-negative")
+        i = verse_id - self.first
+        if not 0 <= i < self.count:
+            raise IndexError(f"Verse id {verse_id} outside this sampler")
+        self.weights[i] = weight
+        self._dirty.add(i // BLOCK_SIZE)
+
+    def draw(self) -> int:
+        """One verse id."""
+        if self._dirty:
+            self._refresh()
+        if self._top.total <= 0:
+            raise ValueError("No ayah has a positive weight")
+        b = self._top.draw(self.rng)
+        return self.first + b * BLOCK_SIZE + self._blocks[b].draw(self.rng)
+
+    def sample(self, k: int) -> list:
+        """k verse ids drawn independently (with replacement)."""
+        return [self.draw() for _ in range(k)]
+
+    def sample_distinct(self, k: int) -> list:
+        """
+        Up to k different verse ids (fewer only if fewer have a positive
+        weight), each draw proportional to the weights of those not yet drawn.
+        Duplicates are rejected while they are rare; after that the rest are
+        drawn by walking the block totals minus the verses already chosen.
+        The sampler itself is never modified.
+        """
+        if self._dirty:
+            self._refresh()
+        available = sum(1 for w in self.weights if w > 0)
+        k = min(k, available)
+        chosen = []
+        seen = set()
+        rejects = 0
+        while len(chosen) < k and rejects <= _MAX_REJECTS * k:
+            v = self.draw()
+            if v in seen:
+                rejects += 1
+                continue
+            seen.add(v)
+            chosen.append(v)
+        if len(chosen) < k:
+            left = [t.total for t in self._blocks]
+            for v in seen:
+                self._exclude(left, v, seen)
+            while len(chosen) < k:
+                v = self._draw_excluding(left, seen)
+                seen.add(v)
+                chosen.append(v)
+                self._exclude(left, v, seen)
+        return chosen
+
+    def _exclude(self, left, verse_id: int, seen):
+        # recomputed rather than subtracted, so rounding never leaves a
+        # block that only holds chosen verses with a positive total
+        b = (verse_id - self.first) // BLOCK_SIZE
+        start = b * BLOCK_SIZE
+        left[b] = sum(w for i, w in enumerate(self.weights[start:start + BLOCK_SIZE], self.first + start)
+                      if i not in seen)
+
+    def _draw_excluding(self, left, seen) -> int:
+        """One draw ignoring `seen`, O(blocks + BLOCK_SIZE); `left` holds the remaining block totals."""
+        r = self.rng.random() * sum(left)
+        b = 0
+        for b, total in enumerate(left):
+            if total > 0 and r < total:
+                break
+            r -= total
+        while left[b] <= 0:  # r landed past the end by rounding
+            b -= 1
+        start = b * BLOCK_SIZE
+        v = None
+        for i, w in enumerate(self.weights[start:start + BLOCK_SIZE], self.first + start):
+            if w > 0 and i not in seen:
+                v = i
+                if r < w:
+                    break
+                r -= w
+        return v
+
+
+def _verse_range(index, first_surah: int = None, last_surah: int = None):
+    first_surah = first_surah or 1
+    last_surah = last_surah or index.surah_count
+    first = index.verse_id(first_surah, 1)
+    last = index.verse_id(last_surah, index.ayah_count(last_surah))
+    return first, last
+
+
+def uniform_sampler(index, first_surah: int = None, last_surah: int = None, rng=None) -> AyahSampler:
+    """Every verse of surahs first_surah..last_surah (default: all) equally likely."""
+    first, last = _verse_range(index, first_surah, last_surah)
+    return AyahSampler(first, last, rng=rng)
+
+
+def weakness_weight(score) -> float:
+    return UNSEEN_WEIGHT if score is None else WEAK_FLOOR + max(0.0, 100.0 - score) / 100.0
+
+
+def weakness_sampler(index, scores, first_surah: int = None, last_surah: int = None, rng=None) -> AyahSampler:
+    """
+    Verses weighted by weakness: `scores` maps verse id -> recent score;
+    keep it current with sampler.update(verse_id, weakness_weight(score)).
+    """
+    first, last = _verse_range(index, first_surah, last_surah)
+    weights = [weakness_weight(scores.get(v)) for v in range(first, last + 1)]
+    return AyahSampler(first, last, weights, rng)
@@ -0,0 +1,235 @@
+"""
+Ayah search: identify which ayah a transcript is from
+- build_search_index(corpus) builds an inverted n-gram index over the
+  normalized corpus (word unigrams, word bigrams, character trigrams)
+- AyahSearchIndex.search(text, k) retrieves top candidates by IDF-weighted
+  term overlap, then rescores them exactly with compare_texts
+
+The index is persisted next to the dataset and memory-mapped:
+  header | term hashes (uint64, sorted) | postings offsets (uint32) | postings (uint16 verse ids)
+Terms are stored as 64-bit hashes; a rare collision only merges two postings
+lists, which the exact rescoring step absorbs.
+"""
+
+import hashlib
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from corpus import get_corpus, _NATIVE_LE
+from quran_data import DEFAULT_PROFILE, compare_texts, normalization_key, normalize_arabic
+
+# Optional: vectorized score accumulation if NumPy is installed
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except Exception:
+    HAVE_NUMPY = False
+
+SEARCH_SUFFIX = ".ngram"
+SEARCH_MAGIC = b"SSQI"
+SEARCH_VERSION = 1
+
+# magic, version, reserved, corpus source sha256, normalization key,
+# verse count, term count, postings count
+_HEADER = struct.Struct("<4sHH32s32sIII")
+
+# Term kinds and their weight in the retrieval score
+_WORD, _BIGRAM, _TRIGRAM = "w", "b", "c"
+_TERM_WEIGHTS = {_WORD: 1.0, _BIGRAM: 1.5, _TRIGRAM: 0.3}
+# Character trigrams found in more than this share of verses are skipped at
+# query time: they barely discriminate and dominate the postings work.
+_MAX_TRIGRAM_DF = 0.1
+# Candidates rescored per requested result
+_RESCORE_FACTOR = 4
+
+
+def _term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _terms(tokens):
+    """Distinct (kind, term) pairs for a list of normalized word tokens."""
+    terms = set()
+    for tok in tokens:
+        terms.add((_WORD, tok))
+        padded = f" {tok} "
+        for i in range(len(padded) - 2):
+            terms.add((_TRIGRAM, padded[i:i + 3]))
+    for a, b in zip(tokens, tokens[1:]):
+        terms.add((_BIGRAM, f"{a} {b}"))
+    return terms
+
+
+def default_search_path(corpus, profile: str = DEFAULT_PROFILE) -> str:
+    return f"{os.path.splitext(corpus.path)[0]}.{profile}{SEARCH_SUFFIX}"
+
+
+def build_search_index(corpus, profile: str = DEFAULT_PROFILE, path: str = None) -> str:
+    """Build and save the n-gram index for `corpus`. Returns the index path."""
+    path = path or default_search_path(corpus, profile)
+    sidecar = corpus.normalized(profile)
+    postings = {}
+    for verse_id in range(1, len(corpus) + 1):
+        for kind, term in _terms(sidecar.reference(verse_id).tokens):
+            postings.setdefault(_term_hash(f"{kind}:{term}"), set()).add(verse_id)
+
+    hashes = array("Q", sorted(postings))
+    offsets = array("I", [0])
+    flat = array("H")
+    for h in hashes:
+        flat.extend(sorted(postings[h]))
+        offsets.append(len(flat))
+    tables = (hashes, offsets, flat)
+    if not _NATIVE_LE:
+        for table in tables:
+            table.byteswap()
+    header = _HEADER.pack(SEARCH_MAGIC, SEARCH_VERSION, 0, corpus.source_sha256,
+                          bytes.fromhex(normalization_key(profile)), len(corpus), len(hashes), len(flat))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for table in tables:
+            f.write(table.tobytes())
+    os.replace(tmp_path, path)
+    print(f"Search index saved to {path} ({len(hashes)} terms, {len(flat)} postings)")
+    return path
+
+
+def _mapped(mm, typecode: str, at: int, count: int):
+    itemsize = array(typecode).itemsize
+    raw = memoryview(mm)[at:at + itemsize * count]
+    if _NATIVE_LE:
+        table = raw.cast(typecode)
+    else:
+        table = array(typecode, raw.tobytes())
+        table.byteswap()
+    raw.release()
+    return table
+
+
+class AyahSearchIndex:
+    """Read-only, memory-mapped n-gram index over one corpus and profile."""
+
+    def __init__(self, path: str, corpus, profile: str = DEFAULT_PROFILE):
+        self.path = path
+        self.corpus = corpus
+        self.profile = profile
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mm, 0)
+        if header[0] != SEARCH_MAGIC or header[1] != SEARCH_VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {SEARCH_VERSION} search index")
+        self.verse_count, term_count, posting_count = header[5:8]
+        at = _HEADER.size
+        self._hashes = _mapped(self._mm, "Q", at, term_count)
+        at += 8 * term_count
+        self._offsets = _mapped(self._mm, "I", at, term_count + 1)
+        at += 4 * (term_count + 1)
+        self._postings = _mapped(self._mm, "H", at, posting_count)
+        if HAVE_NUMPY:
+            self._np_postings = np.frombuffer(self._mm, dtype="<u2", count=posting_count, offset=at)
+
+    def _lookup(self, term_hash: int):
+        """(start, end) of the postings for a term hash, or None."""
+        i = bisect_left(self._hashes, term_hash)
+        if i < len(self._hashes) and self._hashes[i] == term_hash:
+            return self._offsets[i], self._offsets[i + 1]
+        return None
+
+    def _weighted_postings(self, tokens):
+        max_trigram_df = _MAX_TRIGRAM_DF * self.verse_count
+        for kind, term in _terms(tokens):
+            span = self._lookup(_term_hash(f"{kind}:{term}"))
+            if span is None:
+                continue
+            df = span[1] - span[0]
+            if kind == _TRIGRAM and df > max_trigram_df:
+                continue
+            yield span, _TERM_WEIGHTS[kind] * math.log(1 + self.verse_count / df)
+
+    def candidates(self, text: str, k: int = 20):
+        """Top-k (verse_id, retrieval score) pairs for a transcript, best first."""
+        tokens = normalize_arabic(text, self.profile).split()
+        if not tokens:
+            return []
+        if HAVE_NUMPY:
+            scores = np.zeros(self.verse_count + 1)
+            for (start, end), weight in self._weighted_postings(tokens):
+                scores[self._np_postings[start:end]] += weight
+            k = min(k, self.verse_count)
+            top = np.argpartition(scores, -k)[-k:]
+            return sorted(((int(v), float(scores[v])) for v in top if scores[v] > 0),
+                          key=lambda p: -p[1])
+        scores = {}
+        for (start, end), weight in self._weighted_postings(tokens):
+            for v in self._postings[start:end]:
+                scores[v] = scores.get(v, 0.0) + weight
+        return heapq.nlargest(k, scores.items(), key=lambda p: p[1])
+
+    def search(self, text: str, k: int = 5, method: str = "difflib"):
+        """
+        Identify the ayahs `text` most likely comes from.
+        Returns up to k dicts, best first:
+          {'verse_id', 'surah', 'ayah', 'retrieval_score', 'similarity', 'match_percent'}
+        """
+        results = []
+        sidecar = self.corpus.normalized(self.profile)
+        for verse_id, retrieval in self.candidates(text, k * _RESCORE_FACTOR):
+            comparison = compare_texts(text, sidecar.reference(verse_id), method, self.profile)
+            surah, ayah = self.corpus.location(verse_id)
+            results.append({
+                "verse_id": verse_id,
+                "surah": surah,
+                "ayah": ayah,
+                "retrieval_score": retrieval,
+                "similarity": comparison["similarity"],
+                "match_percent": comparison["match_percent"],
+            })
+        results.sort(key=lambda r: (-r["similarity"], -r["retrieval_score"]))
+        return results[:k]
+
+    def close(self):
+        if HAVE_NUMPY:
+            del self._np_postings
+        for table in (self._hashes, self._offsets, self._postings):
+            if isinstance(table, memoryview):
+                table.release()
+        self._mm.close()
+
+
+def search_index_is_fresh(corpus, path: str, profile: str = DEFAULT_PROFILE) -> bool:
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        return False
+    header = _HEADER.unpack(raw)
+    return (header[0] == SEARCH_MAGIC and header[1] == SEARCH_VERSION
+            and header[3] == corpus.source_sha256
+            and header[4] == bytes.fromhex(normalization_key(profile)))
+
+
+def open_search_index(corpus=None, profile: str = DEFAULT_PROFILE, path: str = None) -> AyahSearchIndex:
+    """Open the search index for corpus (shared corpus by default), rebuilding it when stale."""
+    corpus = corpus or get_corpus()
+    path = path or default_search_path(corpus, profile)
+    if not search_index_is_fresh(corpus, path, profile):
+        build_search_index(corpus, profile, path)
+    return AyahSearchIndex(path, corpus, profile)
+
+
+if __name__ == "__main__":
+    index = open_search_index()
+    query = " ".join(sys.argv[1:]) or "الله لا اله الا هو الحي القيوم"
+    for hit in index.search(query):
+        print(f"{hit['surah']}:{hit['ayah']}  {hit['match_percent']:3d}%  "
+              f"(retrieval {hit['retrieval_score']:.1f})")
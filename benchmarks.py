@@ -0,0 +1,215 @@
+"""
+SurahSync micro-benchmarks
+Run: python benchmarks.py [name ...]
+- normalizers: regex normalizer vs single-pass translate profiles over the corpus
+- similarity: difflib vs python-Levenshtein vs the built-in edit_distance kernels
+- vad: silence trimming and pause splitting on a synthetic 15 s recording
+- preprocess: per-step cost of the recognizer preprocessing and the FLAC
+  upload size before/after, on a synthetic 48 kHz recording
+- startup: -X importtime breakdown of main.py's imports (fresh interpreter)
+- hedging: recognizer request tail latency against a local stub server,
+  with and without hedged requests
+"""
+
+import sys
+import time
+
+import edit_distance
+from corpus import get_corpus
+from quran_data import (NORMALIZATION_PROFILES, HAVE_LEV, normalize_arabic, _normalize_arabic_regex,
+                        _WORD_CACHES, similarity_difflib)
+
+
+def _best_of(fn, repeat=5):
+    """Best wall-clock time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _corpus_texts():
+    corpus = get_corpus()
+    return [corpus.text(v) for v in range(1, len(corpus) + 1)]
+
+
+def bench_normalizers(repeat=5):
+    """
+    Normalize all 6236 verses with the original regex pipeline and with
+    each translate-table profile. Also checks that 'strict' reproduces
+    the regex output exactly.
+    """
+    texts = _corpus_texts()
+    mismatches = sum(1 for t in texts if normalize_arabic(t, "strict") != _normalize_arabic_regex(t))
+    print(f"normalizers: {len(texts)} verses, strict vs regex mismatches: {mismatches}")
+
+    baseline = _best_of(lambda: [_normalize_arabic_regex(t) for t in texts], repeat)
+    print(f"  {'regex (3 passes)':<18} {baseline * 1000:8.2f} ms")
+    for profile in NORMALIZATION_PROFILES:
+        def cold():
+            _WORD_CACHES[profile].clear()
+            return [normalize_arabic(t, profile) for t in texts]
+
+        cold_time = _best_of(cold, repeat)
+        warm_time = _best_of(lambda: [normalize_arabic(t, profile) for t in texts], repeat)
+        print(f"  {profile:<18} {cold_time * 1000:8.2f} ms cold ({baseline / cold_time:.1f}x), "
+              f"{warm_time * 1000:8.2f} ms warm ({baseline / warm_time:.1f}x)")
+
+
+def bench_similarity(repeat=3, limit=2000):
+    """
+    Score `limit` corpus verses (strict normalization) against their
+    lenient-normalized form, i.e. realistic near-miss pairs, with each
+    similarity kernel. Reports pairs per second.
+    """
+    corpus = get_corpus()
+    pairs = []
+    for v in range(1, len(corpus) + 1, max(1, len(corpus) // limit)):
+        text = corpus.text(v)
+        pairs.append((normalize_arabic(text, "strict"), normalize_arabic(text, "lenient")))
+    chars = sum(len(a) for a, _ in pairs)
+    print(f"similarity: {len(pairs)} pairs, {chars} chars")
+
+    kernels = [
+        ("difflib ratio", similarity_difflib),
+        ("bit-parallel ratio", edit_distance.levenshtein_ratio),
+        ("bit-parallel distance", edit_distance.levenshtein_distance),
+        ("weighted, full rows",
+         lambda a, b: edit_distance._weighted_distance_python(a, b, edit_distance.ARABIC_SUBSTITUTION_COSTS)),
+        ("weighted, banded", edit_distance.weighted_distance),
+    ]
+    if HAVE_LEV:
+        import Levenshtein
+        kernels.insert(1, ("Levenshtein.ratio", Levenshtein.ratio))
+        kernels.insert(2, ("Levenshtein.distance", Levenshtein.distance))
+    if edit_distance.HAVE_NUMPY:
+        kernels.append(("weighted, numpy diag",
+                        lambda a, b: edit_distance._weighted_distance_numpy(
+                            a, b, edit_distance.ARABIC_SUBSTITUTION_COSTS)))
+    baseline = None
+    for name, fn in kernels:
+        elapsed = _best_of(lambda: [fn(a, b) for a, b in pairs], repeat)
+        baseline = baseline or elapsed
+        print(f"  {name:<22} {len(pairs) / elapsed:10.0f} pairs/s  ({baseline / elapsed:.2f}x difflib)")
+
+
+def _synthetic_recitation(rate=16000, seed=0):
+    """
+    15 s of 16-bit PCM shaped like a phrase_time_limit recording of a short
+    ayah: 1.5 s of room noise, three voiced phrases with short pauses and
+    one fricative, then trailing silence up to the limit.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+
+    def noise(seconds, level=0.002):
+        return rng.normal(0, level, int(rate * seconds))
+
+    def voiced(seconds):
+        t = np.arange(int(rate * seconds)) / rate
+        return 0.3 * np.sin(2 * np.pi * 180 * t) * (1 + 0.5 * np.sin(2 * np.pi * 3 * t)) + noise(seconds)
+
+    parts = [noise(1.5), voiced(1.2), noise(0.3), voiced(0.9), noise(0.15, 0.03), voiced(1.1), noise(0.6),
+             voiced(1.4)]
+    signal = np.concatenate(parts)
+    signal = np.concatenate([signal, noise(15 - len(signal) / rate)])
+    return (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes(), rate
+
+
+def bench_vad(repeat=5):
+    """Audio removed by trim_silence / split_at_pauses and their cost."""
+    import speech_recognition as sr
+    import vad
+    raw, rate = _synthetic_recitation()
+    audio = sr.AudioData(raw, rate, 2)
+    seconds = len(raw) / (2 * rate)
+    trimmed = vad.trim_silence(audio)
+    pieces = vad.split_at_pauses(audio)
+    kept = len(trimmed.frame_data) / (2 * rate)
+    print(f"vad: {seconds:.1f} s recording")
+    print(f"  trim_silence     {_best_of(lambda: vad.trim_silence(audio), repeat) * 1000:8.2f} ms, "
+          f"{kept:.1f} s kept ({100 * (1 - kept / seconds):.0f}% less audio to transcribe)")
+    print(f"  split_at_pauses  {_best_of(lambda: vad.split_at_pauses(audio), repeat) * 1000:8.2f} ms, "
+          f"{len(pieces)} pieces: " + ", ".join(f"{len(p.frame_data) / (2 * rate):.1f}s" for p in pieces))
+
+
+def bench_preprocess(repeat=5):
+    """Step timings (best of `repeat`) and upload size of preprocess() on a noisy 48 kHz capture."""
+    import numpy as np
+    import speech_recognition as sr
+    import preprocess
+    raw, rate = _synthetic_recitation(rate=48000)
+    # quieter than ideal, with a DC offset and extra hiss, as cheap microphones deliver
+    samples = np.frombuffer(raw, dtype="<i2") * 0.3 + 1500 + np.random.default_rng(1).normal(0, 300, len(raw) // 2)
+    audio = sr.AudioData(np.clip(samples, -32768, 32767).astype("<i2").tobytes(), rate, 2)
+    best = {}
+    for _ in range(repeat):
+        prepared = preprocess.preprocess(audio, flac=True)
+        for step, seconds in prepared.timings.items():
+            best[step] = min(best.get(step, float("inf")), seconds)
+    raw_flac = len(audio.get_flac_data())
+    print(f"preprocess: {len(raw) / (2 * rate):.1f} s at {rate} Hz, {sum(best.values()) * 1000:.1f} ms total")
+    for step, seconds in best.items():
+        print(f"  {step:<20} {seconds * 1000:8.2f} ms")
+    print(f"  FLAC upload {raw_flac / 1024:.0f} KiB raw -> {len(prepared.flac) / 1024:.0f} KiB preprocessed "
+          f"({100 * (1 - len(prepared.flac) / raw_flac):.0f}% smaller)")
+
+
+def bench_startup():
+    """Import cost of the app entry point, by direct import."""
+    from startup import print_import_breakdown
+    print_import_breakdown("main")
+
+
+def bench_hedging(requests=200, workers=4):
+    """
+    The same stub workload (50 ms answers, 5% stall for 1 s, 2% HTTP 500)
+    through GoogleBackend with plain requests and with hedging; p50/p95/p99
+    per configuration.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    import speech_recognition as sr
+    from recognizer_http import HedgedClient, RequestPolicy, StubRecognizerServer
+    from transcription import GoogleBackend
+
+    audio = sr.AudioData(b"\0\0" * 16000, 16000, 2)
+
+    def attempt(_):
+        try:
+            backend.transcribe(audio)
+            return True
+        except (sr.RequestError, sr.UnknownValueError):
+            return False
+
+    print(f"hedging: {requests} requests, {workers} at a time, stub 50 ms / 5% stall 1 s / 2% HTTP 500")
+    for label, policy in (("plain", RequestPolicy(hedge=False)), ("hedged", RequestPolicy(hedge_initial_delay=0.2))):
+        with StubRecognizerServer(latency=0.05, slow_rate=0.05, slow_latency=1.0, failure_rate=0.02, seed=1) as stub:
+            client = HedgedClient(policy)
+            backend = GoogleBackend(endpoint=stub.url, client=client)
+            with ThreadPoolExecutor(workers) as pool:
+                failed = list(pool.map(attempt, range(requests))).count(False)
+            stats = backend.latency_stats()
+            counters = client.stats()
+            client.close()
+        print(f"  {label:<7} p50 {stats['p50'] * 1000:6.0f} ms  p95 {stats['p95'] * 1000:6.0f} ms  "
+              f"p99 {stats['p99'] * 1000:6.0f} ms  hedges {counters['hedges']} (won {counters['hedge_wins']}), "
+              f"retries {counters['retries']}, failed {failed}, connections {counters['connections']}")
+
+
+BENCHMARKS = {
+    "normalizers": bench_normalizers,
+    "similarity": bench_similarity,
+    "vad": bench_vad,
+    "preprocess": bench_preprocess,
+    "startup": bench_startup,
+    "hedging": bench_hedging,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
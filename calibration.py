@@ -0,0 +1,83 @@
+"""
+Per-device microphone calibration profiles
+- device_key(microphone): stable name for the input device
+- load_profile(key) / save_profile(key, ...): calibrated energy threshold and
+  noise floor with the time they were measured, kept in data/calibration.json
+
+A saved profile lets the recorder start immediately; profiles older than
+CALIBRATION_MAX_AGE are still used, but a fresh calibration is scheduled
+in the background.
+"""
+
+import json
+import os
+import threading
+import time
+
+from corpus import DATA_DIR
+
+CALIBRATION_PATH = os.path.join(DATA_DIR, "calibration.json")
+# CHANGEABLE: seconds after which a saved profile is re-measured in the background
+CALIBRATION_MAX_AGE = 7 * 24 * 3600
+
+_lock = threading.Lock()
+
+
+def device_key(microphone) -> str:
+    """'<device name>@<rate>' for an sr.Microphone, or 'default' if PyAudio cannot tell."""
+    try:
+        audio = microphone.pyaudio_module.PyAudio()
+        try:
+            if microphone.device_index is None:
+                info = audio.get_default_input_device_info()
+            else:
+                info = audio.get_device_info_by_index(microphone.device_index)
+        finally:
+            audio.terminate()
+        return f"{info['name']}@{int(info['defaultSampleRate'])}"
+    except Exception:
+        return "default"
+
+
+def _read_all(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_profile(key: str, path: str = CALIBRATION_PATH):
+    """
+    {'energy_threshold', 'noise_floor_db', 'calibrated_at', 'source'} saved
+    for device `key`, or None.
+    """
+    with _lock:
+        profile = _read_all(path).get(key)
+    if not profile or "energy_threshold" not in profile:
+        return None
+    return profile
+
+
+def is_stale(profile, max_age: float = CALIBRATION_MAX_AGE) -> bool:
+    return profile is None or time.time() - profile.get("calibrated_at", 0) > max_age
+
+
+def save_profile(key: str, energy_threshold: float, noise_floor_db: float = None, source: str = "ambient",
+                 path: str = CALIBRATION_PATH) -> dict:
+    """Store the calibration for device `key` (atomic rewrite of the profile file)."""
+    profile = {
+        "energy_threshold": float(energy_threshold),
+        "noise_floor_db": None if noise_floor_db is None else float(noise_floor_db),
+        "calibrated_at": time.time(),
+        "source": source,
+    }
+    with _lock:
+        profiles = _read_all(path)
+        profiles[key] = profile
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(profiles, f, indent=2)
+        os.replace(tmp_path, path)
+    return profile
@@ -0,0 +1,198 @@
+"""
+Parallel chunked transcription for long recordings
+- plan_chunks(audio): cut points at pauses (VAD), each chunk at most
+  CHUNK_SECONDS; speech with no usable pause is hard-cut with OVERLAP_SECONDS
+  of overlap so no word is lost at the cut
+- transcribe_chunks(backend, chunks): all chunks at once on a shared thread
+  pool, with a per-attempt timeout and retries (a timed-out attempt is
+  raced against a fresh one rather than waited out); backends that retry
+  on their own (handles_retries) get a single attempt per chunk
+- stitch(transcripts, hard_cuts): joins chunk transcripts, dropping the
+  words repeated in the overlap of hard cuts
+
+Wall-clock time is that of the slowest chunk rather than the sum.
+"""
+
+import math
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import speech_recognition as sr
+
+import vad
+from edit_distance import levenshtein_ratio
+from quran_data import normalize_arabic
+
+# CHANGEABLE: longest chunk sent in one request, and overlap at hard cuts
+CHUNK_SECONDS = 12.0
+OVERLAP_SECONDS = 1.0
+# Concurrent requests, per-attempt timeout and extra attempts per chunk
+MAX_WORKERS = 4
+CHUNK_TIMEOUT = 15.0
+CHUNK_RETRIES = 2
+# Fastest recitation pace expected; bounds how many words an overlap of
+# OVERLAP_SECONDS can repeat when stitching hard-cut chunks
+MAX_WORDS_PER_SECOND = 3.0
+# Leading words of a chunk (e.g. a half-heard word at the cut) that may
+# precede the repeated overlap; only skipped for overlaps of 2+ words
+_OVERLAP_SLACK = 2
+_FUZZY_WORD_RATIO = 0.75
+
+# start/end are sample offsets into the recording; hard_cut tells whether
+# the chunk was cut mid-speech from the previous one
+Chunk = namedtuple("Chunk", "audio start end hard_cut")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    # Shared and never shut down: a hung attempt must not block the caller
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS * 2, thread_name_prefix="transcribe")
+        return _executor
+
+
+def plan_chunks(audio, chunk_seconds: float = CHUNK_SECONDS, overlap_seconds: float = OVERLAP_SECONDS,
+                noise_floor_db: float = None):
+    """Split `audio` (AudioData) into Chunks of at most chunk_seconds, preferring pauses."""
+    rate, width = audio.sample_rate, audio.sample_width
+    samples = vad.pcm_to_float(audio.frame_data, width)
+    max_len = int(chunk_seconds * rate)
+    overlap = int(overlap_seconds * rate)
+    segments = vad.speech_segments(samples, rate, noise_floor_db=noise_floor_db) or [(0, len(samples))]
+
+    # (start, end, hard_cut) spans: whole pause-delimited segments grouped
+    # greedily, over-long segments cut into overlapping windows
+    spans = []
+    for seg_start, seg_end in segments:
+        if spans and seg_end - spans[-1][0] <= max_len:
+            spans[-1] = (spans[-1][0], seg_end, spans[-1][2])
+            continue
+        if seg_end - seg_start <= max_len:
+            spans.append((seg_start, seg_end, False))
+            continue
+        start, hard = seg_start, False
+        while True:
+            end = min(seg_end, start + max_len)
+            spans.append((start, end, hard))
+            if end >= seg_end:
+                break
+            start, hard = end - overlap, True
+
+    def piece(start, end):
+        return sr.AudioData(audio.frame_data[start * width:end * width], rate, width)
+
+    return [Chunk(piece(s, e), s, e, h) for s, e, h in spans]
+
+
+def transcribe_chunks(backend, chunks, timeout: float = None, retries: int = None):
+    """
+    Transcribe every chunk concurrently; returns one transcript per chunk
+    ("" where nothing was understood or every attempt failed). timeout and
+    retries default to CHUNK_TIMEOUT and CHUNK_RETRIES, or to no timeout
+    and no retries when the backend has its own deadlines, retries and
+    hedges (GoogleBackend), so a bad chunk is not retried at both layers.
+    """
+    if backend.handles_retries:
+        timeout = float("inf") if timeout is None else timeout
+        retries = 0 if retries is None else retries
+    else:
+        timeout = CHUNK_TIMEOUT if timeout is None else timeout
+        retries = CHUNK_RETRIES if retries is None else retries
+    pool = _pool()
+    results = [None] * len(chunks)
+    attempts = [0] * len(chunks)
+    running = {}  # future -> (chunk index, deadline); inf once timed out
+
+    def submit(i):
+        attempts[i] += 1
+        running[pool.submit(backend.transcribe, chunks[i].audio)] = (i, time.monotonic() + timeout)
+
+    def retry_or_give_up(i):
+        if attempts[i] <= retries:
+            submit(i)
+        elif all(deadline == float("inf") for j, deadline in running.values() if j == i):
+            results[i] = ""  # out of attempts; whatever is still running has timed out
+
+    for i in range(len(chunks)):
+        submit(i)
+
+    while any(r is None for r in results):
+        next_deadline = min(deadline for _, deadline in running.values())
+        wait_for = None if next_deadline == float("inf") else max(0.0, next_deadline - time.monotonic())
+        done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            i, _ = running.pop(future)
+            if results[i] is not None:
+                continue
+            try:
+                results[i] = future.result().strip()
+            except sr.UnknownValueError:
+                results[i] = ""
+            except Exception as e:
+                print(f"⚠️ Chunk {i + 1}/{len(chunks)} failed (attempt {attempts[i]}): {e}")
+                retry_or_give_up(i)
+        now = time.monotonic()
+        for future, (i, deadline) in list(running.items()):
+            if results[i] is not None:
+                del running[future]  # a slower duplicate; let it finish unobserved
+            elif deadline <= now:
+                # leave the slow attempt running and race a fresh one
+                print(f"⏱️ Chunk {i + 1}/{len(chunks)} timed out (attempt {attempts[i]})")
+                running[future] = (i, float("inf"))
+                retry_or_give_up(i)
+    return results
+
+
+def _same_word(a: str, b: str) -> bool:
+    return a == b or levenshtein_ratio(a, b) >= _FUZZY_WORD_RATIO
+
+
+def _max_overlap_words(overlap_seconds: float) -> int:
+    # +1 for a word straddling the cut, heard (partly) in both chunks
+    return math.ceil(overlap_seconds * MAX_WORDS_PER_SECOND) + 1
+
+
+def _overlap_length(previous, following, overlap_seconds: float = OVERLAP_SECONDS):
+    """
+    Words at the start of `following` that repeat the end of `previous`.
+    A single-word match must be at the very start: common words (الله,
+    من, ...) would otherwise match real text after the skipped words.
+    """
+    limit = _max_overlap_words(overlap_seconds)
+    prev_norm = [normalize_arabic(w) for w in previous[-limit:]]
+    next_norm = [normalize_arabic(w) for w in following[:limit]]
+    for k in range(min(len(prev_norm), len(next_norm)), 0, -1):
+        tail = prev_norm[-k:]
+        max_skip = min(_OVERLAP_SLACK, limit - k) if k >= 2 else 0
+        for skip in range(max_skip + 1):
+            head = next_norm[skip:skip + k]
+            if len(head) == k and all(_same_word(a, b) for a, b in zip(tail, head)):
+                return skip + k
+    return 0
+
+
+def stitch(transcripts, hard_cuts, overlap_seconds: float = OVERLAP_SECONDS):
+    """Join chunk transcripts; after a hard cut, words repeated from the overlap are dropped."""
+    words = []
+    for text, hard in zip(transcripts, hard_cuts):
+        chunk_words = text.split()
+        if hard and words and chunk_words:
+            chunk_words = chunk_words[_overlap_length(words, chunk_words, overlap_seconds):]
+        words.extend(chunk_words)
+    return " ".join(words)
+
+
+def transcribe_parallel(backend, audio, noise_floor_db: float = None, **kwargs) -> str:
+    """Plan, transcribe concurrently and stitch. kwargs go to transcribe_chunks."""
+    chunks = plan_chunks(audio, noise_floor_db=noise_floor_db)
+    start = time.perf_counter()
+    transcripts = transcribe_chunks(backend, chunks, **kwargs)
+    longest = max((c.end - c.start) / audio.sample_rate for c in chunks)
+    print(f"✂️ {len(chunks)} chunks (longest {longest:.1f}s) transcribed in {time.perf_counter() - start:.2f}s")
+    return stitch(transcripts, [c.hard_cut for c in chunks])
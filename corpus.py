@@ -0,0 +1,424 @@
+"""
+Compiled binary Quran corpus
+- build_corpus(json_path, corpus_path) compiles data/quran.json once
+- open_corpus() memory-maps the compiled file, rebuilding it if the JSON changed
+- QuranCorpus is a VerseIndex, so every quran_data lookup helper accepts it
+- get_corpus() hands every consumer the same process-wide instance
+- NormalizedSidecar caches normalize_reference() output for every verse in a
+  mapped file per normalization profile next to the corpus, keyed on the rules
+
+File layout (little-endian):
+  header | surah table | verse offsets (uint32, verse_count + 1) | UTF-8 blob
+The blob holds every verse text back to back followed by the surah strings.
+Verses are decoded lazily, one slice at a time, straight from the mapping, so
+several processes opening the same file share its pages.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from collections import namedtuple
+
+from quran_data import (VerseIndex, NormalizedText, DEFAULT_PROFILE, get_verse_index,
+                        normalization_key, normalize_reference)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_JSON = os.path.join(DATA_DIR, "quran.json")
+CORPUS_SUFFIX = ".corpus"
+NORMALIZED_SUFFIX = ".norm"
+
+CORPUS_MAGIC = b"SSQC"
+CORPUS_VERSION = 1
+
+# magic, version, reserved, source size, source mtime_ns, source sha256,
+# surah count, verse count, surah table offset, verse offsets offset, blob offset
+_HEADER = struct.Struct("<4sHHQq32sIIQQQ")
+_HEADER_MTIME_AT = struct.calcsize("<4sHHQ")
+# first verse (0-based), verse count, then (offset, length) of name,
+# transliteration and type inside the blob
+_SURAH_ROW = struct.Struct("<IIIIIIII")
+
+NORMALIZED_MAGIC = b"SSQN"
+NORMALIZED_VERSION = 1
+
+# magic, version, reserved, corpus source sha256, normalization key,
+# verse count, token count, then offsets of: verse byte offsets (uint32,
+# verse_count + 1), verse token ranges (uint32, verse_count + 1), token char
+# offsets within their verse (uint32, token_count) and the UTF-8 blob
+_NORM_HEADER = struct.Struct("<4sHH32s32sIIQQQQ")
+
+_NATIVE_LE = sys.byteorder == "little"
+
+SurahInfo = namedtuple("SurahInfo", "number name transliteration type total_verses")
+
+# corpus path -> QuranCorpus shared by get_corpus()
+_SHARED = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def default_corpus_path(json_path: str = DEFAULT_JSON) -> str:
+    """Compiled corpus lives next to its source JSON."""
+    return os.path.splitext(json_path)[0] + CORPUS_SUFFIX
+
+
+def _file_sha256(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.digest()
+
+
+def build_corpus(json_path: str = DEFAULT_JSON, corpus_path: str = None) -> str:
+    """
+    Compile the JSON dataset at json_path into the binary corpus format.
+    The file is written to a temp name and renamed, so readers never see a
+    half-written corpus. Returns the corpus path.
+    """
+    corpus_path = corpus_path or default_corpus_path(json_path)
+    st = os.stat(json_path)
+    digest = _file_sha256(json_path)
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    index = get_verse_index(data)
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for pos in range(len(index)):
+        blob += index.text(pos + 1).encode("utf-8")
+        offsets.append(len(blob))
+
+    def put(value):
+        raw = str(value or "").encode("utf-8")
+        start = len(blob)
+        blob.extend(raw)
+        return start, len(raw)
+
+    rows = []
+    first = 0
+    for s_num in range(1, index.surah_count + 1):
+        s = index.surah(s_num)
+        name = put(s.get("name") or s.get("englishName") or s.get("chapterName"))
+        translit = put(s.get("transliteration") or s.get("englishName"))
+        kind = put(s.get("type") or s.get("revelationType"))
+        rows.append(_SURAH_ROW.pack(first, index.ayah_count(s_num), *name, *translit, *kind))
+        first += index.ayah_count(s_num)
+
+    if not _NATIVE_LE:
+        offsets.byteswap()
+    surah_table_at = _HEADER.size
+    offsets_at = surah_table_at + _SURAH_ROW.size * len(rows)
+    blob_at = offsets_at + offsets.itemsize * len(offsets)
+    header = _HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, 0, st.st_size, st.st_mtime_ns, digest,
+                          len(rows), len(index), surah_table_at, offsets_at, blob_at)
+
+    tmp_path = f"{corpus_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.writelines(rows)
+        f.write(offsets.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, corpus_path)
+    print(f"Compiled corpus saved to {corpus_path} ({len(index)} verses)")
+    return corpus_path
+
+
+def _read_header(corpus_path: str):
+    with open(corpus_path, "rb") as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        return None
+    header = _HEADER.unpack(raw)
+    if header[0] != CORPUS_MAGIC or header[1] != CORPUS_VERSION:
+        return None
+    return header
+
+
+def corpus_is_fresh(json_path: str, corpus_path: str) -> bool:
+    """
+    True if corpus_path was compiled from the current json_path.
+    Size and mtime are checked first; the checksum is only recomputed
+    when they differ (e.g. after a checkout touched the file), and if it
+    still matches the new mtime is stored so the next start skips it.
+    """
+    if not os.path.exists(corpus_path):
+        return False
+    header = _read_header(corpus_path)
+    if header is None:
+        return False
+    if not os.path.exists(json_path):
+        return True
+    st = os.stat(json_path)
+    if header[3] == st.st_size and header[4] == st.st_mtime_ns:
+        return True
+    if header[3] != st.st_size or header[5] != _file_sha256(json_path):
+        return False
+    _store_source_mtime(corpus_path, st.st_mtime_ns)
+    return True
+
+
+def _store_source_mtime(corpus_path: str, mtime_ns: int):
+    # Only the mtime field changes, so readers mapping the file are unaffected
+    try:
+        with open(corpus_path, "r+b") as f:
+            f.seek(_HEADER_MTIME_AT)
+            f.write(struct.pack("<q", mtime_ns))
+    except OSError as e:
+        print(f"⚠️ Could not update {corpus_path}: {e}")
+
+
+def _mapped_uint32(mm, at: int, count: int):
+    raw = memoryview(mm)[at:at + 4 * count]
+    if _NATIVE_LE:
+        table = raw.cast("I")
+    else:
+        table = array("I", raw.tobytes())
+        table.byteswap()
+    raw.release()
+    return table
+
+
+class QuranCorpus(VerseIndex):
+    """
+    Read-only, memory-mapped corpus. Verse texts are decoded on access;
+    nothing but the small surah table is materialized up front.
+    """
+
+    def __init__(self, corpus_path: str):
+        self.path = corpus_path
+        with open(corpus_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mm, 0)
+        if header[0] != CORPUS_MAGIC or header[1] != CORPUS_VERSION:
+            self._mm.close()
+            raise ValueError(f"{corpus_path} is not a version {CORPUS_VERSION} corpus")
+        (_, _, _, _, _, self.source_sha256, surah_count, verse_count,
+         surah_table_at, offsets_at, blob_at) = header
+        self._blob_at = blob_at
+
+        self._offsets = _mapped_uint32(self._mm, offsets_at, verse_count + 1)
+
+        rows = [_SURAH_ROW.unpack_from(self._mm, surah_table_at + i * _SURAH_ROW.size)
+                for i in range(surah_count)]
+        self._surah_info = tuple(
+            SurahInfo(i + 1, self._blob_str(row[2], row[3]), self._blob_str(row[4], row[5]),
+                      self._blob_str(row[6], row[7]), row[1])
+            for i, row in enumerate(rows)
+        )
+        self._init_tables([row[0] for row in rows] + [verse_count])
+        self._normalized = {}
+        self._normalized_lock = threading.Lock()
+
+    def _blob_str(self, offset: int, length: int) -> str:
+        start = self._blob_at + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _text_at(self, pos: int) -> str:
+        start = self._blob_at + self._offsets[pos]
+        end = self._blob_at + self._offsets[pos + 1]
+        return self._mm[start:end].decode("utf-8")
+
+    def surah_info(self, surah_number: int) -> SurahInfo:
+        """Immutable metadata (name, transliteration, type, total_verses) for one surah."""
+        s = int(surah_number)
+        if not 1 <= s <= self.surah_count:
+            raise IndexError(f"Surah {surah_number} not found")
+        return self._surah_info[s - 1]
+
+    def surahs(self):
+        """Metadata for all surahs, in order."""
+        return self._surah_info
+
+    def surah(self, surah_number: int):
+        """Surah metadata as a new dict, shaped like the source JSON (without verses)."""
+        info = self.surah_info(surah_number)
+        return {
+            "id": info.number,
+            "name": info.name,
+            "transliteration": info.transliteration,
+            "type": info.type,
+            "total_verses": info.total_verses,
+        }
+
+    def normalized(self, profile: str = DEFAULT_PROFILE) -> "NormalizedSidecar":
+        """Normalized-text sidecar for `profile`, opened (or built) on first use."""
+        sidecar = self._normalized.get(profile)
+        if sidecar is None:
+            with self._normalized_lock:
+                sidecar = self._normalized.get(profile)
+                if sidecar is None:
+                    sidecar = open_normalized(self, profile)
+                    self._normalized[profile] = sidecar
+        return sidecar
+
+    def normalized_ayah(self, surah_number: int, ayah_number: int,
+                        profile: str = DEFAULT_PROFILE) -> NormalizedText:
+        """Precomputed NormalizedText for (surah, ayah)."""
+        return self.normalized(profile).reference(self.verse_id(surah_number, ayah_number))
+
+    def close(self):
+        for sidecar in self._normalized.values():
+            sidecar.close()
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_corpus(json_path: str = DEFAULT_JSON, corpus_path: str = None) -> QuranCorpus:
+    """
+    Open the compiled corpus for json_path, (re)building it first if it is
+    missing or was compiled from a different version of the JSON.
+    """
+    corpus_path = corpus_path or default_corpus_path(json_path)
+    if not corpus_is_fresh(json_path, corpus_path):
+        build_corpus(json_path, corpus_path)
+    return QuranCorpus(corpus_path)
+
+
+def default_normalized_path(corpus: QuranCorpus, profile: str = DEFAULT_PROFILE) -> str:
+    return f"{os.path.splitext(corpus.path)[0]}.{profile}{NORMALIZED_SUFFIX}"
+
+
+def build_normalized(corpus: QuranCorpus, profile: str = DEFAULT_PROFILE, path: str = None) -> str:
+    """
+    Normalize every verse of `corpus` once with `profile` and write the
+    sidecar file. Returns the sidecar path.
+    """
+    path = path or default_normalized_path(corpus, profile)
+    blob = bytearray()
+    verse_offsets = array("I", [0])
+    token_ranges = array("I", [0])
+    token_offsets = array("I")
+    for verse_id in range(1, len(corpus) + 1):
+        ref = normalize_reference(corpus.text(verse_id), profile)
+        blob += ref.text.encode("utf-8")
+        verse_offsets.append(len(blob))
+        token_offsets.extend(ref.offsets)
+        token_ranges.append(len(token_offsets))
+
+    tables = (verse_offsets, token_ranges, token_offsets)
+    if not _NATIVE_LE:
+        for table in tables:
+            table.byteswap()
+    at = _NORM_HEADER.size
+    positions = []
+    for table in tables:
+        positions.append(at)
+        at += table.itemsize * len(table)
+    header = _NORM_HEADER.pack(NORMALIZED_MAGIC, NORMALIZED_VERSION, 0, corpus.source_sha256,
+                               bytes.fromhex(normalization_key(profile)), len(corpus), len(token_offsets),
+                               *positions, at)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for table in tables:
+            f.write(table.tobytes())
+        f.write(blob)
+    os.replace(tmp_path, path)
+    print(f"Normalized sidecar saved to {path} ({len(token_offsets)} tokens)")
+    return path
+
+
+class NormalizedSidecar:
+    """
+    Read-only, memory-mapped normalized text for every verse.
+    reference(verse_id) returns the same NormalizedText that
+    normalize_reference() would, without running the normalizer.
+    """
+
+    def __init__(self, path: str, profile: str = DEFAULT_PROFILE):
+        self.path = path
+        self.profile = profile
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _NORM_HEADER.unpack_from(self._mm, 0)
+        if header[0] != NORMALIZED_MAGIC or header[1] != NORMALIZED_VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a version {NORMALIZED_VERSION} normalized sidecar")
+        (_, _, _, self.source_sha256, self.rules_key, verse_count, token_count,
+         verse_offsets_at, token_ranges_at, token_offsets_at, blob_at) = header
+        self._blob_at = blob_at
+        self._verse_offsets = _mapped_uint32(self._mm, verse_offsets_at, verse_count + 1)
+        self._token_ranges = _mapped_uint32(self._mm, token_ranges_at, verse_count + 1)
+        self._token_offsets = _mapped_uint32(self._mm, token_offsets_at, token_count)
+
+    def __len__(self):
+        return len(self._verse_offsets) - 1
+
+    def reference(self, verse_id: int) -> NormalizedText:
+        v = int(verse_id)
+        if not 1 <= v <= len(self):
+            raise IndexError(f"Verse id {verse_id} out of range")
+        start = self._blob_at + self._verse_offsets[v - 1]
+        end = self._blob_at + self._verse_offsets[v]
+        text = self._mm[start:end].decode("utf-8")
+        offsets = tuple(self._token_offsets[self._token_ranges[v - 1]:self._token_ranges[v]])
+        return NormalizedText(text, tuple(text.split(" ")) if text else (), offsets, self.profile)
+
+    def close(self):
+        for table in (self._verse_offsets, self._token_ranges, self._token_offsets):
+            if isinstance(table, memoryview):
+                table.release()
+        self._mm.close()
+
+
+def normalized_is_fresh(corpus: QuranCorpus, path: str, profile: str = DEFAULT_PROFILE) -> bool:
+    """True if the sidecar at path matches both the corpus and the current normalization rules."""
+    if not os.path.exists(path):
+        return False
+    with open(path, "rb") as f:
+        raw = f.read(_NORM_HEADER.size)
+    if len(raw) < _NORM_HEADER.size:
+        return False
+    header = _NORM_HEADER.unpack(raw)
+    return (header[0] == NORMALIZED_MAGIC and header[1] == NORMALIZED_VERSION
+            and header[3] == corpus.source_sha256
+            and header[4] == bytes.fromhex(normalization_key(profile)))
+
+
+def open_normalized(corpus: QuranCorpus, profile: str = DEFAULT_PROFILE,
+                    path: str = None) -> NormalizedSidecar:
+    """Open the normalized sidecar of `profile` for corpus, rebuilding it when stale."""
+    path = path or default_normalized_path(corpus, profile)
+    if not normalized_is_fresh(corpus, path, profile):
+        build_normalized(corpus, profile, path)
+    return NormalizedSidecar(path, profile)
+
+
+def get_corpus(json_path: str = DEFAULT_JSON, corpus_path: str = None) -> QuranCorpus:
+    """
+    Process-wide shared corpus. The first caller opens (and if needed builds)
+    it; every later caller, from any thread, gets the same read-only instance.
+    """
+    key = os.path.abspath(corpus_path or default_corpus_path(json_path))
+    corpus = _SHARED.get(key)
+    if corpus is not None:
+        return corpus
+    with _SHARED_LOCK:
+        corpus = _SHARED.get(key)
+        if corpus is None:
+            corpus = open_corpus(json_path, key)
+            _SHARED[key] = corpus
+    return corpus
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        build_corpus(*sys.argv[2:4])
+    else:
+        corpus = get_corpus()
+        print(f"Corpus: {corpus.path} - {corpus.surah_count} surahs, {len(corpus)} verses")
+        print("2:255 ->", corpus.ayah_text(2, 255))
+        print("normalized ->", corpus.normalized_ayah(2, 255).text)
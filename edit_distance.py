@@ -0,0 +1,228 @@
+"""
+Built-in edit distance kernels (no python-Levenshtein required)
+- levenshtein_distance(a, b): bit-parallel Myers/Hyyrö, unit costs
+- indel_distance(a, b) / levenshtein_ratio(a, b): bit-parallel LCS, same
+  ratio as Levenshtein.ratio
+- weighted_distance(a, b): substitution costs from ARABIC_SUBSTITUTION_COSTS,
+  banded DP; NumPy anti-diagonal kernel for wide bands (pure Python rows
+  if NumPy is missing)
+- weighted_similarity(a, b): 1 - weighted_distance / max(len(a), len(b))
+
+Bit-parallel kernels keep one Python int per text column as a bit vector,
+so every step handles the whole other string at once.
+"""
+
+import importlib.util
+
+# Optional: vectorized weighted DP if NumPy is installed. NumPy is only
+# imported the first time a band is wide enough to use it.
+HAVE_NUMPY = importlib.util.find_spec("numpy") is not None
+np = None
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+# Commonly confused Arabic letters: close-sounding pairs a speech recognizer
+# (or a student) swaps get a reduced substitution cost. Orthographic variants
+# of the same sound are cheaper still. Every other substitution costs 1.
+_CLOSE_SOUNDS = 0.5
+_ORTHOGRAPHIC = 0.25
+_CONFUSION_GROUPS = (
+    ("ثسص", _CLOSE_SOUNDS),   # tha / sin / sad
+    ("ذزظ", _CLOSE_SOUNDS),   # dhal / zay / za
+    ("ضدظ", _CLOSE_SOUNDS),   # dad / dal / za
+    ("تط", _CLOSE_SOUNDS),    # ta / ta (emphatic)
+    ("حهخ", _CLOSE_SOUNDS),   # ha (pharyngeal) / ha / kha
+    ("عءأ", _CLOSE_SOUNDS),   # ayn / hamza
+    ("قكغ", _CLOSE_SOUNDS),   # qaf / kaf / ghain
+    ("اأإآٱ", _ORTHOGRAPHIC),  # alef forms
+    ("هة", _ORTHOGRAPHIC),    # ha / ta marbuta
+    ("يىئ", _ORTHOGRAPHIC),   # ya / alef maqsura / ya with hamza
+    ("وؤ", _ORTHOGRAPHIC),    # waw / waw with hamza
+)
+
+
+def _build_cost_table(groups):
+    costs = {}
+    for letters, cost in groups:
+        for x in letters:
+            for y in letters:
+                if x != y:
+                    costs[(x, y)] = min(cost, costs.get((x, y), 1.0))
+    return costs
+
+
+# (char, char) -> substitution cost, symmetric; missing pairs cost 1.0
+ARABIC_SUBSTITUTION_COSTS = _build_cost_table(_CONFUSION_GROUPS)
+
+# Band width (in diagonals) from which the NumPy kernel beats pure Python rows
+_NUMPY_MIN_BAND = 48
+
+
+def _match_masks(pattern):
+    """char -> bit mask of the positions where it occurs in pattern."""
+    masks = {}
+    bit = 1
+    for ch in pattern:
+        masks[ch] = masks.get(ch, 0) | bit
+        bit <<= 1
+    return masks
+
+
+def levenshtein_distance(a: str, b: str) -> int:
+    """Unit-cost Levenshtein distance, Myers' bit-vector algorithm (Hyyrö's variant)."""
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if m == 0:
+        return len(a)
+    peq = _match_masks(b)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    for ch in a:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+def lcs_length(a: str, b: str) -> int:
+    """Length of the longest common subsequence, bit-parallel (Allison-Dix / Hyyrö)."""
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if m == 0:
+        return 0
+    peq = _match_masks(b)
+    full = (1 << m) - 1
+    s = full
+    for ch in a:
+        u = s & peq.get(ch, 0)
+        s = ((s + u) | (s - u)) & full
+    return m - bin(s).count("1")
+
+
+def indel_distance(a: str, b: str) -> int:
+    """Edit distance with insertions and deletions only."""
+    return len(a) + len(b) - 2 * lcs_length(a, b)
+
+
+def levenshtein_ratio(a: str, b: str) -> float:
+    """Similarity in [0,1], same definition as Levenshtein.ratio."""
+    total = len(a) + len(b)
+    if total == 0:
+        return 1.0
+    return 1.0 - indel_distance(a, b) / total
+
+
+def _band(n, m, bound):
+    """
+    Diagonal offsets t = i - j an optimal path can use when its cost is at
+    most `bound`: reaching diagonal t and then the end (diagonal n - m)
+    takes at least |t| + |t - (n - m)| unit-cost insertions/deletions.
+    """
+    delta = n - m
+    return -((bound - delta) // 2), (delta + bound) // 2
+
+
+def _weighted_distance_python(a, b, costs, bound=None):
+    n, m = len(a), len(b)
+    t_lo, t_hi = _band(n, m, n + m if bound is None else bound)
+    inf = float("inf")
+    prev = [float(j) if -j >= t_lo else inf for j in range(m + 1)]
+    for i in range(1, n + 1):
+        ca = a[i - 1]
+        cur = [inf] * (m + 1)
+        if i <= t_hi:
+            cur[0] = float(i)
+        for j in range(max(1, i - t_hi), min(m, i - t_lo) + 1):
+            cb = b[j - 1]
+            sub = prev[j - 1] if ca == cb else prev[j - 1] + costs.get((ca, cb), 1.0)
+            gap = (prev[j] if prev[j] < cur[j - 1] else cur[j - 1]) + 1.0
+            cur[j] = sub if sub < gap else gap
+        prev = cur
+    return prev[m]
+
+
+def _weighted_distance_numpy(a, b, costs, bound=None):
+    np = _numpy()
+    n, m = len(a), len(b)
+    t_lo, t_hi = _band(n, m, n + m if bound is None else bound)
+    alphabet = {ch: k for k, ch in enumerate(set(a) | set(b))}
+    table = np.ones((len(alphabet), len(alphabet)))
+    np.fill_diagonal(table, 0.0)
+    for ch_a, ia in alphabet.items():
+        for ch_b, ib in alphabet.items():
+            if ch_a != ch_b and (ch_a, ch_b) in costs:
+                table[ia, ib] = costs[(ch_a, ch_b)]
+    a_idx = np.fromiter((alphabet[ch] for ch in a), dtype=np.intp, count=n)
+    b_idx = np.fromiter((alphabet[ch] for ch in b), dtype=np.intp, count=m)
+    sub_cost = table[a_idx[:, None], b_idx[None, :]]
+
+    # Cells on anti-diagonal d = i + j only depend on diagonals d-1 and d-2,
+    # so each diagonal is one vectorized step. Diagonals are indexed by i,
+    # and only the band of offsets t = 2i - d in [t_lo, t_hi] is computed.
+    inf = np.inf
+    prev2 = np.full(n + 1, inf)
+    prev1 = np.full(n + 1, inf)
+    prev1[0] = 0.0
+    for d in range(1, n + m + 1):
+        cur = np.full(n + 1, inf)
+        if d <= m:
+            cur[0] = d
+        if d <= n:
+            cur[d] = d
+        lo = max(1, d - m, -((t_lo + d) // -2))
+        hi = min(n, d - 1, (t_hi + d) // 2)
+        if lo <= hi:
+            i = np.arange(lo, hi + 1)
+            sub = prev2[lo - 1:hi] + sub_cost[i - 1, d - i - 1]
+            gap = np.minimum(prev1[lo - 1:hi], prev1[lo:hi + 1]) + 1.0
+            cur[lo:hi + 1] = np.minimum(sub, gap)
+        prev2, prev1 = prev1, cur
+    return float(prev1[n])
+
+
+def weighted_distance(a: str, b: str, costs=None) -> float:
+    """
+    Levenshtein distance with per-pair substitution costs (insertions and
+    deletions cost 1). costs defaults to ARABIC_SUBSTITUTION_COSTS.
+
+    The unit-cost distance k (bit-parallel, cheap) bounds the result, so the
+    DP only fills the band of diagonals a path of cost <= k can touch. Wide
+    bands use the NumPy anti-diagonal kernel when available.
+    """
+    if costs is None:
+        costs = ARABIC_SUBSTITUTION_COSTS
+    if not a or not b:
+        return float(len(a) + len(b))
+    bound = levenshtein_distance(a, b)
+    if bound == 0:
+        return 0.0
+    if HAVE_NUMPY and bound >= _NUMPY_MIN_BAND and min(len(a), len(b)) >= _NUMPY_MIN_BAND:
+        return _weighted_distance_numpy(a, b, costs, bound)
+    return _weighted_distance_python(a, b, costs, bound)
+
+
+def weighted_similarity(a: str, b: str, costs=None) -> float:
+    """Similarity in [0,1] from weighted_distance."""
+    longest = max(len(a), len(b))
+    if longest == 0:
+        return 1.0
+    return 1.0 - weighted_distance(a, b, costs) / longest
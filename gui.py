@@ -6,7 +6,12 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
 import threading
 import time
-from quran_data import load_dataset
+from startup import STARTUP
+
+# Longest single recording used for continuous recitation
+CONTINUOUS_MAX_SECONDS = 120
+# Pause that ends a continuous recording (pauses between ayahs are shorter)
+CONTINUOUS_END_SILENCE = 3.0
 
 
 class HifzCompanionGUI:
@@ -16,15 +21,19 @@ class HifzCompanionGUI:
         self.root.title("Hifz Companion - Memorization Test")
         self.root.geometry("900x750")
 
-        # Load Quran data for surah selection
-        self.quran_data = load_dataset()
+        # Shared corpus for surah selection (same instance the tester uses);
+        # loaded in the background so the window shows immediately
+        self.quran_data = None
 
         # GUI state
         self.is_test_active = False
         self.is_recording = False
         self.auto_advance = True  # Auto-advance to next ayah
+        self.pipeline = None  # running RecitationPipeline, if any
+        self.on_ready = None  # called once dataset and recorder are initialized
 
         self.setup_gui()
+        self.initialize_in_background()
 
     def setup_gui(self):
         """Setup the complete hifz testing interface"""
@@ -46,15 +55,14 @@ class HifzCompanionGUI:
         # Surah Selection
         ttk.Label(setup_frame, text="Surah:").grid(row=0, column=0, padx=5, sticky='w')
         self.surah_var = tk.StringVar()
-        self.surah_combo = ttk.Combobox(setup_frame, textvariable=self.surah_var, width=20)
-        self.surah_combo['values'] = [f"{i}. Surah" for i in range(1, 115)]
-        self.surah_combo.set("1. Surah")
+        self.surah_combo = ttk.Combobox(setup_frame, textvariable=self.surah_var, width=28, state='disabled')
+        self.surah_combo.bind("<<ComboboxSelected>>", self.on_surah_selected)
         self.surah_combo.grid(row=0, column=1, padx=5)
 
         # Start Ayah
         ttk.Label(setup_frame, text="Start Ayah:").grid(row=0, column=2, padx=5, sticky='w')
         self.start_ayah_var = tk.StringVar(value="1")
-        self.start_ayah_spin = ttk.Spinbox(setup_frame, from_=1, to=286,
+        self.start_ayah_spin = ttk.Spinbox(setup_frame, from_=1, to=1,
                                            textvariable=self.start_ayah_var, width=5)
         self.start_ayah_spin.grid(row=0, column=3, padx=5)
 
@@ -68,7 +76,8 @@ class HifzCompanionGUI:
         # Test Controls
         self.start_test_btn = ttk.Button(setup_frame,
                                          text="🚀 Start Hifz Test",
-                                         command=self.start_hifz_test)
+                                         command=self.start_hifz_test,
+                                         state='disabled')
         self.start_test_btn.grid(row=0, column=6, padx=10)
 
         self.end_test_btn = ttk.Button(setup_frame,
@@ -77,6 +86,13 @@ class HifzCompanionGUI:
                                        state='disabled')
         self.end_test_btn.grid(row=0, column=7, padx=5)
 
+        # Spaced repetition: the ayahs that are due, from any surah
+        self.review_btn = ttk.Button(setup_frame,
+                                     text="🔁 Review Due",
+                                     command=self.start_review_session,
+                                     state='disabled')
+        self.review_btn.grid(row=0, column=8, padx=5)
+
         # Current Ayah Display (HIDDEN - only shows position)
         ayah_frame = ttk.LabelFrame(main_frame, text="Current Ayah", padding="15")
         ayah_frame.pack(fill=tk.X, pady=10)
@@ -111,6 +127,20 @@ class HifzCompanionGUI:
                                         fg='#666666')
         self.auto_info_label.pack()
 
+        # Continuous mode: one recording covers every remaining ayah
+        self.continuous_var = tk.BooleanVar(value=False)
+        self.continuous_check = ttk.Checkbutton(recitation_frame,
+                                                text="Continuous recitation (recite all remaining ayahs at once)",
+                                                variable=self.continuous_var)
+        self.continuous_check.pack(pady=5)
+
+        # Streaming mode: transcribe while recording, advance when the ayah ends
+        self.streaming_var = tk.BooleanVar(value=False)
+        self.streaming_check = ttk.Checkbutton(recitation_frame,
+                                               text="Streaming (advance as soon as the ayah is recited)",
+                                               variable=self.streaming_var)
+        self.streaming_check.pack()
+
         # Your Recitation
         user_frame = ttk.LabelFrame(main_frame, text="Your Recitation & Results", padding="15")
         user_frame.pack(fill=tk.X, pady=10)
@@ -160,12 +190,60 @@ class HifzCompanionGUI:
         self.details_text.pack(fill=tk.BOTH, expand=True)
 
         # Status Bar
-        self.status_var = tk.StringVar(value="Ready to start hifz test...")
+        self.status_var = tk.StringVar(value="Starting...")
         status_bar = ttk.Label(main_frame,
                                textvariable=self.status_var,
                                relief=tk.SUNKEN)
         status_bar.pack(fill=tk.X, pady=5)
 
+    def initialize_in_background(self):
+        """Load the dataset, then the recorder, off the UI thread"""
+        def set_status(message):
+            self.root.after(0, self.status_var.set, message)
+
+        def run():
+            try:
+                set_status("Loading Quran dataset...")
+                corpus = self.tester.quran_data
+                STARTUP.mark("dataset loaded")
+                self.root.after(0, self.on_dataset_ready, corpus)
+
+                set_status("Opening microphone...")
+                self.tester.voice_recorder
+                STARTUP.mark("recorder ready")
+                self.root.after(0, self.on_startup_complete)
+            except Exception as e:
+                print(f"❌ Startup error: {e}")
+                set_status(f"❌ Startup error: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def on_dataset_ready(self, corpus):
+        """Fill the surah selection once the dataset is loaded"""
+        self.quran_data = corpus
+        self.surah_combo['values'] = [f"{info.number}. {info.transliteration} ({info.name})"
+                                      for info in corpus.surahs()]
+        self.surah_combo.config(state='normal')
+        self.surah_combo.current(0)
+        self.on_surah_selected()
+        self.start_test_btn.config(state='normal')
+        self.review_btn.config(state='normal')
+
+    def on_startup_complete(self):
+        STARTUP.mark("ready")
+        if not self.is_test_active:
+            self.status_var.set("Ready to start hifz test...")
+        if self.on_ready:
+            self.on_ready()
+
+    def on_surah_selected(self, event=None):
+        """Limit the start ayah to the selected surah's length"""
+        surah_num = int(self.surah_var.get().split('.')[0])
+        total = self.quran_data.surah_info(surah_num).total_verses
+        self.start_ayah_spin.config(to=total)
+        if int(self.start_ayah_var.get() or 1) > total:
+            self.start_ayah_var.set("1")
+
     def start_hifz_test(self):
         """Start a new hifz test session"""
         try:
@@ -177,25 +255,47 @@ class HifzCompanionGUI:
             current_ayah = self.tester.start_hifz_test(surah_num, start_ayah, ayah_count)
 
             if current_ayah:
-                self.is_test_active = True
-                self.update_ayah_display(current_ayah)
-
-                # Enable controls
-                self.record_btn.config(state='normal')
-                self.start_test_btn.config(state='disabled')
-                self.end_test_btn.config(state='normal')
-
+                self.on_session_started(current_ayah)
                 self.status_var.set(f"Hifz test started: {ayah_count} ayahs from Surah {surah_num}")
-                self.update_session_display()
             else:
                 messagebox.showerror("Error", "Could not start test session")
 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start test: {e}")
 
+    def start_review_session(self):
+        """Start a test of the ayahs the review scheduler says are due"""
+        try:
+            count = int(self.ayah_count_var.get())
+            current_ayah = self.tester.start_review_session(count)
+            if not current_ayah:
+                if not messagebox.askyesno("Nothing Due",
+                                           "No ayahs are due for review.\n\nReview the ones due soonest anyway?"):
+                    return
+                current_ayah = self.tester.start_review_session(count, ahead=True)
+            if current_ayah:
+                self.on_session_started(current_ayah)
+                self.status_var.set(f"Review started: {self.tester.current_session['ayah_count']} ayahs due")
+            else:
+                messagebox.showinfo("Nothing To Review", "Recite some ayahs first - they are scheduled as you go.")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to start review: {e}")
+
+    def on_session_started(self, current_ayah):
+        self.is_test_active = True
+        self.update_ayah_display(current_ayah)
+
+        # Enable controls
+        self.record_btn.config(state='normal')
+        self.start_test_btn.config(state='disabled')
+        self.review_btn.config(state='disabled')
+        self.end_test_btn.config(state='normal')
+        self.update_session_display()
+
     def end_hifz_test(self):
         """End the current hifz test"""
         if self.is_test_active:
+            self.stop_recording()
             summary = self.tester.end_session()
 
             # Show final results
@@ -218,6 +318,7 @@ class HifzCompanionGUI:
         """Reset UI to initial state"""
         self.record_btn.config(text="🎤 Start Recording & Auto-Continue", state='disabled')
         self.start_test_btn.config(state='normal')
+        self.review_btn.config(state='normal')
         self.end_test_btn.config(state='disabled')
 
         self.ayah_info_label.config(text="🎯 Start test to begin memorization recitation")
@@ -258,24 +359,43 @@ class HifzCompanionGUI:
 
         self.status_var.set("Recording... recite current ayah from memory!")
 
+        if not (self.continuous_var.get() or self.streaming_var.get()):
+            # Ayah-by-ayah: record the next ayah while the last one is transcribed
+            self.record_btn.config(state='normal')
+            self.pipeline = self.tester.start_pipeline(
+                on_result=lambda result: self.root.after(0, self.process_pipeline_result, result),
+                on_status=self.on_pipeline_status)
+            return
+
         # Start recording in thread
         threading.Thread(target=self.record_and_evaluate, daemon=True).start()
 
     def stop_recording(self):
         """Stop recording"""
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
         self.is_recording = False
         self.record_btn.config(text="🎤 Start Recording & Auto-Continue")
 
     def record_and_evaluate(self):
-        """Record audio, evaluate, and auto-advance"""
+        """Record a continuous or streaming recitation, evaluate, and auto-advance"""
         try:
             print("🎯 Starting recording and auto-advance...")
 
-            # Record and transcribe
-            user_text = self.tester.voice_recorder.quick_record_and_transcribe(duration=15)
+            if self.continuous_var.get():
+                # One long recording for the rest of the session
+                summary = self.tester.get_session_summary()
+                remaining = summary['ayah_count'] - summary['total_compared'] if summary else 1
+                user_text = self.tester.voice_recorder.quick_record_and_transcribe(
+                    duration=min(15 * max(remaining, 1), CONTINUOUS_MAX_SECONDS),
+                    end_silence=CONTINUOUS_END_SILENCE)
+                self.root.after(0, self.process_continuous_result, user_text,
+                                self.tester.voice_recorder.current_audio)
+                return
 
-            # Update UI in main thread
-            self.root.after(0, self.process_recitation_result, user_text)
+            result = self.tester.stream_and_evaluate(on_update=self.on_stream_update)
+            self.root.after(0, self.process_streaming_result, result)
 
         except Exception as e:
             error_msg = f"Recording error: {e}"
@@ -284,52 +404,97 @@ class HifzCompanionGUI:
         finally:
             self.root.after(0, self.stop_recording)
 
-    def process_recitation_result(self, user_text):
-        """Process the recitation result and auto-advance"""
-        self.recitation_text.delete(1.0, tk.END)
+    def on_pipeline_status(self, stage, surah, ayah):
+        """Show which ayah is being recorded/transcribed (called from pipeline threads)"""
+        def show():
+            if not self.is_test_active:
+                return
+            if stage == 'recording':
+                session = self.tester.current_session
+                last = session['ayahs'][-1] if session else (surah, ayah)
+                self.update_ayah_display({'position': f"Surah {surah}, Ayah {ayah}",
+                                          'is_last_ayah': (surah, ayah) == last})
+                self.status_var.set(f"Recording ayah {ayah}... recite from memory!")
+            elif stage == 'transcribing':
+                self.status_var.set(f"Transcribing ayah {ayah} - keep reciting the next one")
+        self.root.after(0, show)
+
+    def process_pipeline_result(self, result):
+        """Show one pipelined evaluation; recording has already moved on"""
+        if 'error' in result or not self.is_test_active:
+            return
 
-        if user_text:
-            self.recitation_text.insert(1.0, f"✅ Transcription successful!\n\nYour recitation:\n{user_text}")
-            self.status_var.set("Transcription successful - analyzing...")
-
-            if self.is_test_active:
-                # Evaluate recitation and auto-advance
-                result = self.tester.evaluate_and_advance(user_text)
-
-                if 'error' not in result:
-                    # Update display with results
-                    self.update_results_display(result)
-                    self.update_session_display()
-
-                    # Check if test should auto-continue
-                    if not result.get('test_complete') and result.get('next_ayah'):
-                        # Auto-continue to next ayah
-                        self.root.after(1000, self.auto_continue_to_next_ayah, result['next_ayah'])
-                    elif result.get('test_complete'):
-                        # Test complete
-                        self.root.after(2000, self.end_hifz_test)
-        else:
-            self.recitation_text.insert(1.0, "❌ No speech detected or could not transcribe\n\n")
+        self.recitation_text.delete(1.0, tk.END)
+        if result.get('no_speech'):
+            # not scored; the pipeline records the same ayah again
+            self.recitation_text.insert(1.0, f"❌ No speech detected for ayah {result['ayah']}\n\n")
             self.recitation_text.insert(tk.END, "💡 Tips: Speak louder and clearer, use quiet environment")
-
-            self.status_var.set("Transcription failed - try again")
             self.score_label.config(text="Score: --%", fg='black')
             self.feedback_label.config(text="Could not transcribe audio")
+            if result.get('retake'):
+                self.status_var.set(f"No speech - recite ayah {result['ayah']} again")
+            else:
+                self.stop_recording()
+                self.status_var.set("Transcription failed - press record to try again")
+            return
 
-            # Re-enable recording for retry
-            self.root.after(2000, lambda: self.record_btn.config(state='normal'))
+        self.recitation_text.insert(1.0, f"✅ Ayah {result['ayah']} transcribed:\n{result['user_text']}")
+        self.update_results_display(result)
+        self.update_session_display()
+        if result.get('test_complete'):
+            self.stop_recording()
+            self.root.after(2000, self.end_hifz_test)
 
-    def auto_continue_to_next_ayah(self, next_ayah_info):
-        """Automatically continue to next ayah"""
-        if next_ayah_info and self.is_test_active:
-            self.update_ayah_display(next_ayah_info)
+    def on_stream_update(self, progress):
+        """Show streaming progress (called from the recording thread)"""
+        def show():
             self.recitation_text.delete(1.0, tk.END)
-            self.recitation_text.insert(1.0, f"➡️ Auto-advanced to: {next_ayah_info['position']}\n\n")
-            self.recitation_text.insert(tk.END, "Click 'Start Recording' to continue or wait 3 seconds...")
-            self.status_var.set(f"Ready for next ayah: {next_ayah_info['position']}")
+            self.recitation_text.insert(1.0, f"🎤 {progress['transcript']}")
+            self.status_var.set(f"Streaming... {progress['matched']}/{progress['ref_words']} words matched")
+        self.root.after(0, show)
 
-            # Auto-start recording after 3 seconds
-            self.root.after(3000, self.start_recording)
+    def process_streaming_result(self, result):
+        """Show a streaming evaluation and move straight on to the next ayah"""
+        if 'error' in result:
+            self.recitation_text.delete(1.0, tk.END)
+            self.recitation_text.insert(1.0, f"❌ {result['error']}")
+            self.status_var.set("Transcription failed - try again")
+            self.root.after(2000, lambda: self.record_btn.config(state='normal'))
+            return
+
+        self.update_results_display(result)
+        self.update_session_display()
+        if result.get('test_complete'):
+            self.root.after(2000, self.end_hifz_test)
+        elif result.get('next_ayah'):
+            self.update_ayah_display(result['next_ayah'])
+            self.status_var.set(f"Ready for next ayah: {result['next_ayah']['position']}")
+            self.root.after(0, self.start_recording)
+
+    def process_continuous_result(self, user_text, audio=None):
+        """Segment a continuous recitation into ayahs and show the results"""
+        self.recitation_text.delete(1.0, tk.END)
+        if not user_text:
+            self.recitation_text.insert(1.0, "❌ No speech detected or could not transcribe")
+            self.status_var.set("Transcription failed - try again")
+            self.root.after(2000, lambda: self.record_btn.config(state='normal'))
+            return
+
+        self.recitation_text.insert(1.0, f"✅ Transcription successful!\n\nYour recitation:\n{user_text}")
+        results = [r for r in self.tester.evaluate_continuous(user_text, audio) if 'error' not in r]
+        if not results:
+            return
+
+        self.update_results_display(results[-1])
+        lines = [f"{r['surah']}:{r['ayah']}  {r['score']:3d}%  "
+                 f"{'✅' if r['is_correct'] else '❌'}" for r in results]
+        self.details_text.insert(tk.END, "\n\nPer-ayah results:\n" + "\n".join(lines))
+        self.update_session_display()
+        self.status_var.set(f"Continuous recitation evaluated: {len(results)} ayahs")
+        if results[-1].get('test_complete'):
+            self.root.after(2000, self.end_hifz_test)
+        else:
+            self.root.after(2000, lambda: self.record_btn.config(state='normal'))
 
     def update_results_display(self, result):
         """Update results display with evaluation"""
@@ -350,6 +515,19 @@ class HifzCompanionGUI:
         self.score_label.config(fg=color)
         self.feedback_label.config(text=feedback)
 
+        # Per-word mistakes from the alignment
+        mistakes = result.get('mistakes')
+        word_lines = ""
+        if mistakes:
+            word_lines = f"Words: {mistakes['matched']}/{mistakes['ref_words']} correct\n"
+            if mistakes['skipped']:
+                word_lines += "Skipped:     " + " ".join(w for _, w in mistakes['skipped']) + "\n"
+            if mistakes['substituted']:
+                word_lines += "Substituted: " + ", ".join(
+                    f"{said} → {expected}" for _, expected, said in mistakes['substituted']) + "\n"
+            if mistakes['added']:
+                word_lines += "Added:       " + " ".join(w for _, w in mistakes['added']) + "\n"
+
         # Show detailed comparison (reveal correct text only in results)
         details = f"""Ayah: {result['surah']}:{result['ayah']}
 
@@ -357,7 +535,7 @@ Your Recitation: {result['user_text']}
 Correct Text:    {result['correct_text']}
 
 Similarity: {result['similarity']:.3f} ({score}%)
-Status: {'✅ Correct' if result['is_correct'] else '❌ Needs Review'}
+{word_lines}Status: {'✅ Correct' if result['is_correct'] else '❌ Needs Review'}
 {'⚠️  Major mistakes detected' if result['is_major_mistake'] else '✨ Good recitation'}
 
 {'➡️ Auto-advancing to next ayah...' if result.get('next_ayah') else '🎉 Test complete!'}"""
@@ -384,6 +562,7 @@ def main():
     tester = HifzTester()
 
     app = HifzCompanionGUI(root, tester)
+    root.after(0, STARTUP.mark, "window shown")
     root.mainloop()
 
 
@@ -2,38 +2,143 @@
 Hifz Testing Engine - Auto-advance with hidden ayahs
 """
 
-from quran_data import load_dataset, get_ayah_text, normalize_arabic, compare_texts
-from voice_recognition import VoiceRecorder
+from quran_data import (get_ayah_text, normalize_arabic, compare_texts, align_words, alignment_report,
+                        segment_recitation)
+from corpus import get_corpus
+import threading
 import time
+import uuid
 
 
 class HifzTester:
-    def __init__(self):
-        self.quran_data = load_dataset()
-        self.voice_recorder = VoiceRecorder()
+    def __init__(self, corpus=None, backend=None, student=None):
+        # The dataset and the recorder (speech stack, microphone) are set up
+        # on first use, or ahead of time by warm_up() on a background thread
+        self._corpus = corpus
+        self._backend = backend
+        self._voice_recorder = None
+        self._init_lock = threading.Lock()
+        # Held while a result is applied to the session and while a session
+        # starts or ends, so a pipeline thread scoring an ayah never sees the
+        # session disappear halfway (RLock: continuous/streaming evaluation
+        # call evaluate_and_advance)
+        self._session_lock = threading.RLock()
+        self._search_index = None
+        self._progress = None
+        self._weak_sampler = None
+        self.student = student
         self.current_session = None
         self.current_surah = None
         self.current_ayah = None
         self.is_test_running = False
 
+    @property
+    def quran_data(self):
+        if self._corpus is None:
+            self._corpus = get_corpus()
+        return self._corpus
+
+    @property
+    def voice_recorder(self):
+        with self._init_lock:
+            if self._voice_recorder is None:
+                from voice_recognition import VoiceRecorder
+                self._voice_recorder = VoiceRecorder(self._backend)
+        return self._voice_recorder
+
+    def warm_up(self, on_progress=None):
+        """
+        Initialize the dataset, then the recorder, ahead of first use.
+        on_progress(message) is called before each step. Meant to run on a
+        background thread while the UI is already showing.
+        """
+        steps = [
+            ("Loading Quran dataset...", lambda: self.quran_data),
+            ("Opening microphone...", lambda: self.voice_recorder),
+        ]
+        for message, step in steps:
+            if on_progress:
+                on_progress(message)
+            step()
+
     def start_hifz_test(self, surah_number, start_ayah=1, ayah_count=5):
-        """Start a new hifz test session"""
-        self.current_surah = surah_number
-        self.current_ayah = start_ayah
-        self.is_test_running = True
-
-        self.current_session = {
-            'surah': surah_number,
-            'start_ayah': start_ayah,
-            'current_ayah': start_ayah,
-            'ayah_count': ayah_count,
-            'recitations': [],
-            'score': 0,
-            'total_compared': 0,
-            'test_start_time': time.time()
-        }
+        """Start a new hifz test session; its ayahs join the review schedule"""
+        ayahs = [(surah_number, a) for a in range(start_ayah, start_ayah + ayah_count)]
+        info = self._start_session(ayahs)
+        if info:
+            self.enroll_for_review(ayahs)
+        return info
+
+    def start_review_session(self, count=10, ahead=False):
+        """
+        Start a session of the `count` most overdue ayahs from the review
+        scheduler (they may come from different surahs). With ahead=True the
+        set is topped up with the ayahs due soonest. Returns None when nothing
+        is due.
+        """
+        corpus = self.quran_data
+        verse_ids = self.scheduler.next_test_set(count, ahead=ahead)
+        if not verse_ids:
+            return None
+        return self._start_session([corpus.location(v) for v in verse_ids])
+
+    def start_quiz_session(self, count=10, first_surah=None, last_surah=None, weighted=True):
+        """
+        Start a session of `count` different random ayahs from surahs
+        first_surah..last_surah (default: all). weighted=True draws this
+        student's weakest ayahs most often; otherwise every verse is equally
+        likely. Returns None when there is nothing to draw.
+        """
+        from ayah_sampler import uniform_sampler
+        corpus = self.quran_data
+        with self._session_lock:  # the weakness sampler is updated by scoring threads
+            if weighted:
+                sampler = self.weakness_sampler(first_surah, last_surah)
+            else:
+                sampler = uniform_sampler(corpus, first_surah, last_surah)
+            return self._start_session([corpus.location(v) for v in sampler.sample_distinct(count)])
 
-        return self.get_current_ayah_info()
+    def weakness_sampler(self, first_surah=None, last_surah=None):
+        """
+        AyahSampler weighted by this student's recent scores (from the
+        progress store), then by each new score as results come in. Cached
+        for the last range asked for.
+        """
+        from ayah_sampler import weakness_sampler
+        key = (first_surah, last_surah)
+        if self._weak_sampler is None or self._weak_sampler[0] != key:
+            corpus = self.quran_data
+            self.progress.flush()
+            scores = {corpus.verse_id(row['surah'], row['ayah']): row['recent']
+                      for row in self.progress.ayah_summary(self.student)}
+            self._weak_sampler = (key, weakness_sampler(corpus, scores, first_surah, last_surah))
+        return self._weak_sampler[1]
+
+    def _start_session(self, ayahs):
+        """Start a session over `ayahs`, a list of (surah, ayah) in test order; None if it is empty"""
+        with self._session_lock:
+            if not ayahs:
+                return None
+            surah_number, start_ayah = ayahs[0]
+            self.current_surah = surah_number
+            self.current_ayah = start_ayah
+            self.is_test_running = True
+
+            self.current_session = {
+                'surah': surah_number,
+                'start_ayah': start_ayah,
+                'current_ayah': start_ayah,
+                'ayah_count': len(ayahs),
+                'ayahs': ayahs,
+                'position': 0,
+                'recitations': [],
+                'score': 0,
+                'total_compared': 0,
+                'test_start_time': time.time(),
+                'session_id': uuid.uuid4().hex
+            }
+
+            return self.get_current_ayah_info()
 
     def get_current_ayah_info(self):
         """Get current ayah info WITHOUT revealing the text"""
@@ -46,8 +151,7 @@ class HifzTester:
                 'surah': self.current_surah,
                 'ayah': self.current_ayah,
                 'position': f"Surah {self.current_surah}, Ayah {self.current_ayah}",
-                'is_last_ayah': self.current_ayah >= (
-                            self.current_session['start_ayah'] + self.current_session['ayah_count'] - 1)
+                'is_last_ayah': self.current_session['position'] >= len(self.current_session['ayahs']) - 1
             }
         except Exception as e:
             print(f"Error getting ayah: {e}")
@@ -65,69 +169,185 @@ class HifzTester:
         if not self.current_session:
             return None
 
-        self.current_ayah += 1
+        position = self.current_session['position'] + 1
 
         # Check if we've reached the end of test
-        if self.current_ayah >= (self.current_session['start_ayah'] + self.current_session['ayah_count']):
+        if position >= len(self.current_session['ayahs']):
             self.is_test_running = False
             return None
 
         try:
             # Check if next ayah exists
-            get_ayah_text(self.quran_data, self.current_surah, self.current_ayah)
-            self.current_session['current_ayah'] = self.current_ayah
+            surah_number, ayah_number = self.current_session['ayahs'][position]
+            get_ayah_text(self.quran_data, surah_number, ayah_number)
+            self.current_surah, self.current_ayah = surah_number, ayah_number
+            self.current_session['position'] = position
+            self.current_session['current_ayah'] = ayah_number
             return self.get_current_ayah_info()
         except:
             # End of surah
             self.is_test_running = False
             return None
 
-    def evaluate_and_advance(self, user_recitation):
-        """Evaluate recitation and auto-advance to next ayah"""
+    def evaluate_and_advance(self, user_recitation, audio=None):
+        """
+        Evaluate recitation and auto-advance to next ayah. When the recorded
+        `audio` is given it is archived with the result in the background.
+        """
+        with self._session_lock:
+            if not self.current_session or not self.is_test_running:
+                return {'error': 'No active test session'}
+
+            correct_text = self.get_correct_text_for_comparison()
+            if not correct_text:
+                return {'error': 'Cannot get correct text'}
+
+            # Compare against the precomputed normalized reference
+            reference = self.quran_data.normalized_ayah(self.current_surah, self.current_ayah)
+            comparison_result = compare_texts(user_recitation, reference)
+
+            # Word-level alignment for the per-word mistake report
+            word_alignment = align_words(comparison_result['normalized_user'].split(), reference.tokens)
+
+            # Calculate score
+            score = comparison_result['match_percent']
+
+            # Store result
+            result = {
+                'surah': self.current_surah,
+                'ayah': self.current_ayah,
+                'user_text': user_recitation,
+                'correct_text': correct_text,  # Store for results display
+                'similarity': comparison_result['similarity'],
+                'score': score,
+                'is_correct': score >= 70,
+                'is_major_mistake': score < 60,
+                'normalized_comparison': {
+                    'user': comparison_result['normalized_user'],
+                    'correct': comparison_result['normalized_correct']
+                },
+                'word_alignment': word_alignment,
+                'mistakes': alignment_report(word_alignment)
+            }
+
+            # Update session
+            self.current_session['recitations'].append(result)
+            self.save_progress(result)
+            self.schedule_review(result)
+            self.current_session['total_compared'] += 1
+            if self.current_session['total_compared'] > 0:
+                self.current_session['score'] = (
+                        sum(r['score'] for r in self.current_session['recitations']) /
+                        self.current_session['total_compared']
+                )
+
+            if audio is not None:
+                self.archive_recitation(audio, result)
+
+            # Auto-advance to next ayah
+            next_ayah_info = self.auto_advance_ayah()
+            result['next_ayah'] = next_ayah_info
+            result['test_complete'] = next_ayah_info is None
+
+            return result
+
+    def archive_recitation(self, audio, result, segment=None):
+        """
+        Queue a recording and its result for the recitation archive (never
+        blocks). With segment=(surah, first_ayah, last_ayah), `result` is the
+        list of per-ayah results of one continuous recording of that range.
+        """
+        from recitation_archive import ARCHIVE_RECITATIONS, get_archive
+        if not ARCHIVE_RECITATIONS:
+            return None
+        try:
+            if segment:
+                return get_archive().submit_continuous(audio, result, *segment)
+            return get_archive().submit(audio, result)
+        except Exception as e:
+            print(f"⚠️ Recitation archive unavailable: {e}")
+            return None
+
+    def stream_and_evaluate(self, on_update=None, chunk_seconds=3.0, max_seconds=30):
+        """
+        Record the current ayah in streaming mode: chunks are transcribed while
+        recording continues, and recording stops as soon as the ayah's last
+        words are recognized. Returns the evaluate_and_advance result (with the
+        streaming stats under 'stream'), or an error dict.
+        """
         if not self.current_session or not self.is_test_running:
             return {'error': 'No active test session'}
 
-        correct_text = self.get_correct_text_for_comparison()
-        if not correct_text:
-            return {'error': 'Cannot get correct text'}
-
-        # Compare texts
-        comparison_result = compare_texts(user_recitation, correct_text)
-
-        # Calculate score
-        score = comparison_result['match_percent']
-
-        # Store result
-        result = {
-            'surah': self.current_surah,
-            'ayah': self.current_ayah,
-            'user_text': user_recitation,
-            'correct_text': correct_text,  # Store for results display
-            'similarity': comparison_result['similarity'],
-            'score': score,
-            'is_correct': score >= 70,
-            'is_major_mistake': score < 60,
-            'normalized_comparison': {
-                'user': comparison_result['normalized_user'],
-                'correct': comparison_result['normalized_correct']
-            }
+        from streaming import StreamingSession
+        reference = self.quran_data.normalized_ayah(self.current_surah, self.current_ayah)
+        session = StreamingSession(self.voice_recorder, chunk_seconds, max_seconds)
+        stream = session.track(reference, on_update)
+        if not stream['transcript']:
+            return {'error': 'No speech transcribed'}
+
+        result = self.evaluate_and_advance(stream['transcript'])
+        result['stream'] = {
+            'chunks': stream['chunks'],
+            'complete': stream['complete'],
+            'elapsed': stream['elapsed'],
         }
+        return result
+
+    def start_pipeline(self, on_result, on_status=None, duration=15):
+        """
+        Record, transcribe and score the remaining session ayahs as a
+        pipeline: the next ayah is recorded while the previous one is still
+        being transcribed. on_result gets each evaluate_and_advance result in
+        ayah order. Returns the running RecitationPipeline (call stop() on it
+        to abort).
+        """
+        from pipeline import RecitationPipeline
+        return RecitationPipeline(self, on_result, on_status, duration).start()
 
-        # Update session
-        self.current_session['recitations'].append(result)
-        self.current_session['total_compared'] += 1
-        if self.current_session['total_compared'] > 0:
-            self.current_session['score'] = (
-                    sum(r['score'] for r in self.current_session['recitations']) /
-                    self.current_session['total_compared']
-            )
+    def evaluate_continuous(self, transcripts, audio=None):
+        """
+        Evaluate one continuous recitation of the remaining session ayahs
+        (in a review session, of the consecutive ayahs from the current one).
+        `transcripts` is one long transcript or a list of chunk transcripts.
+        The text is segmented into ayahs against the surah's reference words,
+        then each piece goes through evaluate_and_advance, so the session gets
+        the same per-ayah records as ayah-by-ayah testing. The recording
+        (`audio`) is archived once, with each ayah's record naming its segment.
+        """
+        if not self.current_session or not self.is_test_running:
+            return [{'error': 'No active test session'}]
 
-        # Auto-advance to next ayah
-        next_ayah_info = self.auto_advance_ayah()
-        result['next_ayah'] = next_ayah_info
-        result['test_complete'] = next_ayah_info is None
+        if isinstance(transcripts, str):
+            transcripts = [transcripts]
+        # segment over the run of consecutive ayahs of one surah starting here
+        ayahs = self.current_session['ayahs']
+        last_ayah = self.current_ayah
+        for surah_number, ayah_number in ayahs[self.current_session['position'] + 1:]:
+            if surah_number != self.current_surah or ayah_number != last_ayah + 1:
+                break
+            last_ayah = ayah_number
+        last_ayah = min(last_ayah, self.quran_data.ayah_count(self.current_surah))
+        pieces = segment_recitation(self.quran_data, self.current_surah, self.current_ayah, last_ayah,
+                                    " ".join(t for t in transcripts if t))
 
-        return result
+        first_surah, first_ayah = self.current_surah, self.current_ayah
+        results = []
+        for piece in pieces:
+            if not self.is_test_running:
+                break
+            results.append(self.evaluate_and_advance(piece))
+
+        scored = [r for r in results if 'error' not in r]
+        if audio is not None and scored:
+            self.archive_recitation(audio, scored, segment=(first_surah, first_ayah, last_ayah))
+        return results
+
+    def identify_ayah(self, user_recitation, k=3):
+        """Guess which ayahs a free recitation came from (best first)"""
+        if self._search_index is None:
+            from ayah_search import open_search_index
+            self._search_index = open_search_index(self.quran_data)
+        return self._search_index.search(user_recitation, k)
 
     def get_session_summary(self):
         """Get summary of current test session"""
@@ -154,11 +374,64 @@ class HifzTester:
             'is_test_complete': not self.is_test_running or progress >= 100
         }
 
+    @property
+    def progress(self):
+        """The persistent ProgressStore (opened on first use)"""
+        if self._progress is None:
+            from progress_store import DEFAULT_STUDENT, get_progress_store
+            self._progress = get_progress_store()
+            self.student = self.student or DEFAULT_STUDENT
+        return self._progress
+
+    @property
+    def scheduler(self):
+        """This student's ReviewScheduler (loaded on first use)"""
+        from progress_store import DEFAULT_STUDENT
+        from review_scheduler import get_scheduler
+        return get_scheduler(self.student or DEFAULT_STUDENT, len(self.quran_data))
+
+    def enroll_for_review(self, ayahs):
+        """Schedule (surah, ayah) pairs the scheduler has not seen yet as due now"""
+        try:
+            corpus = self.quran_data
+            self.scheduler.enroll([corpus.verse_id(surah, ayah) for surah, ayah in ayahs])
+        except Exception as e:
+            print(f"⚠️ Could not update review schedule: {e}")
+
+    def schedule_review(self, result):
+        """Feed a score to the review scheduler and the weakness sampler"""
+        try:
+            verse_id = self.quran_data.verse_id(result['surah'], result['ayah'])
+            self.scheduler.record(verse_id, result['score'])
+            if self._weak_sampler is not None:
+                from ayah_sampler import weakness_weight
+                sampler = self._weak_sampler[1]
+                if sampler.first <= verse_id < sampler.first + sampler.count:
+                    sampler.update(verse_id, weakness_weight(result['score']))
+        except Exception as e:
+            print(f"⚠️ Could not update review schedule: {e}")
+
+    def save_progress(self, result):
+        """Queue a result for the progress store (written in the background)"""
+        try:
+            self.progress.record(self.student, result, self.current_session['session_id'])
+        except Exception as e:
+            print(f"⚠️ Could not save progress: {e}")
+
     def end_session(self):
-        """End current test session and return final results"""
-        summary = self.get_session_summary()
-        self.is_test_running = False
-        self.current_session = None
-        self.current_surah = None
-        self.current_ayah = None
-        return summary
\ No newline at end of file
+        """End current test session, save it and return final results"""
+        with self._session_lock:
+            summary = self.get_session_summary()
+            if summary and summary['total_compared']:
+                try:
+                    self.progress.record_session(self.student, summary, self.current_session['session_id'],
+                                                 self.current_session['test_start_time'])
+                    from review_scheduler import save_all
+                    save_all()
+                except Exception as e:
+                    print(f"⚠️ Could not save session: {e}")
+            self.is_test_running = False
+            self.current_session = None
+            self.current_surah = None
+            self.current_ayah = None
+            return summary
\ No newline at end of file
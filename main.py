@@ -1,24 +1,35 @@
 """
 Hifz Companion - Main Application Entry Point
+Run: python main.py [--startup-report]
 """
 
+from startup import STARTUP
+import sys
 import tkinter as tk
 from gui import HifzCompanionGUI
 from hifz_tester import HifzTester
 
+STARTUP.mark("imports done")
+
 
 def main():
     """Start the Hifz Companion application"""
     print("🕌 Starting Hifz Companion...")
+    startup_report = "--startup-report" in sys.argv
 
     try:
-        # Initialize the tester
+        # The tester is cheap to create: dataset and microphone are set up
+        # by the GUI on a background thread
         tester = HifzTester()
-        print("✅ HifzTester initialized successfully!")
 
         # Start GUI
         root = tk.Tk()
         app = HifzCompanionGUI(root, tester)
+        STARTUP.mark("window built")
+        root.after(0, STARTUP.mark, "window shown")
+
+        if startup_report:
+            app.on_ready = lambda: print(STARTUP.report())
 
         print("✅ GUI loaded successfully!")
         print("🚀 Application ready!")
@@ -30,4 +41,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,205 @@
+"""
+Pipelined recitation session: capture -> transcribe -> score
+Each stage runs on its own thread(s) and hands work on through a bounded
+queue, so the next ayah is being recorded while the previous one is still
+being transcribed and scored. Results are delivered strictly in ayah order.
+A take with no usable speech is not scored: the same ayah is recorded again
+and takes of later ayahs already in flight are discarded.
+"""
+
+import heapq
+import queue
+import threading
+import time
+
+# Sentinel passed down the queues when a stage has no more work
+_DONE = object()
+# Recording limit per reference word, so long ayahs are not cut off at `duration`
+SECONDS_PER_WORD = 1.0
+# Retakes of one ayah with no speech before the pipeline gives up and stops
+NO_SPEECH_RETAKES = 2
+
+
+class RecitationPipeline:
+    """
+    Runs the remaining ayahs of the tester's current session through
+    bounded capture/transcription/scoring queues.
+
+    on_result(result) receives every evaluate_and_advance result, in order,
+    and for a take without speech {'surah', 'ayah', 'no_speech': True,
+    'retake': bool} (retake False means the pipeline stopped);
+    on_status(stage, surah_number, ayah_number) reports 'recording',
+    'transcribing' and 'scoring' as each ayah moves through. Both are called from worker
+    threads, so GUI callers should marshal them onto their UI thread.
+
+    Every take carries the epoch it was recorded in; a retake starts a new
+    epoch, and takes from older epochs are dropped wherever they are.
+    """
+
+    def __init__(self, tester, on_result, on_status=None, duration=15,
+                 queue_size=2, transcribe_workers=2):
+        self.tester = tester
+        self.on_result = on_result
+        self.on_status = on_status or (lambda stage, surah, ayah: None)
+        self.duration = duration
+        self.transcribe_workers = transcribe_workers
+        self._audio_q = queue.Queue(maxsize=queue_size)
+        self._text_q = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._restart_at = None  # position the capture stage must go back to
+        self._wake = threading.Event()
+        self._threads = []
+        self.timings = []
+
+    def _remaining_ayahs(self):
+        """(surah, ayah) still to test, up to the end of the session or of the surah"""
+        session = self.tester.current_session
+        corpus = self.tester.quran_data
+        remaining = []
+        for surah, ayah in session['ayahs'][session['position']:]:
+            if ayah > corpus.ayah_count(surah):
+                break
+            remaining.append((surah, ayah))
+        return remaining
+
+    def start(self):
+        """Start all stages for the remaining ayahs; returns immediately."""
+        if not self.tester.current_session or not self.tester.is_test_running:
+            raise RuntimeError("No active test session")
+        ayahs = self._remaining_ayahs()
+        self._threads = [threading.Thread(target=self._capture, args=(ayahs,), daemon=True)]
+        self._threads += [threading.Thread(target=self._transcribe, daemon=True)
+                          for _ in range(self.transcribe_workers)]
+        self._threads.append(threading.Thread(target=self._score, args=(len(ayahs),), daemon=True))
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        """Stop after the stage currently in progress; pending ayahs are dropped."""
+        self._stop.set()
+
+    def join(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    @property
+    def running(self):
+        return any(t.is_alive() for t in self._threads)
+
+    def _put(self, q, item):
+        """Blocking put that still notices stop()."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _retake(self, seq):
+        """Record ayah `seq` again and drop every take recorded before now."""
+        with self._lock:
+            self._epoch += 1
+            self._restart_at = seq
+        self._wake.set()
+
+    def _capture(self, ayahs):
+        recorder = self.tester.voice_recorder
+        seq = 0
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    if self._restart_at is not None:
+                        seq, self._restart_at = self._restart_at, None
+                    epoch = self._epoch
+                if seq >= len(ayahs):
+                    # all recorded; stay available for a retake until scoring is done
+                    self._wake.wait(0.2)
+                    self._wake.clear()
+                    continue
+                surah, ayah = ayahs[seq]
+                self.on_status('recording', surah, ayah)
+                started = time.perf_counter()
+                words = len(self.tester.quran_data.normalized_ayah(surah, ayah).tokens)
+                audio = recorder.record_audio(max(self.duration, SECONDS_PER_WORD * words))
+                if epoch != self._epoch:
+                    continue  # a retake was asked for while this was recording
+                if not self._put(self._audio_q, (seq, epoch, surah, ayah, audio, started)):
+                    break
+                seq += 1
+        finally:
+            for _ in range(self.transcribe_workers):
+                self._audio_q.put(_DONE)
+
+    def _transcribe(self):
+        recorder = self.tester.voice_recorder
+        while True:
+            item = self._audio_q.get()
+            if item is _DONE:
+                self._put(self._text_q, _DONE)
+                return
+            seq, epoch, surah, ayah, audio, started = item
+            if self._stop.is_set() or epoch != self._epoch:
+                continue
+            self.on_status('transcribing', surah, ayah)
+            text = recorder.transcribe_long(audio) if audio is not None else ""
+            self._put(self._text_q, (seq, epoch, surah, ayah, text, audio, started))
+
+    def _score(self, total):
+        try:
+            self._deliver(total)
+        finally:
+            self._stop.set()  # the capture stage waits for retakes until this
+
+    def _deliver(self, total):
+        pending = []
+        next_seq = 0
+        finished_workers = 0
+        silent_takes = 0
+        while next_seq < total and not self._stop.is_set():
+            try:
+                item = self._text_q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                finished_workers += 1
+                if finished_workers == self.transcribe_workers:
+                    break
+                continue
+            if item[1] != self._epoch:
+                continue  # recorded before a retake
+            heapq.heappush(pending, item)
+            # deliver everything that is now in order
+            while pending and pending[0][0] == next_seq:
+                seq, epoch, surah, ayah, text, audio, started = heapq.heappop(pending)
+                current = (self.tester.current_surah, self.tester.current_ayah)
+                if current != (surah, ayah) or not self.tester.is_test_running:
+                    self._stop.set()
+                    break
+                if not text:
+                    # not scored: a 0 would be stored and the ayah skipped
+                    silent_takes += 1
+                    retake = silent_takes <= NO_SPEECH_RETAKES
+                    if retake:
+                        self._retake(seq)
+                    else:
+                        self._stop.set()
+                    pending.clear()
+                    self.on_result({'surah': surah, 'ayah': ayah, 'user_text': '', 'no_speech': True,
+                                    'retake': retake, 'test_complete': False,
+                                    'pipeline_latency': time.perf_counter() - started})
+                    break
+                silent_takes = 0
+                next_seq += 1
+                self.on_status('scoring', surah, ayah)
+                result = self.tester.evaluate_and_advance(text, audio)
+                result['no_speech'] = False
+                result['pipeline_latency'] = time.perf_counter() - started
+                self.timings.append(result['pipeline_latency'])
+                self.on_result(result)
+                if result.get('error') or result.get('test_complete'):
+                    self._stop.set()
+                    break
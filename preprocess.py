@@ -0,0 +1,201 @@
+"""
+Audio preprocessing before recognition (NumPy)
+- resample(samples, rate, target): band-limited (FFT) resampling to 16 kHz
+- remove_dc(samples): subtract the DC offset
+- spectral_gate(samples, rate): STFT noise reduction; bins that do not rise
+  above the noise profile of the quietest frames are attenuated
+- normalize_loudness(samples, rate): speech RMS to TARGET_DBFS, peaks
+  limited to PEAK_DBFS
+- preprocess(audio): all of the above on an AudioData, optionally with the
+  FLAC upload encoded up front; every step is timed
+
+The result is 16 kHz 16-bit mono, which is what the recognizers resample to
+anyway, so uploads shrink (a 48 kHz capture goes out at a third of the size)
+and less noise reaches the recognizer.
+"""
+
+import os
+import time
+
+import numpy as np
+import speech_recognition as sr
+
+import vad
+
+# CHANGEABLE: preprocess recordings before transcription (SURAHSYNC_PREPROCESS=0 to send them raw)
+PREPROCESS_AUDIO = os.environ.get("SURAHSYNC_PREPROCESS", "1") != "0"
+TARGET_RATE = 16000
+# CHANGEABLE: loudness speech is normalized to, and the peak limit
+TARGET_DBFS = -20.0
+PEAK_DBFS = -1.0
+# Gain never exceeds this, so a near-silent recording is not blown up into noise
+MAX_GAIN_DB = 30.0
+# CHANGEABLE: spectral gate strength - bins within GATE_THRESHOLD standard
+# deviations of the noise profile are attenuated by GATE_REDUCTION_DB
+GATE_THRESHOLD = 1.5
+GATE_REDUCTION_DB = 12.0
+# STFT for the gate: 32 ms Hann windows at 75% overlap (at 16 kHz)
+_FFT_SIZE = 512
+_HOP = 128
+# Share of the quietest STFT frames the noise profile is taken from
+_NOISE_QUANTILE = 0.1
+# The gate is skipped when those frames are within this many dB of the loud
+# ones (no real pause to learn the noise from, e.g. a short streamed chunk)
+_MIN_NOISE_CONTRAST_DB = 15.0
+# Smoothing of the gate mask across (frames, bins), against musical noise
+_MASK_SMOOTHING = (3, 5)
+
+STEPS = ("resample", "remove_dc", "spectral_gate", "normalize_loudness")
+
+
+def resample(samples: np.ndarray, rate: int, target: int = TARGET_RATE) -> np.ndarray:
+    """Resample by truncating or zero-padding the spectrum (an ideal low-pass when downsampling)."""
+    if rate == target or not len(samples):
+        return samples
+    n = len(samples)
+    m = max(1, int(round(n * target / rate)))
+    spectrum = np.fft.rfft(samples)
+    bins = m // 2 + 1
+    if bins <= len(spectrum):
+        spectrum = spectrum[:bins]
+    else:
+        spectrum = np.concatenate([spectrum, np.zeros(bins - len(spectrum), dtype=spectrum.dtype)])
+    return (np.fft.irfft(spectrum, m) * (m / n)).astype(np.float32)
+
+
+def remove_dc(samples: np.ndarray) -> np.ndarray:
+    if not len(samples):
+        return samples
+    return samples - np.float32(samples.mean(dtype=np.float64))
+
+
+def normalize_loudness(samples: np.ndarray, rate: int, target_dbfs: float = TARGET_DBFS,
+                       peak_dbfs: float = PEAK_DBFS) -> np.ndarray:
+    """Scale so the speech frames (VAD) sit at target_dbfs, without pushing peaks past peak_dbfs."""
+    if not len(samples):
+        return samples
+    mask, frame_len = vad.speech_mask(samples, rate)
+    frames = samples[:len(mask) * frame_len].reshape(-1, frame_len)
+    active = frames[mask] if mask.any() else frames
+    if not active.size:
+        return samples
+    rms = float(np.sqrt(np.mean(np.square(active, dtype=np.float64))))
+    peak = float(np.max(np.abs(samples)))
+    if rms <= 0 or peak <= 0:
+        return samples
+    gain_db = min(target_dbfs - 20 * np.log10(rms), peak_dbfs - 20 * np.log10(peak), MAX_GAIN_DB)
+    return samples * np.float32(10 ** (gain_db / 20))
+
+
+def _box_smooth(values: np.ndarray, size) -> np.ndarray:
+    """Mean over a (rows, cols) window, same shape (edges padded by repetition)."""
+    for axis, width in enumerate(size):
+        if width <= 1 or values.shape[axis] < 2:
+            continue
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (width // 2, width - 1 - width // 2)
+        padded = np.pad(values, pad, mode="edge")
+        cumsum = np.cumsum(padded, axis=axis, dtype=np.float64)
+        cumsum = np.concatenate([np.zeros_like(np.take(cumsum, [0], axis=axis)), cumsum], axis=axis)
+        upper = np.take(cumsum, np.arange(width, cumsum.shape[axis]), axis=axis)
+        lower = np.take(cumsum, np.arange(0, cumsum.shape[axis] - width), axis=axis)
+        values = ((upper - lower) / width).astype(np.float32)
+    return values
+
+
+def spectral_gate(samples: np.ndarray, rate: int = TARGET_RATE, threshold: float = GATE_THRESHOLD,
+                  reduction_db: float = GATE_REDUCTION_DB) -> np.ndarray:
+    """
+    Noise gate per frequency bin: the noise profile (mean and spread of each
+    bin's level, in dB) comes from the quietest frames of the recording
+    itself; bins below mean + threshold * std are attenuated by reduction_db.
+    """
+    if len(samples) < _FFT_SIZE:
+        return samples
+    window = np.hanning(_FFT_SIZE).astype(np.float32)
+    pad = _FFT_SIZE - _HOP
+    padded = np.pad(samples, (pad, pad + (-(len(samples) + 2 * pad - _FFT_SIZE)) % _HOP))
+    frames = np.lib.stride_tricks.sliding_window_view(padded, _FFT_SIZE)[::_HOP] * window
+    spectrum = np.fft.rfft(frames, axis=1)
+    level_db = 20 * np.log10(np.abs(spectrum) + 1e-10)
+
+    frame_energy = 10 * np.log10(np.mean(np.abs(spectrum) ** 2, axis=1) + 1e-20)
+    quiet = frame_energy <= np.quantile(frame_energy, _NOISE_QUANTILE)
+    if np.quantile(frame_energy, 1 - _NOISE_QUANTILE) - frame_energy[quiet].mean() < _MIN_NOISE_CONTRAST_DB:
+        return samples
+    noise_mean = level_db[quiet].mean(axis=0)
+    noise_std = level_db[quiet].std(axis=0)
+    keep = (level_db > noise_mean + threshold * noise_std).astype(np.float32)
+    floor = np.float32(10 ** (-reduction_db / 20))
+    gain = floor + (1 - floor) * _box_smooth(keep, _MASK_SMOOTHING)
+
+    # overlap-add with the same window; normalize by the summed squared window
+    gated = np.fft.irfft(spectrum * gain, _FFT_SIZE, axis=1).astype(np.float32) * window
+    # each frame spans _FFT_SIZE // _HOP hops; add its hop-sized pieces into place
+    hops = _FFT_SIZE // _HOP
+    out = np.zeros((len(frames) + hops - 1, _HOP), dtype=np.float32)
+    norm = np.zeros_like(out)
+    squared = (window * window).reshape(hops, _HOP)
+    for k in range(hops):
+        out[k:k + len(frames)] += gated[:, k * _HOP:(k + 1) * _HOP]
+        norm[k:k + len(frames)] += squared[k]
+    out = (out / np.maximum(norm, 1e-6)).ravel()
+    return out[pad:pad + len(samples)]
+
+
+def float_to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+class PreparedAudio(sr.AudioData):
+    """
+    AudioData produced by preprocess(): 16 kHz 16-bit mono, with the step
+    timings and, when requested, the FLAC upload already encoded.
+    """
+
+    def __init__(self, frame_data, sample_rate, sample_width, timings, flac=None):
+        super().__init__(frame_data, sample_rate, sample_width)
+        self.timings = timings
+        self.flac = flac
+
+    def get_flac_data(self, convert_rate=None, convert_width=None):
+        if self.flac is not None and convert_rate in (None, self.sample_rate) \
+                and convert_width in (None, self.sample_width):
+            return self.flac
+        return super().get_flac_data(convert_rate, convert_width)
+
+
+def preprocess(audio, steps=STEPS, flac: bool = False) -> PreparedAudio:
+    """
+    Run `steps` (in STEPS order) on an AudioData (always mono, as
+    speech_recognition records). The result's .timings maps each step (plus
+    'decode', 'encode' and 'flac') to seconds.
+    """
+    timings = {}
+
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    rate = audio.sample_rate
+    samples = timed("decode", vad.pcm_to_float, audio.frame_data, audio.sample_width)
+    if "resample" in steps:
+        samples = timed("resample", resample, samples, rate)
+        rate = TARGET_RATE
+    if "remove_dc" in steps:
+        samples = timed("remove_dc", remove_dc, samples)
+    if "spectral_gate" in steps:
+        samples = timed("spectral_gate", spectral_gate, samples, rate)
+    if "normalize_loudness" in steps:
+        samples = timed("normalize_loudness", normalize_loudness, samples, rate)
+    raw = timed("encode", float_to_pcm16, samples)
+    prepared = PreparedAudio(raw, rate, 2, timings)
+    if flac:
+        prepared.flac = timed("flac", sr.AudioData.get_flac_data, prepared)
+    return prepared
+
+
+def format_timings(timings) -> str:
+    return ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
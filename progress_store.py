@@ -0,0 +1,342 @@
+"""
+Persistent progress store
+- ProgressStore.record(student, result, session): queue one
+  evaluate_and_advance result; a writer thread commits the queue in batched
+  transactions (every BATCH_SECONDS or BATCH_SIZE rows), never on the caller
+- ProgressStore.record_session(student, summary, session): the session row,
+  written by HifzTester.end_session
+- ayah_history / weakest_ayahs / accuracy_trend / sessions: history queries
+
+SQLite in WAL mode at data/progress.sqlite, so readers (the UI, reports)
+never wait for the writer. Recitations are indexed on
+(student, surah, ayah, time); per-ayah and per-day rollups are updated in
+the same transaction as the rows they summarize, so weakest-ayah and trend
+queries read at most a few thousand rollup rows per student no matter how
+many recitations are stored.
+
+Run: python progress_store.py [student]   (prints the weakest ayahs and the trend)
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from corpus import DATA_DIR
+
+PROGRESS_PATH = os.path.join(DATA_DIR, "progress.sqlite")
+# CHANGEABLE: who is reciting when nobody is selected
+DEFAULT_STUDENT = os.environ.get("SURAHSYNC_STUDENT", "default")
+# CHANGEABLE: writer batching - commit after this many queued rows or seconds
+BATCH_SIZE = 256
+BATCH_SECONDS = 1.0
+# Weight of the newest score in an ayah's running "recent" score
+RECENT_WEIGHT = 0.3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    student INTEGER NOT NULL,
+    surah INTEGER NOT NULL,
+    start_ayah INTEGER NOT NULL,
+    ayah_count INTEGER NOT NULL,
+    started REAL NOT NULL,
+    ended REAL NOT NULL,
+    compared INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    accuracy REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_student ON sessions (student, ended);
+CREATE TABLE IF NOT EXISTS recitations (
+    id INTEGER PRIMARY KEY,
+    student INTEGER NOT NULL,
+    surah INTEGER NOT NULL,
+    ayah INTEGER NOT NULL,
+    time REAL NOT NULL,
+    score INTEGER NOT NULL,
+    similarity REAL NOT NULL,
+    session TEXT,
+    user_text TEXT
+);
+CREATE INDEX IF NOT EXISTS recitations_ayah ON recitations (student, surah, ayah, time);
+CREATE TABLE IF NOT EXISTS ayah_stats (
+    student INTEGER NOT NULL,
+    surah INTEGER NOT NULL,
+    ayah INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    recent_score REAL NOT NULL,
+    last_score INTEGER NOT NULL,
+    last_time REAL NOT NULL,
+    PRIMARY KEY (student, surah, ayah)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_stats (
+    student INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    surah INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    correct INTEGER NOT NULL,
+    score_sum INTEGER NOT NULL,
+    PRIMARY KEY (student, day, surah)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_AYAH = """
+INSERT INTO ayah_stats VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (student, surah, ayah) DO UPDATE SET
+    attempts = attempts + 1,
+    correct = correct + excluded.correct,
+    score_sum = score_sum + excluded.score_sum,
+    recent_score = recent_score + ? * (excluded.last_score - recent_score),
+    last_score = excluded.last_score,
+    last_time = excluded.last_time
+"""
+
+_UPSERT_DAY = """
+INSERT INTO daily_stats VALUES (?, ?, ?, 1, ?, ?)
+ON CONFLICT (student, day, surah) DO UPDATE SET
+    attempts = attempts + 1,
+    correct = correct + excluded.correct,
+    score_sum = score_sum + excluded.score_sum
+"""
+
+_STOP = object()
+
+_AYAH_FIELDS = ("surah", "ayah", "attempts", "correct", "average", "recent", "last_score", "last_time")
+_AYAH_SELECT = ("SELECT surah, ayah, attempts, correct, score_sum * 1.0 / attempts, recent_score, last_score, "
+                "last_time FROM ayah_stats WHERE student = ?")
+
+
+def day_number(timestamp: float) -> int:
+    """Local calendar day of a timestamp (date.toordinal)."""
+    return date.fromtimestamp(timestamp).toordinal()
+
+
+class ProgressStore:
+    """
+    One writer thread with its own connection, and one read connection
+    shared by callers under a lock. Other processes may open the same file.
+    """
+
+    def __init__(self, path: str = PROGRESS_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._read = self._connect()
+        self._read.executescript(_SCHEMA)
+        self._read_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._students = {}
+        self._flushed = threading.Condition()
+        self._submitted = self._written = 0
+        self._writer = threading.Thread(target=self._write_loop, name="progress-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -- writing ---------------------------------------------------------
+
+    def _submit(self, item):
+        with self._flushed:
+            self._submitted += 1
+        self._queue.put(item)
+
+    def record(self, student: str, result: dict, session: str = None, timestamp: float = None):
+        """Queue an evaluate_and_advance result (returns immediately)."""
+        self._submit(("recitation", student, session, timestamp or time.time(), result['surah'], result['ayah'],
+                      int(result['score']), int(bool(result['is_correct'])), float(result['similarity']),
+                      result.get('user_text')))
+
+    def record_session(self, student: str, summary: dict, session: str, started: float, ended: float = None):
+        """Queue the session row for a get_session_summary() summary."""
+        self._submit(("session", student, session, started, ended or time.time(), summary))
+
+    def _student_id(self, conn, name: str) -> int:
+        student = self._students.get(name)
+        if student is None:
+            conn.execute("INSERT OR IGNORE INTO students (name) VALUES (?)", (name,))
+            student = conn.execute("SELECT id FROM students WHERE name = ?", (name,)).fetchone()[0]
+            self._students[name] = student
+        return student
+
+    def _write_batch(self, conn, batch):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for item in batch:
+                kind, name, session = item[:3]
+                student = self._student_id(conn, name)
+                if kind == "recitation":
+                    _, _, _, ts, surah, ayah, score, correct, similarity, user_text = item
+                    conn.execute("INSERT INTO recitations (student, surah, ayah, time, score, similarity, session, "
+                                 "user_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (student, surah, ayah, ts, score, similarity, session, user_text))
+                    conn.execute(_UPSERT_AYAH, (student, surah, ayah, correct, score, score, score, ts,
+                                                RECENT_WEIGHT))
+                    conn.execute(_UPSERT_DAY, (student, day_number(ts), surah, correct, score))
+                else:
+                    _, _, _, started, ended, summary = item
+                    conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (session, student, summary['surah'], summary['start_ayah'], summary['ayah_count'],
+                                  started, ended, summary['total_compared'], summary['correct_count'],
+                                  summary['accuracy']))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._students.clear()
+            raise
+
+    def _write_loop(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_SECONDS
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            # a flush() request (None) or close() ends the batch early
+            stopping = _STOP in batch
+            items = [item for item in batch if item is not None and item is not _STOP]
+            if items:
+                try:
+                    self._write_batch(conn, items)
+                except sqlite3.Error as e:
+                    print(f"⚠️ Could not save progress ({len(items)} rows): {e}")
+            with self._flushed:
+                self._written += len(items)
+                self._flushed.notify_all()
+        conn.close()
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until everything queued so far is committed."""
+        with self._flushed:
+            target = self._submitted
+        self._queue.put(None)
+        with self._flushed:
+            return self._flushed.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(10)
+        with self._read_lock:
+            self._read.close()
+
+    # -- reading ---------------------------------------------------------
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._read.execute(sql, params).fetchall()
+
+    def _lookup_student(self, name: str):
+        rows = self._query("SELECT id FROM students WHERE name = ?", (name,))
+        return rows[0][0] if rows else None
+
+    def students(self) -> list:
+        return [name for (name,) in self._query("SELECT name FROM students ORDER BY name")]
+
+    def ayah_history(self, student: str, surah: int, ayah: int, limit: int = 20) -> list:
+        """Newest first: {'time', 'score', 'similarity', 'user_text', 'session'} for one ayah."""
+        sid = self._lookup_student(student)
+        if sid is None:
+            return []
+        rows = self._query("SELECT time, score, similarity, user_text, session FROM recitations "
+                           "WHERE student = ? AND surah = ? AND ayah = ? ORDER BY time DESC LIMIT ?",
+                           (sid, surah, ayah, limit))
+        return [dict(zip(("time", "score", "similarity", "user_text", "session"), row)) for row in rows]
+
+    def ayah_summary(self, student: str, surah: int = None) -> list:
+        """Per-ayah rollups: {'surah', 'ayah', 'attempts', 'correct', 'average', 'recent', 'last_score', 'last_time'}."""
+        sid = self._lookup_student(student)
+        if sid is None:
+            return []
+        sql = _AYAH_SELECT
+        params = [sid]
+        if surah is not None:
+            sql += " AND surah = ?"
+            params.append(surah)
+        return [dict(zip(_AYAH_FIELDS, row)) for row in self._query(sql, params)]
+
+    def weakest_ayahs(self, student: str, k: int = 10, surah: int = None, min_attempts: int = 1) -> list:
+        """
+        The k ayahs with the lowest recent score (recent attempts weigh most),
+        as ayah_summary() dicts, weakest first.
+        """
+        sid = self._lookup_student(student)
+        if sid is None:
+            return []
+        sql = _AYAH_SELECT + " AND attempts >= ?"
+        params = [sid, min_attempts]
+        if surah is not None:
+            sql += " AND surah = ?"
+            params.append(surah)
+        sql += " ORDER BY recent_score, last_time LIMIT ?"
+        return [dict(zip(_AYAH_FIELDS, row)) for row in self._query(sql, params + [k])]
+
+    def accuracy_trend(self, student: str, days: int = 30, surah: int = None) -> list:
+        """Oldest first, days with recitations only: {'day' (date), 'attempts', 'accuracy', 'average'}."""
+        sid = self._lookup_student(student)
+        if sid is None:
+            return []
+        first_day = date.today().toordinal() - days + 1
+        sql = ("SELECT day, SUM(attempts), SUM(correct), SUM(score_sum) FROM daily_stats "
+               "WHERE student = ? AND day >= ?")
+        params = [sid, first_day]
+        if surah is not None:
+            sql += " AND surah = ?"
+            params.append(surah)
+        sql += " GROUP BY day ORDER BY day"
+        return [{"day": date.fromordinal(day), "attempts": attempts, "accuracy": 100.0 * correct / attempts,
+                 "average": score_sum / attempts}
+                for day, attempts, correct, score_sum in self._query(sql, params)]
+
+    def sessions(self, student: str, limit: int = 20) -> list:
+        """Newest first: session rows as dicts."""
+        sid = self._lookup_student(student)
+        if sid is None:
+            return []
+        rows = self._query("SELECT id, surah, start_ayah, ayah_count, started, ended, compared, correct, accuracy "
+                           "FROM sessions WHERE student = ? ORDER BY ended DESC LIMIT ?", (sid, limit))
+        names = ("id", "surah", "start_ayah", "ayah_count", "started", "ended", "compared", "correct", "accuracy")
+        return [dict(zip(names, row)) for row in rows]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_progress_store() -> ProgressStore:
+    """Process-wide store (flushes queued rows at exit)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            import atexit
+            _store = ProgressStore()
+            atexit.register(_store.close)
+        return _store
+
+
+if __name__ == "__main__":
+    import sys
+    student = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_STUDENT
+    store = get_progress_store()
+    print(f"Weakest ayahs for {student}:")
+    for row in store.weakest_ayahs(student):
+        print(f"  {row['surah']}:{row['ayah']:<4} recent {row['recent']:5.1f}%  average {row['average']:5.1f}%  "
+              f"({row['attempts']} attempts)")
+    print("Last 30 days:")
+    for row in store.accuracy_trend(student):
+        print(f"  {row['day']}  {row['attempts']:4d} recitations  {row['accuracy']:5.1f}% correct  "
+              f"average {row['average']:5.1f}%")
@@ -5,17 +5,30 @@ SurahSync backend core logic module
 - load_surah(surah_num)
 - pick_random_ayah(surah_num=None)
 - get_ayah_text(surah_num, ayah_num)
-- compare_texts(user_text, correct_text, method='difflib'|'levenshtein')
-- normalize_arabic(text) to remove diacritics/punctuations/extra spaces
+- get_verse_index(data) -> VerseIndex, O(1) lookups by (surah, ayah) or global verse id
+- compare_texts(user_text, correct_text, method='difflib'|'levenshtein'|'weighted')
+- compare_many(pairs, method) / iter_compare_many(...) batch scoring
+- normalize_arabic(text, profile) to remove diacritics/punctuations/extra spaces
+  and fold letter variants (profiles: strict, standard, lenient)
+- normalize_reference(text) -> NormalizedText (normalized text, tokens, offsets)
+- align_words(user_tokens, ref_tokens) -> word-level WordOp alignment
+- segment_recitation(...) splits a continuous transcript into per-ayah pieces
 """
 
-import requests
 import json
 import csv
+import os
 import random
 import re
+import hashlib
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import islice
 from difflib import SequenceMatcher
 
+from edit_distance import levenshtein_ratio, weighted_similarity
+
 # Optional: faster Levenshtein ratio if installed
 try:
     import Levenshtein  # from python-Levenshtein
@@ -40,12 +53,83 @@ _ARABIC_DIACRITICS_PATTERN = re.compile(
 # Basic punctuation to remove (including Arabic punctuation)
 _PUNCTUATION_PATTERN = re.compile(r"[^\w\s\u0600-\u06FF]")  # keep Arabic letters+numbers+space
 
+# Letter folding applied on top of diacritic/punctuation stripping.
+# strict keeps every letter as written; standard folds the orthographic
+# variants that speech recognizers and the Uthmani script disagree on;
+# lenient additionally folds hamza carriers and Persian letter forms.
+_STANDARD_FOLDS = {
+    "\u0671": "\u0627",  # alef wasla -> alef
+    "\u0623": "\u0627",  # alef with hamza above -> alef
+    "\u0625": "\u0627",  # alef with hamza below -> alef
+    "\u0622": "\u0627",  # alef with madda -> alef
+    "\u0672": "\u0627",  # alef with wavy hamza above -> alef
+    "\u0673": "\u0627",  # alef with wavy hamza below -> alef
+    "\u0649": "\u064A",  # alef maqsura -> ya
+    "\u0629": "\u0647",  # ta marbuta -> ha
+    "\u0670": None,       # superscript (dagger) alef
+    "\u0640": None,       # tatweel
+}
+_LENIENT_FOLDS = dict(_STANDARD_FOLDS, **{
+    "\u0624": "\u0648",  # waw with hamza -> waw
+    "\u0626": "\u064A",  # ya with hamza -> ya
+    "\u0621": None,       # standalone hamza
+    "\u06A9": "\u0643",  # keheh -> kaf
+    "\u06CC": "\u064A",  # farsi ya -> ya
+    "\u06C1": "\u0647",  # heh goal -> ha
+})
+NORMALIZATION_PROFILES = {
+    "strict": {},
+    "standard": _STANDARD_FOLDS,
+    "lenient": _LENIENT_FOLDS,
+}
+# CHANGEABLE: profile used by compare_texts and the normalized sidecar
+DEFAULT_PROFILE = "standard"
+
+# Bump whenever normalize_arabic changes behaviour; cached normalized text
+# (see corpus.NormalizedSidecar) is keyed on normalization_key().
+NORMALIZATION_VERSION = 2
+
+# Pre-normalized reference text: tokens are the space-separated words of
+# `text`, offsets the character position of each token within `text`.
+NormalizedText = namedtuple("NormalizedText", "text tokens offsets profile",
+                            defaults=(DEFAULT_PROFILE,))
+
+
+class _FoldingTable(dict):
+    """
+    str.translate table for one profile. Folds are seeded up front; any
+    other code point is classified on first sight (dropped if it is a
+    diacritic or punctuation, kept otherwise) and cached.
+    """
+
+    def __init__(self, folds):
+        super().__init__({ord(k): ord(v) if v else None for k, v in folds.items()})
+
+    def __missing__(self, code):
+        ch = chr(code)
+        if _ARABIC_DIACRITICS_PATTERN.match(ch) or _PUNCTUATION_PATTERN.match(ch):
+            value = None
+        else:
+            value = code
+        self[code] = value
+        return value
+
+
+_FOLDING_TABLES = {name: _FoldingTable(folds) for name, folds in NORMALIZATION_PROFILES.items()}
+
+# Per-profile memo of raw word -> normalized word. Quranic and transcript
+# vocabularies are small, so most words hit the memo and skip translate.
+_WORD_CACHES = {name: {} for name in NORMALIZATION_PROFILES}
+_WORD_CACHE_LIMIT = 1 << 16
+
 
 def fetch_and_save_dataset(url: str = DATASET_URL, save_path: str = LOCAL_JSON) -> dict:
     """
     Fetch dataset from `url` and save locally to save_path.
     Returns parsed JSON as Python object on success.
     """
+    import requests  # network stack is only needed here
+
     print(f"Fetching dataset from: {url}")
     resp = requests.get(url, timeout=20)
     resp.raise_for_status()
@@ -65,9 +149,11 @@ def load_dataset(path: str = LOCAL_JSON) -> dict:
     """
     Load dataset from local JSON file.
     Returns the loaded data (list or dict, depending on file shape).
+    The verse index for the data is built here, once.
     """
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
+    get_verse_index(data)
     return data
 
 
@@ -119,92 +205,231 @@ def _get_surahs_list(data):
     raise ValueError("Unrecognized dataset structure: cannot find surah list")
 
 
+# Candidate key names seen across the dataset formats we support. They are only
+# probed once per dataset, when the verse index is built.
+_SURAH_NUMBER_KEYS = ("number", "chapterNumber", "chapter", "chapter_number", "id")
+_AYAH_LIST_KEYS = ("ayahs", "verses", "ayah")
+_AYAH_NUMBER_KEYS = ("numberInSurah", "verse", "ayah_number", "verse_number", "id", "number")
+
+# id(data) -> (data, VerseIndex). Holding `data` keeps the id from being reused.
+_INDEX_CACHE = {}
+
+
+def _sniff_key(obj, candidates):
+    """Return the first candidate key present in obj with an int-like value."""
+    for key in candidates:
+        if key in obj:
+            try:
+                int(obj[key])
+                return key
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+class VerseIndex:
+    """
+    Dense lookup table over every verse of a dataset.
+
+    Verses are stored in mushaf order in one flat list, so both
+    (surah, ayah) and the global verse id (1-based, 1..6236) resolve
+    with a single list access.
+    """
+
+    def __init__(self, surahs, texts, surah_starts):
+        self._surahs = surahs
+        self._texts = texts
+        self._init_tables(surah_starts)
+
+    def _init_tables(self, surah_starts):
+        # surah_starts[s - 1] is the 0-based position of surah s's first verse,
+        # with a trailing sentinel equal to the total verse count.
+        self._surah_starts = surah_starts
+        self._verse_surah = array("H")
+        for s_num in range(1, len(surah_starts)):
+            self._verse_surah.extend([s_num] * (surah_starts[s_num] - surah_starts[s_num - 1]))
+
+    @classmethod
+    def build(cls, data):
+        """Build the index from a raw dataset (any shape _get_surahs_list understands)."""
+        surahs = list(_get_surahs_list(data))
+        if surahs:
+            number_key = _sniff_key(surahs[0], _SURAH_NUMBER_KEYS)
+            if number_key and all(number_key in s for s in surahs):
+                try:
+                    surahs.sort(key=lambda s: int(s[number_key]))
+                except (TypeError, ValueError):
+                    pass
+            list_key = next((k for k in _AYAH_LIST_KEYS if surahs[0].get(k)), None)
+        else:
+            list_key = None
+
+        texts = []
+        starts = [0]
+        for s in surahs:
+            ayahs = (s.get(list_key) if list_key else None) or []
+            ordered = ayahs
+            if ayahs:
+                ayah_key = _sniff_key(ayahs[0], _AYAH_NUMBER_KEYS)
+                if ayah_key:
+                    try:
+                        nums = [int(a[ayah_key]) for a in ayahs]
+                    except (KeyError, TypeError, ValueError):
+                        nums = None
+                    # Only trust the key if it numbers the ayahs 1..n within the
+                    # surah (some formats use a global number instead).
+                    if nums and sorted(nums) == list(range(1, len(ayahs) + 1)):
+                        ordered = [a for _, a in sorted(zip(nums, ayahs), key=lambda p: p[0])]
+                text_key = "text" if "text" in ayahs[0] else None
+                for a in ordered:
+                    if text_key:
+                        texts.append(a.get(text_key) or "")
+                    else:
+                        texts.append(next(iter(a.values()), "") or "")
+            starts.append(len(texts))
+        return cls(surahs, texts, starts)
+
+    @property
+    def surah_count(self) -> int:
+        return len(self._surah_starts) - 1
+
+    def __len__(self):
+        return self._surah_starts[-1]
+
+    def _text_at(self, pos: int) -> str:
+        return self._texts[pos]
+
+    def ayah_count(self, surah_number: int) -> int:
+        """Number of ayahs in a surah (1-based surah number)."""
+        s = int(surah_number)
+        if not 1 <= s <= self.surah_count:
+            raise IndexError(f"Surah {surah_number} not found")
+        return self._surah_starts[s] - self._surah_starts[s - 1]
+
+    def surah(self, surah_number: int):
+        """Raw surah object from the source dataset."""
+        s = int(surah_number)
+        if not 1 <= s <= self.surah_count:
+            raise IndexError(f"Surah {surah_number} not found")
+        return self._surahs[s - 1]
+
+    def verse_id(self, surah_number: int, ayah_number: int) -> int:
+        """Global 1-based verse id for (surah, ayah)."""
+        count = self.ayah_count(surah_number)
+        a = int(ayah_number)
+        if not 1 <= a <= count:
+            raise IndexError(f"Ayah {ayah_number} in Surah {surah_number} not found")
+        return self._surah_starts[int(surah_number) - 1] + a
+
+    def location(self, verse_id: int):
+        """Return (surah_number, ayah_number) for a global verse id."""
+        v = int(verse_id)
+        if not 1 <= v <= len(self):
+            raise IndexError(f"Verse id {verse_id} out of range")
+        s = self._verse_surah[v - 1]
+        return s, v - self._surah_starts[s - 1]
+
+    def text(self, verse_id: int) -> str:
+        """Arabic text for a global verse id."""
+        v = int(verse_id)
+        if not 1 <= v <= len(self):
+            raise IndexError(f"Verse id {verse_id} out of range")
+        return self._text_at(v - 1)
+
+    def ayah_text(self, surah_number: int, ayah_number: int) -> str:
+        return self._text_at(self.verse_id(surah_number, ayah_number) - 1)
+
+    def normalized_ayah(self, surah_number: int, ayah_number: int,
+                        profile: str = DEFAULT_PROFILE) -> "NormalizedText":
+        """NormalizedText for (surah, ayah); compiled corpora serve it precomputed."""
+        return normalize_reference(self.ayah_text(surah_number, ayah_number), profile)
+
+
+def get_verse_index(data) -> VerseIndex:
+    """
+    Return the VerseIndex for `data`, building it on first use.
+    `data` may be a raw dataset or anything that already is a VerseIndex.
+    """
+    if isinstance(data, VerseIndex):
+        return data
+    cached = _INDEX_CACHE.get(id(data))
+    if cached is not None and cached[0] is data:
+        return cached[1]
+    index = VerseIndex.build(data)
+    _INDEX_CACHE[id(data)] = (data, index)
+    return index
+
+
 def load_surah(data, surah_number: int):
     """
     Return surah object for surah_number (1-based).
     """
-    surahs = _get_surahs_list(data)
-    # find by number field or by position
-    for s in surahs:
-        num = s.get("number") or s.get("chapterNumber") or s.get("chapter")
-        if num:
-            try:
-                if int(num) == int(surah_number):
-                    return s
-            except Exception:
-                pass
-    # fallback: index-based
-    idx = surah_number - 1
-    if 0 <= idx < len(surahs):
-        return surahs[idx]
-    raise IndexError(f"Surah {surah_number} not found")
+    return get_verse_index(data).surah(surah_number)
 
 
 def get_ayah_text(data, surah_number: int, ayah_number: int) -> str:
     """
     Return the Arabic text for a given surah and ayah (both 1-based).
     """
-    s = load_surah(data, surah_number)
-    ayahs = s.get("ayahs") or s.get("verses") or s.get("ayah")
-    if not ayahs:
-        raise ValueError("Surah data does not contain ayahs/verses")
-    # many formats store 'number' as global number; some store 'numberInSurah'
-    for a in ayahs:
-        # try common fields
-        for key in ("numberInSurah", "verse", "ayah_number", "verse_number", "number"):
-            if key in a:
-                try:
-                    if int(a[key]) == int(ayah_number):
-                        return a.get("text") or next(iter(a.values()))
-                except Exception:
-                    pass
-    # fallback by index
-    idx = ayah_number - 1
-    if 0 <= idx < len(ayahs):
-        return ayahs[idx].get("text") or ""
-    raise IndexError(f"Ayah {ayah_number} in Surah {surah_number} not found")
+    return get_verse_index(data).ayah_text(surah_number, ayah_number)
 
 
 def pick_random_ayah(data, surah_number: int = None):
     """
-    Pick a random ayah.
+    Pick a random ayah, every verse equally likely: one randint over the
+    global verse ids (weighted draws are in ayah_sampler).
     If surah_number is provided, choose from that surah only.
     Returns tuple: (surah_number, ayah_number, ayah_text)
     """
-    surahs = _get_surahs_list(data)
+    index = get_verse_index(data)
     if surah_number is None:
-        s = random.choice(surahs)
+        verse_id = random.randint(1, len(index))
     else:
-        s = load_surah(data, surah_number)
-    s_num = s.get("number") or s.get("chapter") or None
-    ayahs = s.get("ayahs") or s.get("verses") or s.get("ayah")
-    if not ayahs:
-        raise ValueError("No ayahs found in chosen surah")
-    a = random.choice(ayahs)
-    # determine ayah number in surah
-    ayah_num = None
-    for key in ("numberInSurah", "verse", "ayah_number", "verse_number", "number"):
-        if key in a:
-            try:
-                ayah_num = int(a[key])
-                break
-            except Exception:
-                pass
-    if ayah_num is None:
-        # fallback to index
-        ayah_num = ayahs.index(a) + 1
-    return int(s_num) if s_num else None, ayah_num, a.get("text") or ""
+        count = index.ayah_count(surah_number)
+        if not count:
+            raise ValueError("No ayahs found in chosen surah")
+        first = index.verse_id(surah_number, 1)
+        verse_id = random.randint(first, first + count - 1)
+    s_num, ayah_num = index.location(verse_id)
+    return s_num, ayah_num, index.text(verse_id)
 
 
 # ------------ Text normalization & comparison helpers ---------------
 
-def normalize_arabic(text: str) -> str:
+def normalize_arabic(text: str, profile: str = DEFAULT_PROFILE) -> str:
     """
-    Normalize Arabic text for comparison:
+    Normalize Arabic text for comparison with one translate per word:
     - remove diacritics (tashkeel)
     - remove punctuation
+    - fold letter variants according to `profile` (strict/standard/lenient)
     - collapse whitespace
     """
+    if text is None:
+        return ""
+    try:
+        table = _FOLDING_TABLES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown normalization profile: {profile!r}") from None
+    cache = _WORD_CACHES[profile]
+    if len(cache) > _WORD_CACHE_LIMIT:
+        cache.clear()
+    words = []
+    # Nothing in the table maps to whitespace, so translating word by word
+    # is equivalent to translating the whole string and re-splitting.
+    for word in str(text).split():
+        norm = cache.get(word)
+        if norm is None:
+            norm = cache[word] = word.translate(table)
+        if norm:
+            words.append(norm)
+    return " ".join(words)
+
+
+def _normalize_arabic_regex(text: str) -> str:
+    """
+    Original three-pass regex normalizer, equivalent to the 'strict'
+    profile. Kept as the baseline for benchmarks.bench_normalizers.
+    """
     if text is None:
         return ""
     text = str(text)
@@ -217,6 +442,33 @@ def normalize_arabic(text: str) -> str:
     return text
 
 
+def normalization_key(profile: str = DEFAULT_PROFILE) -> str:
+    """Hex digest identifying the normalization rules of `profile`."""
+    h = hashlib.sha256()
+    h.update(str(NORMALIZATION_VERSION).encode())
+    h.update(_ARABIC_DIACRITICS_PATTERN.pattern.encode("utf-8"))
+    h.update(_PUNCTUATION_PATTERN.pattern.encode("utf-8"))
+    h.update(profile.encode("utf-8"))
+    for src, dst in sorted(NORMALIZATION_PROFILES[profile].items()):
+        h.update(f"{src}>{dst or ''};".encode("utf-8"))
+    return h.hexdigest()
+
+
+def normalize_reference(text: str, profile: str = DEFAULT_PROFILE) -> NormalizedText:
+    """
+    Normalize a reference ayah once and split it into word tokens
+    with their character offsets.
+    """
+    norm = normalize_arabic(text, profile)
+    tokens = tuple(norm.split(" ")) if norm else ()
+    offsets = []
+    pos = 0
+    for tok in tokens:
+        offsets.append(pos)
+        pos += len(tok) + 1
+    return NormalizedText(norm, tokens, tuple(offsets), profile)
+
+
 def similarity_difflib(a: str, b: str) -> float:
     """
     Return ratio in [0,1] using difflib.SequenceMatcher
@@ -227,19 +479,31 @@ def similarity_difflib(a: str, b: str) -> float:
 def similarity_levenshtein(a: str, b: str) -> float:
     """
     Return ratio in [0,1] using python-Levenshtein if available,
-    else fallback to difflib.
+    else the built-in bit-parallel kernel (same ratio definition).
     """
     if HAVE_LEV:
         # Levenshtein.ratio gives 0..1
         return Levenshtein.ratio(a, b)
     else:
-        return similarity_difflib(a, b)
+        return levenshtein_ratio(a, b)
 
 
-def compare_texts(user_text: str, correct_text: str, method: str = "difflib") -> dict:
+def similarity_weighted(a: str, b: str) -> float:
+    """
+    Return ratio in [0,1] from an edit distance where commonly confused
+    Arabic letters cost less to substitute (see edit_distance).
     """
-    Compare user_text vs correct_text after normalization.
-    method: 'difflib' or 'levenshtein' (will fallback to difflib if Levenshtein unavailable)
+    return weighted_similarity(a, b)
+
+
+def compare_texts(user_text: str, correct_text: str, method: str = "difflib",
+                  profile: str = DEFAULT_PROFILE) -> dict:
+    """
+    Compare user_text vs correct_text after normalization with `profile`.
+    correct_text may be a precomputed NormalizedText (built with the same
+    profile), in which case only user_text is normalized.
+    method: 'difflib', 'levenshtein' (built-in kernel if python-Levenshtein is unavailable)
+            or 'weighted' (Arabic confusion-weighted edit distance)
     Returns dict:
       {
         'normalized_user': ...,
@@ -248,12 +512,9 @@ def compare_texts(user_text: str, correct_text: str, method: str = "difflib") ->
         'match_percent': int (0..100)
       }
     """
-    u = normalize_arabic(user_text)
-    c = normalize_arabic(correct_text)
-    if method == "levenshtein":
-        sim = similarity_levenshtein(u, c)
-    else:
-        sim = similarity_difflib(u, c)
+    u = normalize_arabic(user_text, profile)
+    c = _normalized_reference_text(correct_text, profile)
+    sim = _similarity_func(method)(u, c)
     return {
         "normalized_user": u,
         "normalized_correct": c,
@@ -262,6 +523,377 @@ def compare_texts(user_text: str, correct_text: str, method: str = "difflib") ->
     }
 
 
+def _normalized_reference_text(correct_text, profile: str) -> str:
+    if isinstance(correct_text, NormalizedText):
+        if correct_text.profile != profile:
+            raise ValueError(f"Reference was normalized with profile {correct_text.profile!r}, "
+                             f"not {profile!r}")
+        return correct_text.text
+    return normalize_arabic(correct_text, profile)
+
+
+def _similarity_func(method: str):
+    if method == "levenshtein":
+        return similarity_levenshtein
+    if method == "weighted":
+        return similarity_weighted
+    return similarity_difflib
+
+
+# ------------ Batch comparison ---------------
+
+# Unique pairs needed before compare_many spreads work over processes;
+# below this, pickling and pool start-up cost more than they save.
+_PARALLEL_MIN_PAIRS = 2000
+# Pairs per block when streaming with iter_compare_many
+_STREAM_BLOCK = 8192
+
+
+def _process_pool(workers):
+    # concurrent.futures.process is only imported when a pool is needed
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def _use_pool(workers, n_pairs: int) -> bool:
+    if workers == 0 or n_pairs < _PARALLEL_MIN_PAIRS:
+        return False
+    return workers is not None or (os.cpu_count() or 1) > 1
+
+
+def _score_chunk(task):
+    """Process-pool worker: score a chunk of normalized (user, correct) pairs."""
+    method, pairs = task
+    fn = _similarity_func(method)
+    return [fn(u, c) for u, c in pairs]
+
+
+def _score_block(pairs, method, profile, executor, chunksize, ref_cache):
+    """
+    Normalize and score one block of (user_text, correct_text) pairs.
+    Identical normalized pairs are scored once. Returns sims in input order.
+    """
+    slots = {}
+    unique = []
+    order = []
+    for user_text, correct_text in pairs:
+        if isinstance(correct_text, NormalizedText):
+            c = _normalized_reference_text(correct_text, profile)
+        else:
+            c = ref_cache.get(correct_text)
+            if c is None:
+                c = ref_cache[correct_text] = normalize_arabic(correct_text, profile)
+        key = (normalize_arabic(user_text, profile), c)
+        slot = slots.get(key)
+        if slot is None:
+            slot = slots[key] = len(unique)
+            unique.append(key)
+        order.append(slot)
+
+    if executor is not None and len(unique) >= _PARALLEL_MIN_PAIRS:
+        chunks = [(method, unique[i:i + chunksize]) for i in range(0, len(unique), chunksize)]
+        scores = [sim for part in executor.map(_score_chunk, chunks) for sim in part]
+    else:
+        scores = _score_chunk((method, unique))
+    return [scores[slot] for slot in order]
+
+
+def iter_compare_many(pairs, method: str = "difflib", profile: str = DEFAULT_PROFILE,
+                      workers: int = None, chunksize: int = 256, block_size: int = _STREAM_BLOCK):
+    """
+    Streaming variant of compare_many: consumes `pairs` lazily in blocks and
+    yields (similarity, match_percent) for each pair, in input order.
+    workers=0 keeps everything in this process.
+    """
+    pairs = iter(pairs)
+    ref_cache = {}
+    executor = None
+    try:
+        while True:
+            block = list(islice(pairs, block_size))
+            if not block:
+                return
+            if executor is None and _use_pool(workers, len(block)):
+                executor = _process_pool(workers)
+            if len(ref_cache) > _WORD_CACHE_LIMIT:
+                ref_cache.clear()
+            for sim in _score_block(block, method, profile, executor, chunksize, ref_cache):
+                yield sim, int(round(sim * 100))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def compare_many(pairs, method: str = "difflib", profile: str = DEFAULT_PROFILE,
+                 workers: int = None, chunksize: int = 256):
+    """
+    Score many (user_text, correct_text) pairs at once; correct_text may be a
+    NormalizedText. Identical normalized pairs are scored once, and large
+    batches are spread over a process pool (workers=0 disables it).
+    Returns (similarity, match_percent) as compact arrays in input order:
+    array('d') of floats in [0,1] and array('B') of ints in [0,100].
+    """
+    pairs = list(pairs)
+    executor = None
+    if _use_pool(workers, len(pairs)):
+        executor = _process_pool(workers)
+    try:
+        sims = _score_block(pairs, method, profile, executor, chunksize, {})
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    similarity = array("d", sims)
+    match_percent = array("B", (int(round(sim * 100)) for sim in sims))
+    return similarity, match_percent
+
+
+# ------------ Word-level alignment ---------------
+
+# One aligned position. op is 'match', 'substitute', 'delete' (reference word
+# the user skipped) or 'insert' (extra word the user added); ref_pos/user_pos
+# index into the token lists and are None on the side that has no word.
+WordOp = namedtuple("WordOp", "op ref_pos user_pos ref_word user_word")
+
+# Above this many tokens (both sides together) unique-word anchors are used
+# to cut the problem into small pieces before running Myers.
+_ANCHOR_MIN_TOKENS = 256
+
+
+def _middle_snake(a, a0, a1, b, b0, b1):
+    """
+    Myers' linear-space middle snake for a[a0:a1] vs b[b0:b1].
+    Returns (x0, y0, x1, y1): a diagonal run of matches lying on an optimal
+    edit path, in absolute indices. Both ranges must be non-empty.
+    """
+    n = a1 - a0
+    m = b1 - b0
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    off = max_d + 1
+    vf = [0] * (2 * max_d + 3)
+    vb = [0] * (2 * max_d + 3)
+    for d in range(max_d + 1):
+        # forward search from (a0, b0)
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            xs, ys = x, y
+            while x < n and y < m and a[a0 + x] == b[b0 + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            kb = delta - k
+            if odd and -(d - 1) <= kb <= d - 1 and x + vb[off + kb] >= n:
+                return a0 + xs, b0 + ys, a0 + x, b0 + y
+        # backward search from (a1, b1), in reversed coordinates
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[off + k - 1] < vb[off + k + 1]):
+                x = vb[off + k + 1]
+            else:
+                x = vb[off + k - 1] + 1
+            y = x - k
+            xs, ys = x, y
+            while x < n and y < m and a[a1 - 1 - x] == b[b1 - 1 - y]:
+                x += 1
+                y += 1
+            vb[off + k] = x
+            kf = delta - k
+            if not odd and -d <= kf <= d and x + vf[off + kf] >= n:
+                return a0 + n - x, b0 + m - y, a0 + n - xs, b0 + m - ys
+    raise AssertionError("middle snake not found")
+
+
+def _unique_anchors(a, a0, a1, b, b0, b1):
+    """
+    Patience-style anchors: tokens occurring exactly once in both ranges,
+    reduced to the longest run that is increasing in both sequences.
+    """
+    first_a, seen_a = {}, set()
+    for i in range(a0, a1):
+        t = a[i]
+        if t in first_a:
+            seen_a.add(t)
+        else:
+            first_a[t] = i
+    first_b, seen_b = {}, set()
+    for j in range(b0, b1):
+        t = b[j]
+        if t in first_b:
+            seen_b.add(t)
+        else:
+            first_b[t] = j
+    pairs = [(i, first_b[t]) for t, i in first_a.items()
+             if t not in seen_a and t in first_b and t not in seen_b]
+    if not pairs:
+        return []
+    pairs.sort()
+    # longest increasing subsequence on the b index (patience sorting)
+    tails, tail_idx, prev = [], [], [None] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idx.append(idx)
+        else:
+            tails[pos] = j
+            tail_idx[pos] = idx
+        prev[idx] = tail_idx[pos - 1] if pos else None
+    out = []
+    idx = tail_idx[-1]
+    while idx is not None:
+        out.append(pairs[idx])
+        idx = prev[idx]
+    out.reverse()
+    return out
+
+
+def _lcs_pairs(a, b):
+    """
+    Matched index pairs (i, j) of a common subsequence of a and b, found
+    with Myers' O((N+M)D) linear-space algorithm. Long inputs are first
+    split at unique-token anchors so D stays small per piece.
+    """
+    pairs = []
+    stack = [(0, len(a), 0, len(b))]
+    while stack:
+        a0, a1, b0, b1 = stack.pop()
+        while a0 < a1 and b0 < b1 and a[a0] == b[b0]:
+            pairs.append((a0, b0))
+            a0 += 1
+            b0 += 1
+        while a0 < a1 and b0 < b1 and a[a1 - 1] == b[b1 - 1]:
+            a1 -= 1
+            b1 -= 1
+            pairs.append((a1, b1))
+        if a0 == a1 or b0 == b1:
+            continue
+        if (a1 - a0) + (b1 - b0) > _ANCHOR_MIN_TOKENS:
+            anchors = _unique_anchors(a, a0, a1, b, b0, b1)
+            if anchors:
+                pa, pb = a0, b0
+                for i, j in anchors:
+                    pairs.append((i, j))
+                    stack.append((pa, i, pb, j))
+                    pa, pb = i + 1, j + 1
+                stack.append((pa, a1, pb, b1))
+                continue
+        x0, y0, x1, y1 = _middle_snake(a, a0, a1, b, b0, b1)
+        for k in range(x1 - x0):
+            pairs.append((x0 + k, y0 + k))
+        stack.append((a0, x0, b0, y0))
+        stack.append((x1, a1, y1, b1))
+    pairs.sort()
+    return pairs
+
+
+def align_words(user_tokens, ref_tokens):
+    """
+    Align two word sequences and return a list of WordOp in reading order.
+    Words are mapped to integer ids, matched with Myers' linear-space diff,
+    and each unmatched gap is reported as substitutions followed by the
+    leftover deletions or insertions.
+    """
+    ref_tokens = list(ref_tokens)
+    user_tokens = list(user_tokens)
+    ids = {}
+    ref_ids = [ids.setdefault(t, len(ids)) for t in ref_tokens]
+    user_ids = [ids.setdefault(t, len(ids)) for t in user_tokens]
+
+    ops = []
+
+    def emit_gap(r0, r1, u0, u1):
+        common = min(r1 - r0, u1 - u0)
+        for k in range(common):
+            ops.append(WordOp("substitute", r0 + k, u0 + k, ref_tokens[r0 + k], user_tokens[u0 + k]))
+        for r in range(r0 + common, r1):
+            ops.append(WordOp("delete", r, None, ref_tokens[r], None))
+        for u in range(u0 + common, u1):
+            ops.append(WordOp("insert", None, u, None, user_tokens[u]))
+
+    r_prev = u_prev = 0
+    for r, u in _lcs_pairs(ref_ids, user_ids):
+        emit_gap(r_prev, r, u_prev, u)
+        ops.append(WordOp("match", r, u, ref_tokens[r], user_tokens[u]))
+        r_prev, u_prev = r + 1, u + 1
+    emit_gap(r_prev, len(ref_tokens), u_prev, len(user_tokens))
+    return ops
+
+
+def alignment_report(ops) -> dict:
+    """
+    Summarize a word alignment as a mistake report:
+      {
+        'matched': int, 'ref_words': int, 'word_accuracy': float (0..1),
+        'skipped': [(ref_pos, word)], 'substituted': [(ref_pos, expected, said)],
+        'added': [(user_pos, word)]
+      }
+    """
+    matched = 0
+    skipped, substituted, added = [], [], []
+    for op in ops:
+        if op.op == "match":
+            matched += 1
+        elif op.op == "substitute":
+            substituted.append((op.ref_pos, op.ref_word, op.user_word))
+        elif op.op == "delete":
+            skipped.append((op.ref_pos, op.ref_word))
+        else:
+            added.append((op.user_pos, op.user_word))
+    ref_words = matched + len(substituted) + len(skipped)
+    return {
+        "matched": matched,
+        "ref_words": ref_words,
+        "word_accuracy": matched / ref_words if ref_words else 0.0,
+        "skipped": skipped,
+        "substituted": substituted,
+        "added": added,
+    }
+
+
+def segment_recitation(data, surah_number: int, first_ayah: int, last_ayah: int,
+                       transcript: str, profile: str = DEFAULT_PROFILE):
+    """
+    Split one continuous transcript covering ayahs first_ayah..last_ayah of a
+    surah into per-ayah pieces. The transcript is aligned word by word against
+    the concatenated reference words of the range; each user word goes to the
+    ayah of the reference word it lines up with (extra words to the ayah
+    before them). Returns a list of normalized strings, one per ayah.
+    """
+    index = get_verse_index(data)
+    ref_tokens = []
+    ref_ayah = []
+    for ayah in range(first_ayah, last_ayah + 1):
+        tokens = index.normalized_ayah(surah_number, ayah, profile).tokens
+        ref_tokens.extend(tokens)
+        ref_ayah.extend([ayah - first_ayah] * len(tokens))
+
+    user_tokens = normalize_arabic(transcript, profile).split()
+    pieces = [[] for _ in range(last_ayah - first_ayah + 1)]
+    current = 0
+    for op in align_words(user_tokens, ref_tokens):
+        if op.ref_pos is not None:
+            current = ref_ayah[op.ref_pos]
+        if op.user_pos is not None:
+            pieces[current].append(op.user_word)
+    return [" ".join(words) for words in pieces]
+
+
+def align_texts(user_text: str, correct_text, profile: str = DEFAULT_PROFILE):
+    """
+    Normalize both texts (correct_text may be a NormalizedText) and align
+    them word by word. Returns the list of WordOp.
+    """
+    if isinstance(correct_text, NormalizedText):
+        ref_tokens = correct_text.tokens
+    else:
+        ref_tokens = normalize_arabic(correct_text, profile).split()
+    return align_words(normalize_arabic(user_text, profile).split(), ref_tokens)
+
+
 # ------------------ Demo / quick test --------------------
 if __name__ == "__main__":
     # 1) Fetch dataset if not present
@@ -0,0 +1,403 @@
+"""
+Recitation archive: every recorded recitation with its evaluation
+- RecitationArchive.submit(audio, result): queue a recording for archiving;
+  returns at once, the FLAC encoding and writes run on a small background
+  thread pool so recording and scoring never wait on the disk
+- submit_continuous(audio, results, surah, first_ayah, last_ayah): one
+  recording of several ayahs, stored once with a record per ayah that
+  names its segment (range and word span of the transcript)
+- recordings(...), load_audio(id), export_wav(id, path): browse and replay
+- regrade(id, backend): transcribe the stored audio again and re-score it
+  against the ayah (for a segment: re-segment the whole recording and score
+  that ayah's part)
+
+Layout under data/recitations/:
+  objects/ab/abcdef....flac   audio, named by the sha256 of its canonical PCM
+                              (identical recordings are stored once)
+  tmp/                        files being written; renamed into objects/
+                              when complete, leftovers removed on start-up
+  index.sqlite                recordings (evaluation as JSON) and objects;
+                              `seconds` is the length of the stored audio,
+                              shared by all segments of one recording
+
+Retention: once the audio exceeds ARCHIVE_MAX_BYTES the least recently
+archived objects are deleted; their recordings keep the evaluation and
+report the audio as unavailable.
+
+Run: python recitation_archive.py [list [surah [ayah]] | export ID PATH | regrade ID | stats]
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import speech_recognition as sr
+
+from corpus import DATA_DIR
+from transcription import audio_fingerprint
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "recitations")
+# CHANGEABLE: archive recitations (SURAHSYNC_ARCHIVE=0 to keep nothing) and the disk budget for audio
+ARCHIVE_RECITATIONS = os.environ.get("SURAHSYNC_ARCHIVE", "1") != "0"
+ARCHIVE_MAX_BYTES = 512 * 1024 * 1024
+# Encoders running at once; FLAC runs as a subprocess, so these mostly wait
+ARCHIVE_WORKERS = 2
+# Retention frees down to this share of the budget, so it does not run on every write
+_EVICT_TO = 0.9
+# evaluate_and_advance fields not worth storing (derived or session state)
+_SKIPPED_FIELDS = ("next_ayah",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_last_used ON objects (last_used);
+CREATE TABLE IF NOT EXISTS recordings (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    surah INTEGER,
+    ayah INTEGER,
+    score INTEGER,
+    user_text TEXT,
+    audio TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    result TEXT NOT NULL,
+    segment TEXT
+);
+CREATE INDEX IF NOT EXISTS recordings_ayah ON recordings (surah, ayah, created);
+"""
+
+
+class RecitationArchive:
+    def __init__(self, root: str = ARCHIVE_DIR, max_bytes: int = ARCHIVE_MAX_BYTES,
+                 workers: int = ARCHIVE_WORKERS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.removed_temp_files = self._remove_temp_files()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.sqlite"), timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(recordings)")]
+        if "segment" not in columns:  # archives from before continuous recordings had segments
+            self._conn.execute("ALTER TABLE recordings ADD COLUMN segment TEXT")
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archive")
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def _remove_temp_files(self) -> int:
+        """Delete half-written files left by a previous run."""
+        removed = 0
+        for name in os.listdir(self.tmp_dir):
+            try:
+                os.remove(os.path.join(self.tmp_dir, name))
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _object_path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.objects_dir, key[:2], f"{key}.{fmt}")
+
+    # -- writing ---------------------------------------------------------
+
+    def submit(self, audio, result: dict):
+        """
+        Archive `audio` (AudioData) with its evaluate_and_advance `result` in
+        the background. Returns a Future resolving to the recording id.
+        """
+        return self._submit(audio, [(result, None)], lambda ids: ids[0])
+
+    def submit_continuous(self, audio, results, surah: int, first_ayah: int, last_ayah: int):
+        """
+        Archive one recording of ayahs first_ayah..last_ayah of a surah with
+        the evaluate_and_advance result of each ayah scored from it (in order,
+        as segmented by segment_recitation). The audio is stored once. Returns
+        a Future resolving to the list of recording ids.
+        """
+        records = []
+        word = 0
+        for result in results:
+            words = len(result['normalized_comparison']['user'].split())
+            records.append((result, {'surah': surah, 'first_ayah': first_ayah, 'last_ayah': last_ayah,
+                                     'words': [word, word + words]}))
+            word += words
+        return self._submit(audio, records, lambda ids: ids)
+
+    def _submit(self, audio, records, unpack):
+        records = [({k: v for k, v in result.items() if k not in _SKIPPED_FIELDS}, segment)
+                   for result, segment in records]
+        future = self._executor.submit(lambda: unpack(self._archive(audio, records, time.time())))
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self._pending_lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            print(f"⚠️ Could not archive recitation: {future.exception()}")
+
+    def _archive(self, audio, records, created: float) -> list:
+        key = audio_fingerprint(audio)
+        seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        fmt = self._store_object(key, audio)
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("UPDATE objects SET last_used = ? WHERE key = ?", (created, key))
+                for record, segment in records:
+                    cursor = self._conn.execute(
+                        "INSERT INTO recordings (created, surah, ayah, score, user_text, audio, seconds, result, "
+                        "segment) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (created, record.get('surah'), record.get('ayah'), record.get('score'),
+                         record.get('user_text'), key, seconds,
+                         json.dumps(record, ensure_ascii=False, default=str),
+                         json.dumps(segment) if segment else None))
+                    ids.append(cursor.lastrowid)
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def _store_object(self, key: str, audio) -> str:
+        """Write the compressed audio unless it is already stored; returns its format."""
+        with self._lock:
+            row = self._conn.execute("SELECT format FROM objects WHERE key = ?", (key,)).fetchone()
+        if row and os.path.exists(self._object_path(key, row[0])):
+            return row[0]
+        try:
+            data, fmt = audio.get_flac_data(), "flac"
+        except (OSError, AssertionError) as e:
+            # no FLAC encoder on this system; keep the audio uncompressed
+            print(f"⚠️ FLAC encoder unavailable ({e}) - archiving WAV")
+            data, fmt = audio.get_wav_data(), "wav"
+        path = self._object_path(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.part")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)",
+                               (key, fmt, len(data), time.time()))
+        return fmt
+
+    def _evict(self):
+        """Delete the least recently archived audio until under the budget (inside a transaction)."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * _EVICT_TO)
+        for key, fmt, size in self._conn.execute(
+                "SELECT key, format, size FROM objects ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM objects WHERE key = ?", (key,))
+            try:
+                os.remove(self._object_path(key, fmt))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def flush(self, timeout: float = None):
+        """Wait until everything submitted so far is on disk."""
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass  # already reported by _finished
+
+    # -- reading ---------------------------------------------------------
+
+    def recordings(self, surah: int = None, ayah: int = None, limit: int = 50) -> list:
+        """
+        Newest first: dicts with id, created, surah, ayah, score, user_text,
+        seconds, available and segment (None unless part of a continuous
+        recording).
+        """
+        query = ("SELECT r.id, r.created, r.surah, r.ayah, r.score, r.user_text, r.seconds, o.key IS NOT NULL, "
+                 "r.segment FROM recordings r LEFT JOIN objects o ON o.key = r.audio")
+        clauses, params = [], []
+        if surah is not None:
+            clauses.append("r.surah = ?")
+            params.append(surah)
+        if ayah is not None:
+            clauses.append("r.ayah = ?")
+            params.append(ayah)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY r.created DESC, r.id LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + [limit]).fetchall()
+        names = ("id", "created", "surah", "ayah", "score", "user_text", "seconds", "available")
+        return [dict(zip(names, row), available=bool(row[7]), segment=json.loads(row[8]) if row[8] else None)
+                for row in rows]
+
+    def segment(self, recording_id: int):
+        """The segment of a continuous recording ({'surah', 'first_ayah', 'last_ayah', 'words'}), else None."""
+        with self._lock:
+            row = self._conn.execute("SELECT segment FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No archived recording {recording_id}")
+        return json.loads(row[0]) if row[0] else None
+
+    def result(self, recording_id: int) -> dict:
+        """The stored evaluate_and_advance result of a recording."""
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM recordings WHERE id = ?", (recording_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No archived recording {recording_id}")
+        return json.loads(row[0])
+
+    def load_audio(self, recording_id: int):
+        """The recording as AudioData, or None if retention has removed its audio."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT o.key, o.format FROM recordings r LEFT JOIN objects o ON o.key = r.audio WHERE r.id = ?",
+                (recording_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"No archived recording {recording_id}")
+        if row[0] is None:
+            return None
+        with sr.AudioFile(self._object_path(row[0], row[1])) as source:
+            return sr.Recognizer().record(source)
+
+    def export_wav(self, recording_id: int, path: str) -> bool:
+        audio = self.load_audio(recording_id)
+        if audio is None:
+            return False
+        with open(path, "wb") as f:
+            f.write(audio.get_wav_data())
+        return True
+
+    def regrade(self, recording_id: int, backend=None) -> dict:
+        """
+        Transcribe the stored audio with `backend` (the default backend if
+        None) and score it against the ayah again. A segment of a continuous
+        recording is regraded by transcribing the whole recording, segmenting
+        it over the same ayahs and scoring this ayah's part. Returns
+        {'id', 'previous_score', 'score', 'user_text', 'similarity'}.
+        """
+        from corpus import get_corpus
+        from quran_data import compare_texts, segment_recitation
+        from transcription import get_backend
+
+        audio = self.load_audio(recording_id)
+        if audio is None:
+            raise KeyError(f"Audio of recording {recording_id} is no longer archived")
+        previous = self.result(recording_id)
+        segment = self.segment(recording_id)
+        corpus = get_corpus()
+        text = _transcribe(backend or get_backend(), audio)
+        if segment:
+            pieces = segment_recitation(corpus, segment['surah'], segment['first_ayah'], segment['last_ayah'], text)
+            text = pieces[previous['ayah'] - segment['first_ayah']]
+        reference = corpus.normalized_ayah(previous['surah'], previous['ayah'])
+        comparison = compare_texts(text, reference)
+        return {
+            'id': recording_id,
+            'previous_score': previous.get('score'),
+            'score': comparison['match_percent'],
+            'user_text': text,
+            'similarity': comparison['similarity'],
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            objects, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+            recordings = self._conn.execute("SELECT COUNT(*) FROM recordings").fetchone()[0]
+            # the segments of one continuous recording share its audio and length
+            seconds = self._conn.execute(
+                "SELECT COALESCE(SUM(seconds), 0) FROM (SELECT seconds FROM recordings WHERE segment IS NULL "
+                "UNION ALL SELECT MAX(seconds) FROM recordings WHERE segment IS NOT NULL "
+                "GROUP BY created, audio)").fetchone()[0]
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {"recordings": recordings, "seconds": seconds, "objects": objects, "bytes": size,
+                "max_bytes": self.max_bytes, "pending": pending}
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown()
+        with self._lock:
+            self._conn.close()
+
+
+def _transcribe(backend, audio) -> str:
+    """Transcript of a stored recording; long ones go through the chunked path, like VoiceRecorder.transcribe_long."""
+    from voice_recognition import SPLIT_MIN_SECONDS
+    seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+    if seconds > SPLIT_MIN_SECONDS:
+        from chunked_transcription import transcribe_parallel
+        return transcribe_parallel(backend, audio)
+    try:
+        return backend.transcribe(audio)
+    except sr.UnknownValueError:
+        return ""
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> RecitationArchive:
+    """Process-wide archive (finishes pending writes at exit)."""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            import atexit
+            _archive = RecitationArchive()
+            atexit.register(_archive.close)
+        return _archive
+
+
+if __name__ == "__main__":
+    import sys
+    from datetime import datetime
+    args = sys.argv[1:] or ["list"]
+    archive = get_archive()
+    command = args[0]
+    if command == "list":
+        numbers = [int(a) for a in args[1:3]]
+        for r in archive.recordings(*numbers):
+            when = datetime.fromtimestamp(r['created']).strftime("%Y-%m-%d %H:%M")
+            audio = f"{r['seconds']:5.1f}s" if r['available'] else "  (gone)"
+            if r['segment']:
+                audio += f" of {r['surah']}:{r['segment']['first_ayah']}-{r['segment']['last_ayah']}"
+            print(f"#{r['id']:<6} {when}  {r['surah']}:{r['ayah']:<4} {r['score']:3d}%  {audio}  {r['user_text']}")
+    elif command == "export":
+        recording_id, path = int(args[1]), args[2]
+        print(f"✅ Wrote {path}" if archive.export_wav(recording_id, path) else "❌ Audio no longer archived")
+    elif command == "regrade":
+        graded = archive.regrade(int(args[1]))
+        print(f"#{graded['id']}: {graded['previous_score']}% -> {graded['score']}%  {graded['user_text']}")
+    elif command == "stats":
+        s = archive.stats()
+        print(f"{archive.root}: {s['recordings']} recordings ({s['seconds'] / 60:.1f} min), "
+              f"{s['objects']} audio files, {s['bytes'] / 1024 / 1024:.1f} of {s['max_bytes'] / 1024 / 1024:.0f} MiB")
+    else:
+        print(__doc__)
@@ -0,0 +1,304 @@
+"""
+Request layer for remote recognizers
+- ConnectionPool: persistent keep-alive HTTP(S) connections per host
+- RequestPolicy: per-attempt deadline, hedging and jittered retries
+- HedgedClient.post(url, body, headers): sends the request; if no answer
+  arrives within the hedge delay (p95 of recent attempts) a duplicate is
+  sent and the first successful response wins; failed rounds are retried
+  after a randomized exponential backoff
+- StubRecognizerServer: local Google-compatible endpoint that injects
+  latency and failures (see `python benchmarks.py hedging`)
+
+Errors surface as sr.RequestError, like every other backend failure.
+"""
+
+import http.client
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlencode, urlsplit
+
+import speech_recognition as sr
+
+from transcription import percentile
+
+# CHANGEABLE: request behaviour for remote recognizers
+REQUEST_DEADLINE = 10.0      # seconds per attempt
+REQUEST_RETRIES = 2          # extra rounds after a failed one
+RETRY_BACKOFF = 0.25         # base of the jittered exponential backoff
+HEDGE_REQUESTS = True
+HEDGE_MIN_DELAY = 0.3        # never hedge sooner than this
+HEDGE_INITIAL_DELAY = 2.0    # until enough latencies are known for a p95
+POOL_SIZE = 4
+
+_LATENCY_WINDOW = 200
+_MIN_SAMPLES_FOR_P95 = 20
+
+
+class RequestPolicy:
+    def __init__(self, deadline: float = REQUEST_DEADLINE, retries: int = REQUEST_RETRIES,
+                 backoff: float = RETRY_BACKOFF, hedge: bool = HEDGE_REQUESTS,
+                 hedge_min_delay: float = HEDGE_MIN_DELAY, hedge_initial_delay: float = HEDGE_INITIAL_DELAY):
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_initial_delay = hedge_initial_delay
+
+
+class _AttemptError(sr.RequestError):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port), at most max_idle each."""
+
+    def __init__(self, max_idle: int = POOL_SIZE):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self, scheme: str, host: str, port, timeout: float):
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conn_cls(host, port, timeout=timeout)
+            with self._lock:
+                self.created += 1
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return key, conn
+
+    def release(self, key, conn, reusable: bool):
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append(conn)
+                    return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class HedgedClient:
+    """POSTs through a ConnectionPool with deadlines, hedging and retries."""
+
+    def __init__(self, policy: RequestPolicy = None, pool: ConnectionPool = None):
+        self.policy = policy or RequestPolicy()
+        self.pool = pool or ConnectionPool()
+        # Attempts run here; a losing hedge finishes in the background
+        self._executor = ThreadPoolExecutor(max_workers=2 * POOL_SIZE, thread_name_prefix="recognizer-http")
+        self._lock = threading.Lock()
+        self._attempt_latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._request_latencies = deque(maxlen=_LATENCY_WINDOW)
+        self.counters = {"requests": 0, "attempts": 0, "hedges": 0, "hedge_wins": 0, "retries": 0, "failures": 0}
+
+    def _count(self, name, by=1):
+        with self._lock:
+            self.counters[name] += by
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            latencies = sorted(self._attempt_latencies)
+        if len(latencies) < _MIN_SAMPLES_FOR_P95:
+            return self.policy.hedge_initial_delay
+        return max(self.policy.hedge_min_delay, percentile(latencies, 0.95))
+
+    def _attempt(self, url, body, headers, timeout):
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        key, conn = self.pool.acquire(parts.scheme, parts.hostname, parts.port, timeout)
+        self._count("attempts")
+        start = time.perf_counter()
+        reusable = False
+        try:
+            conn.request("POST", path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            reusable = not response.will_close
+        except (OSError, http.client.HTTPException) as e:
+            raise _AttemptError(f"recognition connection failed: {e}") from e
+        finally:
+            self.pool.release(key, conn, reusable)
+        if response.status >= 500 or response.status == 429:
+            raise _AttemptError(f"recognition request failed: HTTP {response.status}")
+        if response.status >= 400:
+            raise _AttemptError(f"recognition request failed: HTTP {response.status}", retryable=False)
+        with self._lock:
+            self._attempt_latencies.append(time.perf_counter() - start)
+        return data
+
+    def _hedged_round(self, url, body, headers, deadline):
+        """One round: the request, plus a hedge if it is slow. Returns the first success."""
+        policy = self.policy
+        end = time.monotonic() + deadline
+        primary = self._executor.submit(self._attempt, url, body, headers, deadline)
+        pending = {primary}
+        if policy.hedge:
+            done, _ = wait(pending, timeout=min(self.hedge_delay(), deadline))
+            if not done:
+                self._count("hedges")
+                pending.add(self._executor.submit(self._attempt, url, body, headers,
+                                                  max(0.1, end - time.monotonic())))
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    data = future.result()
+                except sr.RequestError as e:
+                    error = e
+                    continue
+                if future is not primary:
+                    self._count("hedge_wins")
+                return data
+        if error is not None and not pending:
+            raise error
+        raise _AttemptError(f"recognition request exceeded its {deadline:.1f}s deadline")
+
+    def post(self, url: str, body: bytes, headers: dict, deadline: float = None) -> bytes:
+        """Response body of a successful POST; raises sr.RequestError once retries are exhausted."""
+        policy = self.policy
+        deadline = deadline or policy.deadline
+        self._count("requests")
+        start = time.perf_counter()
+        for round_no in range(policy.retries + 1):
+            if round_no:
+                self._count("retries")
+                time.sleep(random.uniform(0, policy.backoff * 2 ** (round_no - 1)))
+            try:
+                data = self._hedged_round(url, body, headers, deadline)
+            except _AttemptError as e:
+                error = e
+                if not e.retryable:
+                    break
+                continue
+            with self._lock:
+                self._request_latencies.append(time.perf_counter() - start)
+            return data
+        self._count("failures")
+        raise error
+
+    def stats(self) -> dict:
+        """Request latency p50/p95/p99 (seconds, incl. hedges and retries) and counters."""
+        with self._lock:
+            latencies = sorted(self._request_latencies)
+            counters = dict(self.counters)
+        counters.update({
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "hedge_delay": self.hedge_delay(),
+            "connections": self.pool.created,
+        })
+        return counters
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.pool.close()
+
+
+def google_request(audio, language: str, key: str, endpoint: str):
+    """(url, body, headers) for the Google Web Speech API, as speech_recognition sends it."""
+    url = f"{endpoint}?{urlencode({'client': 'chromium', 'lang': language, 'key': key, 'pFilter': 0})}"
+    # the API rejects rates below 8 kHz
+    rate = max(audio.sample_rate, 8000)
+    body = audio.get_flac_data(convert_rate=rate, convert_width=2)
+    return url, body, {"Content-Type": f"audio/x-flac; rate={rate}"}
+
+
+def parse_google_response(text: str) -> str:
+    """Best transcript from a Google Web Speech response; UnknownValueError if none."""
+    for line in text.split("\n"):
+        if not line:
+            continue
+        result = json.loads(line).get("result", [])
+        if result:
+            alternatives = result[0].get("alternative", [])
+            if not alternatives or "transcript" not in alternatives[0]:
+                raise sr.UnknownValueError()
+            return alternatives[0]["transcript"]
+    raise sr.UnknownValueError()
+
+
+class StubRecognizerServer:
+    """
+    Local stand-in for the Google endpoint. Every request sleeps for
+    `latency` seconds (or `slow_latency` with probability `slow_rate`) and
+    fails with HTTP 500 with probability `failure_rate`; otherwise it
+    answers `transcript`. Use .url as the backend endpoint.
+    """
+
+    def __init__(self, transcript: str = "بسم الله الرحمن الرحيم", latency: float = 0.05,
+                 slow_rate: float = 0.0, slow_latency: float = 2.0, failure_rate: float = 0.0, seed: int = None):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        stub = self
+        self.transcript = transcript
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with stub._lock:
+                    stub.requests += 1
+                    slow = stub._random.random() < stub.slow_rate
+                    fail = stub._random.random() < stub.failure_rate
+                time.sleep(stub.slow_latency if slow else stub.latency)
+                if fail:
+                    body, status = b"injected failure", 500
+                else:
+                    result = {"result": [{"alternative": [{"transcript": stub.transcript, "confidence": 0.9}],
+                                          "final": True}], "result_index": 0}
+                    body, status = ('{"result":[]}\n' + json.dumps(result) + "\n").encode("utf-8"), 200
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (deadline) or a hedge already won
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/speech-api/v2/recognize"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
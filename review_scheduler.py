@@ -0,0 +1,271 @@
+"""
+Spaced-repetition review scheduler over all ayahs
+- ReviewScheduler: one student's memory state for every verse (global
+  verse id), in flat arrays: due time, interval, ease, repetitions,
+  lapses and the last RECENT_SCORES scores
+- record(verse_id, score): SM-2 style update from an evaluate_and_advance
+  score (>= PASS_SCORE counts as recalled)
+- next_test_set(k): the k most overdue ayahs, O(k log n) from a heap of due
+  times; ayahs nobody has enrolled or recited are never scanned
+- get_scheduler(student): per-student schedulers, loaded on demand from
+  data/review/<student>.bin and kept in a small LRU
+
+Heap entries are single ints, (due second << 13) | verse id, so the heap is
+a list of small ints rather than tuples. Updates push a new entry and leave
+the old one in place; stale entries are recognized by their due time when
+popped, and the heap is rebuilt once it holds twice as many entries as
+scheduled ayahs.
+"""
+
+import heapq
+import os
+import re
+import struct
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+
+from corpus import DATA_DIR
+
+REVIEW_DIR = os.path.join(DATA_DIR, "review")
+# CHANGEABLE: score that counts as recalled, and SM-2 parameters
+PASS_SCORE = 70
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+FIRST_INTERVALS = (1.0, 6.0)   # days after the first and second successful review
+RELEARN_INTERVAL = 10 / (24 * 60)  # a failed ayah comes back after 10 minutes
+RECENT_SCORES = 4
+# Schedulers kept in memory at once (one per student)
+MAX_LOADED = 64
+
+DAY = 86400.0
+_ID_BITS = 13  # verse ids < 8192
+_ID_MASK = (1 << _ID_BITS) - 1
+_NO_SCORE = -1
+
+_FILE_MAGIC = b"SSRV"
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct("<4sHI")
+# (array attribute, typecode, items per verse) in file order
+_FIELDS = (("due", "d", 1), ("interval", "f", 1), ("ease", "f", 1), ("reps", "H", 1), ("lapses", "H", 1),
+           ("scores", "b", RECENT_SCORES))
+
+
+def _key(due: float, verse_id: int) -> int:
+    return (int(due) << _ID_BITS) | verse_id
+
+
+class ReviewScheduler:
+    """
+    Memory state for verse ids 1..verse_count; index 0 is unused. A verse
+    with due == 0 is not scheduled.
+    """
+
+    def __init__(self, verse_count: int, student: str = None):
+        if verse_count > _ID_MASK:
+            raise ValueError(f"verse ids above {_ID_MASK} do not fit the heap keys")
+        self.verse_count = verse_count
+        self.student = student
+        size = verse_count + 1
+        self.due = array("d", bytes(8 * size))
+        self.interval = array("f", bytes(4 * size))
+        self.ease = array("f", [INITIAL_EASE]) * size
+        self.reps = array("H", bytes(2 * size))
+        self.lapses = array("H", bytes(2 * size))
+        self.scores = array("b", [_NO_SCORE]) * (size * RECENT_SCORES)
+        self.scheduled = 0
+        self._heap = []
+        self._lock = threading.Lock()
+        self.dirty = False
+
+    # -- updates -----------------------------------------------------------
+
+    def _schedule(self, verse_id: int, due: float):
+        if not self.due[verse_id]:
+            self.scheduled += 1
+        self.due[verse_id] = due
+        heapq.heappush(self._heap, _key(due, verse_id))
+        if len(self._heap) > 2 * self.scheduled + 64:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        due = self.due
+        self._heap = [_key(due[v], v) for v in range(1, self.verse_count + 1) if due[v]]
+        heapq.heapify(self._heap)
+
+    def enroll(self, verse_ids, now: float = None):
+        """Schedule never-seen verses (e.g. a newly memorized passage) as due now."""
+        now = now or time.time()
+        with self._lock:
+            for v in verse_ids:
+                if not self.due[v]:
+                    self._schedule(v, now)
+            self.dirty = True
+
+    def record(self, verse_id: int, score: float, now: float = None):
+        """Update one verse from a recitation score (0-100) and reschedule it."""
+        now = now or time.time()
+        v = verse_id
+        with self._lock:
+            base = v * RECENT_SCORES
+            # newest first
+            self.scores[base + 1:base + RECENT_SCORES] = self.scores[base:base + RECENT_SCORES - 1]
+            self.scores[base] = int(score)
+            quality = max(0.0, min(5.0, score / 20.0))
+            if score >= PASS_SCORE:
+                reps = self.reps[v] + 1
+                if reps <= len(FIRST_INTERVALS):
+                    interval = FIRST_INTERVALS[reps - 1]
+                else:
+                    interval = self.interval[v] * self.ease[v]
+                self.reps[v] = min(reps, 0xFFFF)
+                self.ease[v] = max(MIN_EASE, self.ease[v] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+            else:
+                interval = RELEARN_INTERVAL
+                self.reps[v] = 0
+                self.lapses[v] = min(self.lapses[v] + 1, 0xFFFF)
+                self.ease[v] = max(MIN_EASE, self.ease[v] - 0.2)
+            self.interval[v] = interval
+            self._schedule(v, now + interval * DAY)
+            self.dirty = True
+
+    # -- queries -----------------------------------------------------------
+
+    def next_test_set(self, k: int = 10, now: float = None, ahead: bool = False) -> list:
+        """
+        Up to k verse ids that are due, most overdue first. With ahead=True
+        the set is topped up with the verses due soonest. Nothing is removed
+        from the schedule until it is recorded.
+        """
+        now = now or time.time()
+        chosen = []
+        seen = set()
+        with self._lock:
+            heap, due = self._heap, self.due
+            popped = []
+            while heap and len(chosen) < k:
+                key = heapq.heappop(heap)
+                v = key & _ID_MASK
+                if not due[v] or int(due[v]) != key >> _ID_BITS or v in seen:
+                    continue  # superseded by a later update
+                popped.append(key)
+                if due[v] > now and not ahead:
+                    break
+                chosen.append(v)
+                seen.add(v)
+            for key in popped:
+                heapq.heappush(heap, key)
+        return chosen
+
+    def due_count(self, now: float = None) -> int:
+        """Verses due now (a scan; for reports, not for building test sets)."""
+        now = now or time.time()
+        return sum(1 for d in self.due if 0 < d <= now)
+
+    def state(self, verse_id: int) -> dict:
+        base = verse_id * RECENT_SCORES
+        return {
+            "due": self.due[verse_id] or None,
+            "interval_days": self.interval[verse_id],
+            "ease": self.ease[verse_id],
+            "repetitions": self.reps[verse_id],
+            "lapses": self.lapses[verse_id],
+            "recent_scores": [s for s in self.scores[base:base + RECENT_SCORES] if s != _NO_SCORE],
+        }
+
+    # -- persistence -------------------------------------------------------
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            return _FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION, self.verse_count) + b"".join(
+                getattr(self, name).tobytes() for name, _, _ in _FIELDS)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, student: str = None) -> "ReviewScheduler":
+        magic, version, verse_count = _FILE_HEADER.unpack_from(data, 0)
+        if magic != _FILE_MAGIC or version != _FILE_VERSION:
+            raise ValueError("not a review state file")
+        scheduler = cls(verse_count, student)
+        offset = _FILE_HEADER.size
+        for name, typecode, per_verse in _FIELDS:
+            values = array(typecode)
+            size = values.itemsize * per_verse * (verse_count + 1)
+            values.frombytes(data[offset:offset + size])
+            if len(values) != per_verse * (verse_count + 1):
+                raise ValueError("truncated review state file")
+            setattr(scheduler, name, values)
+            offset += size
+        scheduler.scheduled = sum(1 for d in scheduler.due if d)
+        scheduler._rebuild_heap()
+        return scheduler
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # unique per writer, so processes saving the same student do not share a temp file
+        tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+        self.dirty = False
+
+
+def state_path(student: str) -> str:
+    safe = re.sub(r"[^\w.-]", "_", student)
+    return os.path.join(REVIEW_DIR, f"{safe}.bin")
+
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+_saved_at_exit = False
+
+
+def get_scheduler(student: str, verse_count: int = None) -> ReviewScheduler:
+    """
+    The scheduler for `student`, from memory, its state file, or new. The
+    least recently used one is saved and dropped past MAX_LOADED, and
+    whatever is still loaded is saved at exit.
+    """
+    global _saved_at_exit
+    with _loaded_lock:
+        scheduler = _loaded.get(student)
+        if scheduler is not None:
+            _loaded.move_to_end(student)
+            return scheduler
+        if not _saved_at_exit:
+            import atexit
+            atexit.register(save_all)
+            _saved_at_exit = True
+        if verse_count is None:
+            from corpus import get_corpus
+            verse_count = len(get_corpus())
+        path = state_path(student)
+        scheduler = None
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    scheduler = ReviewScheduler.from_bytes(f.read(), student)
+                if scheduler.verse_count != verse_count:
+                    print(f"⚠️ Review state for {student} is for another dataset - starting over")
+                    scheduler = None
+            except (OSError, ValueError, struct.error) as e:
+                print(f"⚠️ Could not read review state for {student}: {e}")
+                scheduler = None
+        if scheduler is None:
+            scheduler = ReviewScheduler(verse_count, student)
+        _loaded[student] = scheduler
+        while len(_loaded) > MAX_LOADED:
+            old_student, old = _loaded.popitem(last=False)
+            if old.dirty:
+                old.save(state_path(old_student))
+        return scheduler
+
+
+def save_all():
+    """Write every loaded scheduler with unsaved changes."""
+    with _loaded_lock:
+        schedulers = list(_loaded.items())
+    for student, scheduler in schedulers:
+        if scheduler.dirty:
+            scheduler.save(state_path(student))
@@ -0,0 +1,84 @@
+"""
+Startup timing report
+- STARTUP.mark(name): record a wall-clock milestone (seconds since this
+  module was first imported, which main.py does before anything else)
+- STARTUP.report(): the milestones as a table
+- import_breakdown(module): `python -X importtime` for `module` in a fresh
+  interpreter, summarized per top-level import
+
+Run: python startup.py [module]   (default: main)
+"""
+
+import re
+import sys
+import threading
+import time
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$")
+
+
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.milestones = []
+        self._lock = threading.Lock()
+
+    def mark(self, name: str) -> float:
+        """Record milestone `name`; returns seconds since start."""
+        elapsed = time.perf_counter() - self.start
+        with self._lock:
+            self.milestones.append((name, elapsed))
+        return elapsed
+
+    def report(self) -> str:
+        with self._lock:
+            milestones = list(self.milestones)
+        lines = ["Startup milestones (ms since launch):"]
+        previous = 0.0
+        for name, elapsed in milestones:
+            lines.append(f"  {name:<24} {elapsed * 1000:8.1f}  (+{(elapsed - previous) * 1000:.1f})")
+            previous = elapsed
+        return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+
+
+def import_breakdown(module: str = "main", top: int = 15):
+    """
+    Import `module` in a fresh interpreter under -X importtime. Returns the
+    `top` direct imports by cumulative time as (name, self_ms, cumulative_ms),
+    plus the module's own total as the first entry.
+    """
+    import subprocess
+
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True)
+    entries = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_LINE.match(line)
+        if m:
+            depth = (len(m.group(3)) - 1) // 2
+            entries.append((depth, m.group(4), int(m.group(1)) / 1000, int(m.group(2)) / 1000))
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+    # The module itself is the last depth-0 entry; its children are the
+    # depth-1 entries reported after the previous depth-0 line
+    last_root = max(i for i, e in enumerate(entries) if e[0] == 0)
+    first_child = max((i for i, e in enumerate(entries[:last_root]) if e[0] == 0), default=-1) + 1
+    children = [e for e in entries[first_child:last_root] if e[0] == 1]
+    children.sort(key=lambda e: -e[3])
+    root = entries[last_root]
+    return [(root[1], root[2], root[3])] + [(name, own, total) for _, name, own, total in children[:top]]
+
+
+def print_import_breakdown(module: str = "main", top: int = 15):
+    rows = import_breakdown(module, top)
+    (name, _, total), children = rows[0], rows[1:]
+    print(f"import {name}: {total:.1f} ms")
+    for child, own, cumulative in children:
+        print(f"  {child:<28} {cumulative:8.1f} ms  (self {own:.1f})")
+
+
+if __name__ == "__main__":
+    print_import_breakdown(sys.argv[1] if len(sys.argv) > 1 else "main")
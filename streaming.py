@@ -0,0 +1,131 @@
+"""
+Streaming recitation: transcribe while still recording
+- AyahTracker aligns a growing transcript against the expected ayah and
+  reports when its last words have been recited
+- StreamingSession captures fixed-size chunks on one thread while the
+  caller's thread transcribes each chunk as soon as it closes
+"""
+
+import queue
+import threading
+import time
+
+from edit_distance import levenshtein_ratio
+from quran_data import DEFAULT_PROFILE, align_words, alignment_report, normalize_arabic
+
+# The ayah counts as finished once this many of its final words are matched
+TAIL_WORDS = 2
+# A substituted word this close to the reference word still counts as
+# recited (recognizers often spell out the Uthmani dagger alef, etc.)
+FUZZY_WORD_RATIO = 0.75
+
+
+class AyahTracker:
+    """
+    Tracks progress through one expected ayah. Each update() appends a chunk
+    transcript and re-aligns the running transcript against the reference;
+    an ayah is short enough that the alignment costs well under a millisecond.
+    """
+
+    def __init__(self, reference, profile: str = DEFAULT_PROFILE, tail_words: int = TAIL_WORDS):
+        self.reference = reference
+        self.profile = profile
+        self.tail_words = min(tail_words, len(reference.tokens))
+        self.chunks = []
+        self.user_tokens = []
+        self.ops = []
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(c for c in self.chunks if c)
+
+    def update(self, chunk_text: str) -> dict:
+        """Add one chunk transcript and return the new progress()."""
+        self.chunks.append(chunk_text or "")
+        words = normalize_arabic(chunk_text, self.profile).split()
+        if words:
+            self.user_tokens.extend(words)
+            self.ops = align_words(self.user_tokens, self.reference.tokens)
+        return self.progress()
+
+    @staticmethod
+    def _recited(op) -> bool:
+        if op.op == "match":
+            return True
+        return op.op == "substitute" and levenshtein_ratio(op.ref_word, op.user_word) >= FUZZY_WORD_RATIO
+
+    def progress(self) -> dict:
+        """
+        {'matched', 'ref_words', 'last_ref_pos', 'complete', 'transcript'}
+        last_ref_pos is the furthest reference word matched so far (-1 if none).
+        """
+        matched = {op.ref_pos for op in self.ops if self._recited(op)}
+        n = len(self.reference.tokens)
+        complete = all(pos in matched for pos in range(n - self.tail_words, n))
+        return {
+            "matched": len(matched),
+            "ref_words": n,
+            "last_ref_pos": max(matched) if matched else -1,
+            "complete": complete,
+            "transcript": self.transcript,
+        }
+
+    def report(self) -> dict:
+        return alignment_report(self.ops)
+
+
+class StreamingSession:
+    """
+    Records in fixed-size chunks and transcribes each one as soon as it
+    closes, stopping the moment the tracked ayah is complete.
+    """
+
+    def __init__(self, recorder, chunk_seconds: float = 3.0, max_seconds: float = 30):
+        self.recorder = recorder
+        self.chunk_seconds = chunk_seconds
+        self.max_seconds = max_seconds
+
+    def _capture(self, chunks, stop_event):
+        try:
+            for audio in self.recorder.stream_chunks(self.chunk_seconds, stop_event, self.max_seconds):
+                chunks.put(audio)
+        except Exception as e:
+            print(f"❌ Streaming capture error: {e}")
+        finally:
+            chunks.put(None)
+
+    def track(self, reference, on_update=None, profile: str = DEFAULT_PROFILE) -> dict:
+        """
+        Stream the recitation of one ayah.
+        on_update(progress) is called from this thread after every chunk.
+        Returns {'transcript', 'chunks', 'complete', 'progress', 'elapsed'}.
+        """
+        tracker = AyahTracker(reference, profile)
+        chunks = queue.Queue()
+        stop_event = threading.Event()
+        start = time.perf_counter()
+        capture = threading.Thread(target=self._capture, args=(chunks, stop_event), daemon=True)
+        capture.start()
+
+        progress = tracker.progress()
+        try:
+            while True:
+                audio = chunks.get()
+                if audio is None:
+                    break
+                progress = tracker.update(self.recorder.transcribe_audio(audio))
+                if on_update:
+                    on_update(progress)
+                if progress["complete"]:
+                    print("✅ Ayah complete - stopping stream")
+                    break
+        finally:
+            stop_event.set()
+
+        return {
+            "transcript": tracker.transcript,
+            "chunks": list(tracker.chunks),
+            "complete": progress["complete"],
+            "progress": progress,
+            "elapsed": time.perf_counter() - start,
+        }
@@ -0,0 +1,549 @@
+"""
+Tests, run with `python -m pytest`
+- no microphone or network needed: recordings are synthesized and the
+  recognizer is the fake backend or the local stub server
+- archives and progress stores are created under pytest's tmp_path; the
+  compiled corpus in data/ is built on first use
+"""
+
+import math
+import random
+import struct
+import time
+
+import pytest
+import speech_recognition as sr
+
+import voice_recognition
+from transcription import FakeBackend
+
+
+def _recording(seconds=2.0, rate=48000, seed=0):
+    """A noisy 440 Hz tone as 16-bit mono AudioData"""
+    rng = random.Random(seed)
+    samples = [int(8000 * math.sin(2 * math.pi * 440 * i / rate) + rng.gauss(0, 300))
+               for i in range(int(seconds * rate))]
+    return sr.AudioData(struct.pack(f"<{len(samples)}h", *samples), rate, 2)
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    def no_microphone(*args, **kwargs):
+        raise OSError("no microphone in tests")
+
+    monkeypatch.setattr(voice_recognition.sr, "Microphone", no_microphone)
+    return voice_recognition.VoiceRecorder(FakeBackend())
+
+
+def test_fake_backend_through_voice_recorder(recorder):
+    audio = _recording()
+    recorder.backend.register(audio, "قل هو الله احد")
+    assert recorder.transcribe_audio(audio) == "قل هو الله احد"
+    assert recorder.transcribe_long(audio) == "قل هو الله احد"
+    assert recorder.transcribe_audio(_recording(seed=1)) == ""
+
+
+def test_fake_backend_skips_preprocessing(recorder, monkeypatch):
+    audio = _recording()
+    assert recorder.prepare_audio(audio) is audio
+    if voice_recognition.HAVE_PREPROCESS:
+        # a preprocessing backend would be sent different PCM
+        monkeypatch.setattr(recorder.backend, "wants_preprocessing", True)
+        assert recorder.prepare_audio(audio).frame_data != audio.frame_data
+
+
+@pytest.fixture
+def tester(tmp_path, monkeypatch):
+    import recitation_archive
+    from hifz_tester import HifzTester
+    from progress_store import ProgressStore
+
+    import review_scheduler
+
+    archive = recitation_archive.RecitationArchive(str(tmp_path / "recitations"))
+    monkeypatch.setattr(recitation_archive, "_archive", archive)
+    monkeypatch.setattr(review_scheduler, "REVIEW_DIR", str(tmp_path / "review"))
+    tester = HifzTester(backend=FakeBackend(), student=f"test-{tmp_path.name}")
+    tester._progress = ProgressStore(str(tmp_path / "progress.sqlite"))
+    yield tester
+    review_scheduler._loaded.pop(tester.student, None)
+    tester._progress.close()
+    archive.close()
+
+
+def test_continuous_recording_is_archived_once_and_regraded_per_ayah(tester):
+    import recitation_archive
+    from quran_data import normalize_arabic
+    corpus = tester.quran_data
+    texts = [corpus.ayah_text(112, a) for a in range(1, 5)]
+    audio = _recording(seed=2)
+    backend = FakeBackend()
+    backend.register(audio, " ".join(texts))
+
+    tester.start_hifz_test(112, 1, 4)
+    results = tester.evaluate_continuous(" ".join(texts), audio)
+    assert [r['score'] for r in results] == [100] * 4
+
+    archive = recitation_archive.get_archive()
+    archive.flush()
+    rows = archive.recordings(surah=112)
+    assert len(rows) == 4 and archive.stats()['objects'] == 1
+    assert archive.stats()['seconds'] == pytest.approx(rows[0]['seconds'])
+    starts = [sum(len(normalize_arabic(t).split()) for t in texts[:i]) for i in range(4)]
+    assert [r['segment']['words'][0] for r in sorted(rows, key=lambda r: r['ayah'])] == starts
+    for row in rows:
+        regraded = archive.regrade(row['id'], backend)
+        assert regraded['score'] == 100, row
+
+
+class _ScriptedRecorder:
+    """Stands in for VoiceRecorder in the pipeline: take N of an ayah transcribes as script(ayah, N)."""
+
+    def __init__(self, script):
+        self.script = script
+        self.recording = None
+        self.takes = {}
+
+    def on_status(self, stage, surah, ayah):
+        if stage == 'recording':
+            self.recording = ayah
+
+    def record_audio(self, duration):
+        take = self.takes.get(self.recording, 0)
+        self.takes[self.recording] = take + 1
+        return sr.AudioData(struct.pack("<hh", self.recording, take), 16000, 2)
+
+    def transcribe_long(self, audio):
+        return self.script(*struct.unpack("<hh", audio.frame_data))
+
+
+def test_pipeline_retakes_an_ayah_without_speech(tester):
+    corpus = tester.quran_data
+    recorder = _ScriptedRecorder(lambda ayah, take: "" if ayah == 2 and take == 0 else corpus.ayah_text(112, ayah))
+    tester._voice_recorder = recorder
+    results = []
+    tester.start_hifz_test(112, 1, 4)
+    pipeline = tester.start_pipeline(results.append, recorder.on_status)
+    pipeline.join(10)
+
+    assert [(r['ayah'], r['no_speech']) for r in results] == [(1, False), (2, True), (2, False), (3, False), (4, False)]
+    assert results[1]['retake'] and 'score' not in results[1]
+    assert [r['score'] for r in tester.current_session['recitations']] == [100] * 4
+    assert results[-1]['test_complete'] and not pipeline.running
+
+
+def test_pipeline_stops_after_repeated_silence(tester):
+    import pipeline as pipeline_module
+    recorder = _ScriptedRecorder(lambda ayah, take: "" if ayah == 1 else "قل")
+    tester._voice_recorder = recorder
+    results = []
+    tester.start_hifz_test(112, 1, 4)
+    pipeline = tester.start_pipeline(results.append, recorder.on_status)
+    pipeline.join(10)
+
+    assert [r['retake'] for r in results] == [True] * pipeline_module.NO_SPEECH_RETAKES + [False]
+    assert tester.current_session['recitations'] == [] and tester.current_ayah == 1
+    assert not pipeline.running
+
+
+def test_vosk_backends_share_a_loaded_model(tmp_path, monkeypatch):
+    import sys
+    import types
+    from transcription import VoskBackend
+
+    loaded = []
+
+    class Model:
+        def __init__(self, path):
+            loaded.append(path)
+
+    class KaldiRecognizer:
+        def __init__(self, model, rate):
+            self.pcm = b""
+
+        def AcceptWaveform(self, pcm):
+            self.pcm += pcm
+
+        def FinalResult(self):
+            return '{"text": "بسم الله"}' if self.pcm else '{"text": ""}'
+
+    vosk = types.SimpleNamespace(Model=Model, KaldiRecognizer=KaldiRecognizer, SetLogLevel=lambda level: None)
+    monkeypatch.setitem(sys.modules, "vosk", vosk)
+    monkeypatch.setattr(VoskBackend, "_models", {})
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+
+    first = VoskBackend(model_path=str(tmp_path / "a"))
+    second = VoskBackend(model_path=str(tmp_path / "a"))
+    other = VoskBackend(model_path=str(tmp_path / "b"))
+    assert first.model is second.model and first.model is not other.model
+    assert loaded == [str(tmp_path / "a"), str(tmp_path / "b")]
+    assert first.transcribe(_recording(seconds=0.5)) == "بسم الله"
+    with pytest.raises(RuntimeError):
+        VoskBackend(model_path=str(tmp_path / "missing"))
+
+
+def test_align_words():
+    from quran_data import align_words
+    ops = align_words("قل هو الرحمن احد".split(), "قل هو الله احد".split())
+    assert [op.op for op in ops] == ["match", "match", "substitute", "match"]
+    assert ops[2].ref_word == "الله" and ops[2].user_word == "الرحمن"
+    ops = align_words("قل الله احد".split(), "قل هو الله احد".split())
+    assert [(op.op, op.ref_word) for op in ops if op.op != "match"] == [("delete", "هو")]
+
+
+def test_segment_recitation_splits_by_ayah():
+    from corpus import get_corpus
+    from quran_data import normalize_arabic, segment_recitation
+    corpus = get_corpus()
+    texts = [corpus.ayah_text(112, a) for a in range(1, 5)]
+    assert segment_recitation(corpus, 112, 1, 4, " ".join(texts)) == [normalize_arabic(t) for t in texts]
+    # a skipped ayah leaves its piece empty rather than shifting the rest
+    pieces = segment_recitation(corpus, 112, 1, 4, " ".join(texts[:2] + texts[3:]))
+    assert pieces[2] == "" and pieces[3] == normalize_arabic(texts[3])
+
+
+def test_corpus_build_freshness_and_rebuild(tmp_path, monkeypatch):
+    import os
+    import shutil
+    import corpus as corpus_module
+    from quran_data import get_ayah_text, load_dataset
+
+    json_path = str(tmp_path / "quran.json")
+    corpus_path = str(tmp_path / "quran.corpus")
+    shutil.copy(corpus_module.DEFAULT_JSON, json_path)
+    data = load_dataset(json_path)
+
+    with corpus_module.open_corpus(json_path, corpus_path) as corpus:
+        assert len(corpus) == 6236 and corpus.surah_count == 114
+        for surah, ayah in ((1, 1), (2, 255), (114, 6)):
+            assert corpus.ayah_text(surah, ayah) == get_ayah_text(data, surah, ayah)
+    assert corpus_module.corpus_is_fresh(json_path, corpus_path)
+
+    # touched, same content: hashed once, then the stored mtime matches again
+    hashed = []
+    real_sha256 = corpus_module._file_sha256
+    monkeypatch.setattr(corpus_module, "_file_sha256", lambda path: hashed.append(path) or real_sha256(path))
+    os.utime(json_path, ns=(1, 1))
+    assert corpus_module.corpus_is_fresh(json_path, corpus_path)
+    assert corpus_module.corpus_is_fresh(json_path, corpus_path)
+    assert hashed == [json_path]
+
+    # changed content: stale, and open_corpus rebuilds it
+    with open(json_path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert not corpus_module.corpus_is_fresh(json_path, corpus_path)
+    with corpus_module.open_corpus(json_path, corpus_path) as corpus:
+        assert len(corpus) == 6236
+    assert corpus_module.corpus_is_fresh(json_path, corpus_path)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_compare_many_keeps_input_order(workers, monkeypatch):
+    import quran_data
+    from corpus import get_corpus
+    from quran_data import compare_many, compare_texts, iter_compare_many
+
+    monkeypatch.setattr(quran_data, "_PARALLEL_MIN_PAIRS", 1)
+    corpus = get_corpus()
+    refs = [corpus.ayah_text(112, a) for a in range(1, 5)]
+    rng = random.Random(4)
+    pairs = []
+    for i in range(300):
+        ref = refs[i % 4]
+        words = ref.split()
+        user = " ".join(rng.sample(words, rng.randint(0, len(words))))
+        pairs.append((user, corpus.normalized_ayah(112, i % 4 + 1) if i % 2 else ref))
+    pairs += pairs[:50]  # repeated pairs are scored once but reported at each position
+
+    expected = [compare_texts(u, c, "levenshtein")['match_percent'] for u, c in pairs]
+    similarity, match_percent = compare_many(pairs, "levenshtein", workers=workers, chunksize=16)
+    assert list(match_percent) == expected and len(similarity) == len(pairs)
+    streamed = [m for _, m in iter_compare_many(iter(pairs), "levenshtein", workers=workers, chunksize=16,
+                                                block_size=64)]
+    assert streamed == expected
+
+
+def _speech_and_pauses(layout, rate=16000, seed=5):
+    """AudioData of (seconds, is_speech) parts: a 300 Hz tone over faint noise"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    parts = []
+    for seconds, speech in layout:
+        n = int(seconds * rate)
+        part = rng.normal(0, 30, n)
+        if speech:
+            part += 6000 * np.sin(2 * np.pi * 300 * np.arange(n) / rate)
+        parts.append(part)
+    return sr.AudioData(np.concatenate(parts).astype("<i2").tobytes(), rate, 2)
+
+
+def test_vad_trims_silence_and_splits_at_pauses():
+    import vad
+
+    def seconds(audio):
+        return len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+
+    audio = _speech_and_pauses([(1.0, False), (1.0, True), (1.0, False), (1.0, True), (0.5, False)])
+    trimmed = vad.trim_silence(audio)
+    assert seconds(trimmed) == pytest.approx(3.0 + 2 * vad.PAD_SECONDS, abs=0.05)
+    pieces = vad.split_at_pauses(audio)
+    assert [seconds(p) for p in pieces] == pytest.approx([1.0 + 2 * vad.PAD_SECONDS] * 2, abs=0.05)
+    # a pause shorter than min_pause does not split
+    assert len(vad.split_at_pauses(audio, min_pause=1.5)) == 1
+
+    silence = _speech_and_pauses([(2.0, False)])
+    assert vad.trim_silence(silence) is None and vad.split_at_pauses(silence) == []
+
+
+class _CountingBackend(FakeBackend):
+    """FakeBackend that counts the calls reaching the recognizer"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+
+    def _transcribe(self, audio):
+        self.calls += 1
+        return super()._transcribe(audio)
+
+
+def test_cache_does_not_remember_nothing_understood(tmp_path):
+    from transcription_cache import CachedBackend, TranscriptionCache
+
+    cache = TranscriptionCache(str(tmp_path / "transcripts.sqlite"))
+    inner = _CountingBackend()
+    backend = CachedBackend(inner, cache)
+    audio = _recording()
+    with pytest.raises(sr.UnknownValueError):
+        backend.transcribe(audio)
+    inner.register(audio, "الحمد لله")  # e.g. a flaky response the first time
+    assert backend.transcribe(audio) == "الحمد لله"
+    assert backend.transcribe(audio) == "الحمد لله"
+    assert inner.calls == 2
+    cache.close()
+
+
+def test_cache_keys_on_model_and_endpoint(tmp_path):
+    from transcription import GoogleBackend, VoskBackend
+    from transcription_cache import CachedBackend, TranscriptionCache
+
+    class ModelBackend(_CountingBackend):
+        def __init__(self, model, **kwargs):
+            super().__init__(**kwargs)
+            self.model = model
+
+        @property
+        def cache_identity(self):
+            return f"{self.name} {self.model}"
+
+    cache = TranscriptionCache(str(tmp_path / "transcripts.sqlite"))
+    audio = _recording()
+    small, large = ModelBackend("small"), ModelBackend("large")
+    small.register(audio, "small model text")
+    large.register(audio, "large model text")
+    assert CachedBackend(small, cache).transcribe(audio) == "small model text"
+    assert CachedBackend(large, cache).transcribe(audio) == "large model text"
+    assert CachedBackend(ModelBackend("small"), cache).transcribe(audio) == "small model text"
+    assert (small.calls, large.calls) == (1, 1)
+    cache.close()
+
+    google = GoogleBackend(endpoint="http://127.0.0.1:1/a", client=object())
+    assert google.cache_identity != GoogleBackend(endpoint="http://127.0.0.1:1/b", client=object()).cache_identity
+    vosk = VoskBackend.__new__(VoskBackend)
+    vosk.model_path = "models/vosk-small"
+    assert "vosk-small" in vosk.cache_identity
+
+
+def test_cache_hits_misses_and_lru_eviction(tmp_path, monkeypatch):
+    import sqlite3
+    import transcription_cache
+    from transcription_cache import TranscriptionCache
+
+    monkeypatch.setattr(transcription_cache, "USAGE_FLUSH_SECONDS", 3600)
+    path = str(tmp_path / "transcripts.sqlite")
+    cache = TranscriptionCache(path, max_bytes=1000)
+    cache.put("k0", "بسم الله", "fake", "ar")
+    assert cache.get("k0") == "بسم الله" and cache.get("missing") is None
+
+    # lookups are plain reads: they succeed while another process holds the write lock
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    assert cache.get("k0") == "بسم الله"
+    other.execute("ROLLBACK")
+    other.close()
+
+    for i in range(1, 10):
+        time.sleep(0.002)  # distinct last_used times
+        cache.put(f"k{i}", f"نص رقم {i}", "fake", "ar")
+        cache.get("k0")  # keeps k0 the most recently used
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000 and stats["evictions"] > 0
+    assert cache.get("k0") == "بسم الله" and cache.get("k1") is None
+    assert cache.get("k9") is not None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (stats["session_hits"], stats["session_misses"]) == (13, 2)
+    cache.close()
+
+
+def test_hedged_client_recovers_from_injected_failures():
+    from recognizer_http import HedgedClient, RequestPolicy, StubRecognizerServer
+    from transcription import GoogleBackend
+
+    audio = sr.AudioData(b"\0\0" * 8000, 16000, 2)
+    with StubRecognizerServer(transcript="الحمد لله", latency=0.01, failure_rate=0.3, seed=3) as stub:
+        client = HedgedClient(RequestPolicy(deadline=2.0, retries=6, backoff=0.01, hedge_initial_delay=0.5))
+        backend = GoogleBackend(endpoint=stub.url, client=client)
+        try:
+            assert [backend.transcribe(audio) for _ in range(10)] == ["الحمد لله"] * 10
+            stats = client.stats()
+        finally:
+            client.close()
+    assert stats["retries"] > 0 and stats["failures"] == 0
+    assert stub.requests == stats["attempts"] > 10
+
+
+def test_hedged_client_gives_up_after_retries():
+    from recognizer_http import HedgedClient, RequestPolicy, StubRecognizerServer
+
+    with StubRecognizerServer(latency=0.01, failure_rate=1.0) as stub:
+        client = HedgedClient(RequestPolicy(deadline=2.0, retries=2, backoff=0.01, hedge=False))
+        try:
+            with pytest.raises(sr.RequestError):
+                client.post(stub.url, b"", {})
+        finally:
+            client.close()
+    assert stub.requests == 3 and client.counters["failures"] == 1
+
+
+def test_hedge_wins_over_a_stalled_attempt():
+    from recognizer_http import HedgedClient, RequestPolicy, StubRecognizerServer
+
+    # the first request stalls; the hedge sent after 0.1 s answers first
+    with StubRecognizerServer(latency=0.01, slow_rate=0.5, slow_latency=1.5) as stub:
+        client = HedgedClient(RequestPolicy(deadline=3.0, hedge_min_delay=0.1, hedge_initial_delay=0.1))
+        try:
+            # (slow?, fail?) draws per request: slow and no failure, then fast
+            stub._random.random = iter([0.0, 1.0] + [1.0] * 10).__next__
+            client.post(stub.url, b"", {})
+            stats = client.stats()
+        finally:
+            client.close()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    assert stats["p50"] < 1.0
+
+
+def test_stitch_removes_overlap_only_after_hard_cuts():
+    from chunked_transcription import stitch
+    assert stitch(["قل هو الله احد", "الله احد الله الصمد"], [False, True]) == "قل هو الله احد الله الصمد"
+    assert stitch(["قل هو الله احد", "الله الصمد"], [False, False]) == "قل هو الله احد الله الصمد"
+    # a one-word match must not skip words to find it
+    assert stitch(["قل هو الله", "احد الله الصمد"], [False, True]) == "قل هو الله احد الله الصمد"
+
+
+def test_chunks_are_not_retried_on_top_of_the_http_client():
+    from chunked_transcription import Chunk, transcribe_chunks
+    from recognizer_http import HedgedClient, RequestPolicy, StubRecognizerServer
+    from transcription import GoogleBackend
+
+    audio = sr.AudioData(b"\0\0" * 8000, 16000, 2)
+    chunks = [Chunk(audio, 0, 8000, False), Chunk(audio, 8000, 16000, True)]
+    with StubRecognizerServer(latency=0.01, failure_rate=1.0) as stub:
+        client = HedgedClient(RequestPolicy(deadline=2.0, retries=1, backoff=0.01, hedge=False))
+        try:
+            assert transcribe_chunks(GoogleBackend(endpoint=stub.url, client=client), chunks) == ["", ""]
+        finally:
+            client.close()
+    assert stub.requests == len(chunks) * 2  # the client's two rounds, nothing more
+
+
+def test_chunks_are_retried_for_backends_without_their_own_retries():
+    from chunked_transcription import Chunk, transcribe_chunks
+
+    class Flaky(_CountingBackend):
+        def _transcribe(self, audio):
+            if self.calls == 0:
+                self.calls += 1
+                raise sr.RequestError("connection reset")
+            return super()._transcribe(audio)
+
+    audio = _recording(seconds=0.5)
+    backend = Flaky()
+    backend.register(audio, "الحمد لله")
+    assert transcribe_chunks(backend, [Chunk(audio, 0, 1, False)]) == ["الحمد لله"]
+    assert backend.calls == 2
+
+
+def test_progress_store_rollups(tmp_path):
+    from progress_store import RECENT_WEIGHT, ProgressStore
+
+    store = ProgressStore(str(tmp_path / "progress.sqlite"))
+    today = time.time()
+    yesterday = today - 86400
+
+    def result(ayah, score):
+        return {"surah": 1, "ayah": ayah, "score": score, "is_correct": score >= 80, "similarity": score / 100}
+
+    store.record("amina", result(1, 100), "s1", yesterday)
+    store.record("amina", result(2, 50), "s1", yesterday)
+    store.record("amina", result(1, 40), "s2", today)
+    store.record("amina", result(3, 90), "s2", today)
+    store.record("bilal", result(1, 10), "s3", today)
+    store.record_session("amina", {"surah": 1, "start_ayah": 1, "ayah_count": 3, "total_compared": 2,
+                                   "correct_count": 1, "accuracy": 50.0}, "s2", today - 60, today)
+    assert store.flush()
+    try:
+        assert store.students() == ["amina", "bilal"]
+        summary = {row["ayah"]: row for row in store.ayah_summary("amina")}
+        assert summary[1]["attempts"] == 2 and summary[1]["correct"] == 1
+        assert summary[1]["average"] == 70
+        assert summary[1]["recent"] == pytest.approx(100 + RECENT_WEIGHT * (40 - 100))
+        assert summary[1]["last_score"] == 40
+
+        assert [row["ayah"] for row in store.weakest_ayahs("amina")] == [2, 1, 3]
+        assert [row["ayah"] for row in store.weakest_ayahs("amina", min_attempts=2)] == [1]
+
+        trend = store.accuracy_trend("amina", days=2)
+        assert [row["attempts"] for row in trend] == [2, 2]
+        assert [row["accuracy"] for row in trend] == [50.0, 50.0]
+        assert [row["average"] for row in trend] == [75.0, 65.0]
+        assert store.accuracy_trend("amina", days=1) == trend[1:]
+
+        assert [s["id"] for s in store.sessions("amina")] == ["s2"]
+        assert store.ayah_summary("nobody") == [] and store.sessions("bilal") == []
+    finally:
+        store.close()
+
+
+def test_review_scheduler_next_test_set_and_round_trip(tmp_path):
+    from review_scheduler import DAY, RELEARN_INTERVAL, ReviewScheduler
+
+    now = 1_700_000_000.0
+    scheduler = ReviewScheduler(100)
+    scheduler.enroll([5, 6, 7], now=now - 10)
+    scheduler.record(5, 95, now=now)          # recalled: due in a day
+    scheduler.record(6, 20, now=now - 3600)   # failed an hour ago: overdue by 50 minutes
+    assert scheduler.next_test_set(10, now=now) == [6, 7]
+    assert scheduler.next_test_set(10, now=now, ahead=True) == [6, 7, 5]
+    assert scheduler.next_test_set(1, now=now) == [6]
+    assert scheduler.due[6] == pytest.approx(now - 3600 + RELEARN_INTERVAL * DAY)
+
+    path = str(tmp_path / "student.bin")
+    scheduler.save(path)
+    with open(path, "rb") as f:
+        loaded = ReviewScheduler.from_bytes(f.read())
+    for v in (5, 6, 7, 8):
+        assert loaded.state(v) == scheduler.state(v)
+    assert loaded.next_test_set(10, now=now, ahead=True) == [6, 7, 5]
+    assert loaded.next_test_set(10, now=now + 2 * DAY) == [6, 7, 5]
+
+
+def test_hifz_test_enrolls_its_ayahs_for_review(tester):
+    corpus = tester.quran_data
+    assert tester.start_hifz_test(1, 2, 3)
+    scheduler = tester.scheduler
+    expected = [corpus.verse_id(1, a) for a in (2, 3, 4)]
+    assert sorted(scheduler.next_test_set(10)) == expected
+    tester.schedule_review({"surah": 1, "ayah": 3, "score": 95})
+    tester.start_hifz_test(1, 2, 3)  # already scheduled ayahs keep their due time
+    assert sorted(scheduler.next_test_set(10)) == [expected[0], expected[2]]
@@ -0,0 +1,256 @@
+"""
+Content-addressed transcription cache
+- TranscriptionCache: SQLite store (WAL mode, safe to share between
+  processes) of transcript by key, with LRU eviction under a size cap and
+  persistent hit/miss counters. Lookups are plain reads, so processes do
+  not queue on the write lock for them; their last_used/hit bookkeeping is
+  written in batches, with the next put or every USAGE_FLUSH_SECONDS
+- CachedBackend: wraps any TranscriptionBackend so identical audio is only
+  sent to the recognizer once
+
+Keys hash the canonical PCM (16 kHz, 16-bit mono) together with the
+backend's cache_identity (engine plus model path or endpoint) and language,
+so resampled copies of the same recording hit, while switching recognizer,
+model or language misses. Only transcripts are
+cached: "nothing understood" may come from a clipped take or a flaky
+response, so it is asked again next time, like recognizer errors.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from corpus import DATA_DIR
+from transcription import TranscriptionBackend, audio_fingerprint
+
+CACHE_PATH = os.path.join(DATA_DIR, "transcripts.sqlite")
+# CHANGEABLE: cap on stored transcript bytes before least recently used entries go
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Per-entry bookkeeping counted against the cap on top of the transcript
+_ENTRY_OVERHEAD = 128
+# Eviction frees down to this share of the cap, so it does not run on every put
+_EVICT_TO = 0.9
+# Lookup bookkeeping is written after this many lookups or seconds, or with a put
+_USAGE_BATCH = 256
+USAGE_FLUSH_SECONDS = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    transcript TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    language TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0), ('bytes', 0), ('evictions', 0);
+"""
+
+
+def cache_key(fingerprint: str, backend: str, language: str) -> str:
+    """`backend` is the backend's cache_identity."""
+    return hashlib.sha256(f"{backend}\0{language}\0{fingerprint}".encode()).hexdigest()
+
+
+class TranscriptionCache:
+    """
+    One connection per instance, shared by its threads under a lock; other
+    processes open their own instance on the same file.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.session_hits = 0
+        self.session_misses = 0
+        # key -> (last used, hits) and lookup counts not yet written
+        self._usage = {}
+        self._unwritten_hits = 0
+        self._unwritten_misses = 0
+        self._usage_written = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _bump(self, name: str, by: int = 1):
+        self._conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (by, name))
+
+    def get(self, key: str):
+        """Cached transcript for `key`, or None on a miss."""
+        with self._lock:
+            # "" entries were written by older versions for "nothing understood"
+            row = self._conn.execute("SELECT transcript FROM entries WHERE key = ? AND transcript != ''",
+                                     (key,)).fetchone()
+            if row is None:
+                self.session_misses += 1
+                self._unwritten_misses += 1
+            else:
+                self.session_hits += 1
+                self._unwritten_hits += 1
+                hits = self._usage.get(key, (0, 0))[1]
+                self._usage[key] = (time.time(), hits + 1)
+            lookups = self._unwritten_hits + self._unwritten_misses
+            if lookups >= _USAGE_BATCH or time.monotonic() - self._usage_written >= USAGE_FLUSH_SECONDS:
+                self._write_usage()
+        return row[0] if row else None
+
+    def _apply_usage(self):
+        """Write pending lookup bookkeeping (inside a transaction)."""
+        if self._usage:
+            self._conn.executemany("UPDATE entries SET last_used = MAX(last_used, ?), hits = hits + ? WHERE key = ?",
+                                   [(used, hits, key) for key, (used, hits) in self._usage.items()])
+        if self._unwritten_hits:
+            self._bump("hits", self._unwritten_hits)
+        if self._unwritten_misses:
+            self._bump("misses", self._unwritten_misses)
+        self._usage.clear()
+        self._unwritten_hits = self._unwritten_misses = 0
+        self._usage_written = time.monotonic()
+
+    def _write_usage(self):
+        if not (self._usage or self._unwritten_hits or self._unwritten_misses):
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._apply_usage()
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def flush(self):
+        """Write pending lookup bookkeeping now."""
+        with self._lock:
+            self._write_usage()
+
+    def put(self, key: str, transcript: str, backend: str, language: str):
+        size = len(transcript.encode("utf-8")) + _ENTRY_OVERHEAD
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                                   (key, transcript, backend, language, size, now, now))
+                self._bump("bytes", size - (old[0] if old else 0))
+                self._apply_usage()  # so eviction sees recent hits
+                self._evict()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        """Drop least recently used entries until under the cap (inside a transaction)."""
+        total = self._conn.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * _EVICT_TO)
+        freed = evicted = 0
+        while total - freed > target:
+            victims = self._conn.execute("SELECT key, size FROM entries ORDER BY last_used LIMIT 256").fetchall()
+            if not victims:
+                break
+            for key, size in victims:
+                if total - freed <= target:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                freed += size
+                evicted += 1
+        self._bump("bytes", -freed)
+        self._bump("evictions", evicted)
+
+    def stats(self) -> dict:
+        """Persistent counters (all processes) plus this instance's session hits/misses."""
+        with self._lock:
+            self._write_usage()
+            counters = dict(self._conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "entries": entries,
+            "bytes": counters["bytes"],
+            "max_bytes": self.max_bytes,
+            "hits": counters["hits"],
+            "misses": counters["misses"],
+            "evictions": counters["evictions"],
+            "hit_rate": counters["hits"] / lookups if lookups else 0.0,
+            "session_hits": self.session_hits,
+            "session_misses": self.session_misses,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._usage.clear()
+            self._unwritten_hits = self._unwritten_misses = 0
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("UPDATE counters SET value = 0")
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._write_usage()
+            self._conn.close()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def get_cache(path: str = CACHE_PATH) -> TranscriptionCache:
+    """Process-wide cache instance for `path` (writes pending bookkeeping at exit)."""
+    with _shared_lock:
+        cache = _shared.get(path)
+        if cache is None:
+            import atexit
+            cache = _shared[path] = TranscriptionCache(path)
+            atexit.register(cache.flush)
+        return cache
+
+
+class CachedBackend(TranscriptionBackend):
+    """Serves repeated audio from the cache and forwards the rest to `backend`."""
+
+    def __init__(self, backend: TranscriptionBackend, cache: TranscriptionCache = None):
+        super().__init__(backend.language)
+        self.backend = backend
+        self.name = backend.name
+        self.wants_preprocessing = backend.wants_preprocessing
+        self.handles_retries = backend.handles_retries
+        self.cache = cache or get_cache()
+
+    @property
+    def cache_identity(self) -> str:
+        return self.backend.cache_identity
+
+    def _transcribe(self, audio) -> str:
+        key = cache_key(audio_fingerprint(audio), self.backend.cache_identity, self.language)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        text = self.backend.transcribe(audio)
+        if text:
+            self.cache.put(key, text, self.backend.name, self.language)
+        return text
+
+
+if __name__ == "__main__":
+    import sys
+    cache = get_cache()
+    if "--clear" in sys.argv[1:]:
+        cache.clear()
+    stats = cache.stats()
+    print(f"{cache.path}: {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB "
+          f"of {stats['max_bytes'] / 1024 / 1024:.0f} MiB")
+    print(f"hits {stats['hits']}, misses {stats['misses']} ({stats['hit_rate']:.0%} hit rate), "
+          f"evictions {stats['evictions']}")
@@ -0,0 +1,247 @@
+"""
+Voice activity detection on raw PCM (NumPy)
+- frame_features(samples, frame_len): per-frame energy (dBFS) and zero-crossing rate
+- speech_mask(...): frames classified as speech, smoothed with hangover
+- speech_segments(...) / trim_silence(audio) / split_at_pauses(audio):
+  offline trimming and pause splitting of a recorded AudioData
+- Endpointer: streaming detector fed block by block while recording, which
+  reports when the speaker has stopped
+
+A frame is speech when its energy is well above the noise floor, or when it
+is moderately loud with a high zero-crossing rate (unvoiced fricatives such
+as س ش ص ف carry little energy). Short gaps inside speech are bridged by the
+hangover, short bursts of noise are dropped.
+"""
+
+import numpy as np
+import speech_recognition as sr
+
+FRAME_SECONDS = 0.02
+# CHANGEABLE: dB above the noise floor for loud (voiced) and quiet (unvoiced) speech
+VOICED_MARGIN_DB = 12.0
+UNVOICED_MARGIN_DB = 6.0
+# Zero-crossings per sample above which a quiet frame counts as a fricative
+UNVOICED_ZCR = 0.25
+# Speech shorter than this is noise; silence shorter than the hangover is
+# still part of the utterance
+MIN_SPEECH_SECONDS = 0.06
+HANGOVER_SECONDS = 0.25
+# Silence that ends a live recording, and pauses long recitations are split at
+END_SILENCE_SECONDS = 0.8
+SPLIT_PAUSE_SECONDS = 0.5
+# Audio kept around each detected segment so word edges are not clipped
+PAD_SECONDS = 0.15
+# Quietest share of frames used to estimate the noise floor offline (low,
+# since trimmed recitations may be almost all speech)
+_NOISE_PERCENTILE = 5
+# Floor assumed for digital silence
+_MIN_DB = -100.0
+
+
+def pcm_to_float(raw: bytes, sample_width: int) -> np.ndarray:
+    """Little-endian PCM bytes -> float32 samples in [-1, 1]."""
+    if sample_width == 1:
+        return (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    if sample_width == 2:
+        return np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    if sample_width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        return ints.astype(np.float32) / float(1 << 23)
+    return np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+
+
+def rms_to_db(rms: float, sample_width: int) -> float:
+    """Integer-scale RMS (as in Recognizer.energy_threshold) -> dBFS."""
+    full_scale = float(1 << (8 * sample_width - 1))
+    return 20.0 * np.log10(max(rms, 1e-9) / full_scale)
+
+
+def frame_features(samples: np.ndarray, frame_len: int):
+    """(energy_db, zcr) for each complete frame of `samples`."""
+    count = len(samples) // frame_len
+    if count == 0:
+        return np.empty(0), np.empty(0)
+    frames = samples[:count * frame_len].reshape(count, frame_len)
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    power = np.mean(np.square(frames, dtype=np.float64), axis=1)
+    energy_db = np.maximum(10.0 * np.log10(np.maximum(power, 1e-20)), _MIN_DB)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(max(frame_len - 1, 1))
+    return energy_db, zcr
+
+
+def classify_frames(energy_db, zcr, noise_floor_db: float):
+    """Raw per-frame speech decision from energy and zero-crossing rate."""
+    voiced = energy_db > noise_floor_db + VOICED_MARGIN_DB
+    unvoiced = (energy_db > noise_floor_db + UNVOICED_MARGIN_DB) & (zcr > UNVOICED_ZCR)
+    return voiced | unvoiced
+
+
+def _runs(mask):
+    """(starts, ends) of the runs of True in a bool array, ends exclusive."""
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def smooth_mask(mask, hangover_frames: int, min_speech_frames: int):
+    """Bridge gaps up to the hangover, then drop runs shorter than min_speech."""
+    mask = np.asarray(mask, dtype=bool).copy()
+    starts, ends = _runs(mask)
+    for gap_start, gap_end in zip(ends[:-1], starts[1:]):
+        if gap_end - gap_start <= hangover_frames:
+            mask[gap_start:gap_end] = True
+    starts, ends = _runs(mask)
+    for start, end in zip(starts, ends):
+        if end - start < min_speech_frames:
+            mask[start:end] = False
+    return mask
+
+
+def estimate_noise_floor(energy_db) -> float:
+    # digital silence (e.g. zero padding) says nothing about the room
+    audible = energy_db[energy_db > _MIN_DB + 1]
+    return float(np.percentile(audible, _NOISE_PERCENTILE)) if len(audible) else _MIN_DB
+
+
+def speech_mask(samples: np.ndarray, sample_rate: int, noise_floor_db: float = None):
+    """Smoothed per-frame speech mask and the frame length used."""
+    frame_len = max(1, int(sample_rate * FRAME_SECONDS))
+    energy_db, zcr = frame_features(samples, frame_len)
+    if noise_floor_db is None:
+        noise_floor_db = estimate_noise_floor(energy_db)
+    mask = classify_frames(energy_db, zcr, noise_floor_db)
+    mask = smooth_mask(mask, int(HANGOVER_SECONDS / FRAME_SECONDS), int(MIN_SPEECH_SECONDS / FRAME_SECONDS))
+    return mask, frame_len
+
+
+def speech_segments(samples: np.ndarray, sample_rate: int, min_pause: float = SPLIT_PAUSE_SECONDS,
+                    noise_floor_db: float = None):
+    """
+    (start, end) sample ranges of speech, padded by PAD_SECONDS. Segments
+    separated by less than `min_pause` seconds of silence are merged.
+    """
+    mask, frame_len = speech_mask(samples, sample_rate, noise_floor_db)
+    starts, ends = _runs(mask)
+    if not len(starts):
+        return []
+    pause_frames = min_pause / FRAME_SECONDS
+    merged = [[starts[0], ends[0]]]
+    for start, end in zip(starts[1:], ends[1:]):
+        if start - merged[-1][1] < pause_frames:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    pad = int(PAD_SECONDS * sample_rate)
+    total = len(samples)
+    return [(max(0, int(s) * frame_len - pad), min(total, int(e) * frame_len + pad)) for s, e in merged]
+
+
+def _slice(audio, start: int, end: int):
+    width = audio.sample_width
+    return sr.AudioData(audio.frame_data[start * width:end * width], audio.sample_rate, width)
+
+
+def trim_silence(audio, noise_floor_db: float = None):
+    """AudioData with leading and trailing silence cut, or None if no speech was found."""
+    samples = pcm_to_float(audio.frame_data, audio.sample_width)
+    segments = speech_segments(samples, audio.sample_rate, float("inf"), noise_floor_db)
+    if not segments:
+        return None
+    return _slice(audio, segments[0][0], segments[-1][1])
+
+
+def split_at_pauses(audio, min_pause: float = SPLIT_PAUSE_SECONDS, noise_floor_db: float = None):
+    """Speech segments of `audio` as separate AudioData objects, in order."""
+    samples = pcm_to_float(audio.frame_data, audio.sample_width)
+    return [_slice(audio, start, end)
+            for start, end in speech_segments(samples, audio.sample_rate, min_pause, noise_floor_db)]
+
+
+class Endpointer:
+    """
+    Streaming speech detector. feed() raw PCM blocks as they are read from
+    the microphone; it returns True once speech has started and then been
+    followed by `end_silence` seconds of silence.
+
+    threshold_rms is the recognizer's calibrated energy_threshold; without
+    it the noise floor is taken from the first ~0.25 s of audio. Frames
+    heard before speech starts are averaged into ambient_rms, so every
+    recording doubles as a fresh ambient-noise measurement.
+    """
+
+    _CALIBRATION_SECONDS = 0.25
+
+    def __init__(self, sample_rate: int, sample_width: int, threshold_rms: float = None,
+                 end_silence: float = END_SILENCE_SECONDS):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.frame_len = max(1, int(sample_rate * FRAME_SECONDS))
+        self.end_silence_frames = max(1, int(end_silence / FRAME_SECONDS))
+        self.min_speech_frames = max(1, int(MIN_SPEECH_SECONDS / FRAME_SECONDS))
+        self.noise_floor_db = None
+        if threshold_rms:
+            # energy_threshold already sits above ambient noise
+            self.noise_floor_db = rms_to_db(threshold_rms, sample_width) - UNVOICED_MARGIN_DB
+        self._calibration = []
+        self._pending = np.empty(0, dtype=np.float32)
+        self.frames = 0
+        self.speech_started = False
+        self.speech_start_frame = None
+        self._speech_run = 0
+        self._silence_run = 0
+        self._ambient_power = 0.0
+        self._ambient_frames = 0
+        self.done = False
+
+    def _add_ambient(self, energy_db):
+        self._ambient_power += float(np.sum(np.power(10.0, np.asarray(energy_db) / 10.0)))
+        self._ambient_frames += len(energy_db)
+
+    def feed(self, raw: bytes) -> bool:
+        if self.done:
+            return True
+        samples = np.concatenate((self._pending, pcm_to_float(raw, self.sample_width)))
+        usable = len(samples) - len(samples) % self.frame_len
+        self._pending = samples[usable:]
+        energy_db, zcr = frame_features(samples[:usable], self.frame_len)
+
+        if self.noise_floor_db is None:
+            self._calibration.extend(energy_db.tolist())
+            self._add_ambient(energy_db)
+            if len(self._calibration) * FRAME_SECONDS < self._CALIBRATION_SECONDS:
+                self.frames += len(energy_db)
+                return False
+            self.noise_floor_db = float(np.median(self._calibration))
+
+        speech = classify_frames(energy_db, zcr, self.noise_floor_db)
+        if not self.speech_started:
+            self._add_ambient(energy_db[~speech])
+        for is_speech in speech:
+            self.frames += 1
+            if is_speech:
+                self._speech_run += 1
+                self._silence_run = 0
+                if not self.speech_started and self._speech_run >= self.min_speech_frames:
+                    self.speech_started = True
+                    self.speech_start_frame = self.frames - self._speech_run
+            else:
+                self._speech_run = 0
+                self._silence_run += 1
+                if self.speech_started and self._silence_run >= self.end_silence_frames:
+                    self.done = True
+                    break
+        return self.done
+
+    @property
+    def elapsed(self) -> float:
+        return self.frames * FRAME_SECONDS
+
+    @property
+    def ambient_rms(self):
+        """Integer-scale RMS of the silence before speech (None if none was heard)."""
+        if not self._ambient_frames:
+            return None
+        full_scale = float(1 << (8 * self.sample_width - 1))
+        return float(np.sqrt(self._ambient_power / self._ambient_frames)) * full_scale
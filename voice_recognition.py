@@ -2,16 +2,62 @@
 Enhanced Voice Recognition with Better Debugging
 """
 
+import atexit
+import collections
+import os
 import speech_recognition as sr
 import threading
 import time
 
+import calibration
+from transcription import TranscriptionBackend, get_backend
+
+# Optional: frame-level VAD/endpointing if NumPy is installed; otherwise
+# recordings fall back to the recognizer's own energy-threshold listen()
+try:
+    import vad
+    HAVE_VAD = True
+except Exception:
+    HAVE_VAD = False
+
+# Optional: resampling/denoising before transcription (also NumPy)
+try:
+    import preprocess
+    HAVE_PREPROCESS = preprocess.PREPROCESS_AUDIO
+except Exception:
+    HAVE_PREPROCESS = False
+
+# Seconds of audio kept from before speech starts
+PRE_ROLL_SECONDS = 0.5
+# Recordings longer than this are split at pauses before transcription
+SPLIT_MIN_SECONDS = 20
+# CHANGEABLE: capture in a helper process feeding a shared-memory ring
+# (set SURAHSYNC_CAPTURE_PROCESS=0 to read the microphone in-process)
+USE_CAPTURE_PROCESS = os.environ.get("SURAHSYNC_CAPTURE_PROCESS", "1") != "0"
+# Seconds of ambient noise sampled by a (background) calibration
+CALIBRATION_SECONDS = 1.0
+# Weight of the silence heard before each recitation when updating the threshold
+AMBIENT_SMOOTHING = 0.2
+
 
 class VoiceRecorder:
-    def __init__(self):
+    def __init__(self, backend=None):
         self.recognizer = sr.Recognizer()
         self.is_recording = False
         self.current_audio = None
+        # Noise floor (dBFS) measured during the last VAD recording
+        self.noise_floor_db = None
+        # The microphone can only be opened by one user at a time
+        self._mic_lock = threading.Lock()
+        self.calibration_thread = None
+        self.device_key = None
+        self.capture = None
+
+        # Transcription backend: a TranscriptionBackend instance or a backend
+        # name; defaults to transcription.TRANSCRIPTION_BACKEND
+        if not isinstance(backend, TranscriptionBackend):
+            backend = get_backend(backend)
+        self.backend = backend
 
         print("🔊 Initializing microphone...")
         try:
@@ -22,30 +68,95 @@ class VoiceRecorder:
             self.microphone = None
             return
 
+        # Reuse the saved calibration for this device; measure a new one in
+        # the background when there is none or it is old
+        self.device_key = calibration.device_key(self.microphone)
+        if USE_CAPTURE_PROCESS:
+            self._start_capture_process()
+        profile = calibration.load_profile(self.device_key)
+        if profile:
+            self.recognizer.energy_threshold = profile['energy_threshold']
+            self.noise_floor_db = profile.get('noise_floor_db')
+            age_hours = (time.time() - profile['calibrated_at']) / 3600
+            print(f"✅ Using saved calibration for {self.device_key} "
+                  f"(threshold {profile['energy_threshold']:.0f}, {age_hours:.1f} h old)")
+        if calibration.is_stale(profile):
+            self.calibrate_in_background()
+
+    def _start_capture_process(self):
+        """Keep the input stream open in a helper process and read it from shared memory"""
+        try:
+            from audio_capture import CaptureProcess
+            self.capture = CaptureProcess(self.microphone.device_index).start()
+        except Exception as e:
+            print(f"⚠️ Capture process unavailable ({e}) - capturing in-process")
+            self.capture = None
+            return
+        self.microphone = self.capture.source()
+        atexit.register(self.close)
+        print(f"✅ Capturing in helper process ({self.capture.sample_rate} Hz)")
+
+    def close(self):
+        """Stop the capture process, if one is running"""
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+
+    def calibrate(self, duration=CALIBRATION_SECONDS):
+        """Measure ambient noise now and save it as this device's profile"""
+        if not self.microphone:
+            return None
         print("🎚️ Calibrating for ambient noise...")
         try:
-            with self.microphone as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=3)
-            print("✅ Microphone calibrated")
+            with self._mic_lock, self.microphone as source:
+                self.recognizer.adjust_for_ambient_noise(source, duration=duration)
+            profile = calibration.save_profile(self.device_key, self.recognizer.energy_threshold)
+            print(f"✅ Microphone calibrated (threshold {self.recognizer.energy_threshold:.0f})")
+            return profile
         except Exception as e:
             print(f"❌ Calibration failed: {e}")
+            return None
+
+    def calibrate_in_background(self, duration=CALIBRATION_SECONDS):
+        """Run calibrate() on a daemon thread; recordings wait for it to release the microphone"""
+        self.calibration_thread = threading.Thread(target=self.calibrate, args=(duration,), daemon=True)
+        self.calibration_thread.start()
+        return self.calibration_thread
+
+    def _update_from_ambient(self, ambient_rms):
+        """Fold the silence heard before a recitation into the saved threshold"""
+        target = ambient_rms * self.recognizer.dynamic_energy_ratio
+        threshold = (1 - AMBIENT_SMOOTHING) * self.recognizer.energy_threshold + AMBIENT_SMOOTHING * target
+        self.recognizer.energy_threshold = threshold
+        try:
+            calibration.save_profile(self.device_key, threshold, self.noise_floor_db, source="recording")
+        except OSError as e:
+            print(f"⚠️ Could not save calibration: {e}")
 
-    def record_audio(self, duration=10):
-        """Record audio from microphone with enhanced error handling"""
+    def record_audio(self, duration=10, end_silence=None):
+        """
+        Record one utterance (at most `duration` seconds of speech). With VAD
+        available, recording stops as soon as the speaker pauses for
+        `end_silence` seconds and leading/trailing silence is trimmed.
+        """
         if not self.microphone:
             print("❌ No microphone available")
             return None
 
         try:
-            print(f"🎤 Recording for {duration} seconds...")
+            print(f"🎤 Recording for up to {duration} seconds...")
             print("💡 SPEAK CLEARLY IN ARABIC NOW!")
 
-            with self.microphone as source:
-                audio = self.recognizer.listen(
-                    source,
-                    timeout=20,
-                    phrase_time_limit=duration
-                )
+            with self._mic_lock, self.microphone as source:
+                if HAVE_VAD:
+                    audio = self._record_until_silence(source, duration, timeout=20,
+                                                       end_silence=end_silence or vad.END_SILENCE_SECONDS)
+                else:
+                    audio = self.recognizer.listen(
+                        source,
+                        timeout=20,
+                        phrase_time_limit=duration
+                    )
 
             print("✅ Recording complete!")
             self.current_audio = audio
@@ -59,17 +170,75 @@ class VoiceRecorder:
             print(f"❌ Recording error: {e}")
             return None
 
+    def _record_until_silence(self, source, duration, timeout, end_silence):
+        """Read from an open source until the Endpointer sees the end of speech."""
+        endpointer = vad.Endpointer(source.SAMPLE_RATE, source.SAMPLE_WIDTH,
+                                    self.recognizer.energy_threshold, end_silence)
+        seconds_per_read = source.CHUNK / source.SAMPLE_RATE
+        pre_roll = collections.deque(maxlen=max(1, int(PRE_ROLL_SECONDS / seconds_per_read)))
+        buffers = []
+        waited = 0.0
+        while not endpointer.speech_started:
+            if waited >= timeout:
+                raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+            block = source.stream.read(source.CHUNK)
+            pre_roll.append(block)
+            endpointer.feed(block)
+            waited += seconds_per_read
+        buffers.extend(pre_roll)
+
+        spoken = 0.0
+        while spoken < duration:
+            block = source.stream.read(source.CHUNK)
+            buffers.append(block)
+            spoken += seconds_per_read
+            if endpointer.feed(block):
+                break
+
+        audio = sr.AudioData(b"".join(buffers), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+        self.noise_floor_db = endpointer.noise_floor_db
+        if endpointer.ambient_rms:
+            self._update_from_ambient(endpointer.ambient_rms)
+        trimmed = vad.trim_silence(audio, endpointer.noise_floor_db)
+        if trimmed is not None:
+            print(f"✂️ Trimmed {len(buffers) * seconds_per_read:.1f}s to "
+                  f"{len(trimmed.frame_data) / (trimmed.sample_rate * trimmed.sample_width):.1f}s of speech")
+            return trimmed
+        return audio
+
+    def prepare_audio(self, audio):
+        """
+        Mono 16 kHz, DC-free, denoised and loudness-normalized copy of `audio`
+        for the recognizer (unchanged if preprocessing is unavailable or
+        already done, or the backend does not want it). The Google upload
+        is FLAC-encoded here as well.
+        """
+        if audio is None or not HAVE_PREPROCESS or isinstance(audio, preprocess.PreparedAudio):
+            return audio
+        if not self.backend.wants_preprocessing:
+            return audio
+        try:
+            prepared = preprocess.preprocess(audio, flac=self.backend.name == "google")
+        except Exception as e:
+            print(f"⚠️ Preprocessing failed ({e}) - sending the raw recording")
+            return audio
+        print(f"🎛️ Preprocessed {audio.sample_rate} Hz -> {prepared.sample_rate} Hz "
+              f"({len(audio.frame_data) // 1024} KiB -> {len(prepared.frame_data) // 1024} KiB): "
+              f"{preprocess.format_timings(prepared.timings)}")
+        return prepared
+
     def transcribe_audio(self, audio):
-        """Transcribe Arabic audio to text with multiple fallbacks"""
+        """Transcribe Arabic audio to text with the configured backend"""
         if audio is None:
             print("❌ No audio to transcribe")
             return ""
 
-        print("🔄 Transcribing Arabic speech...")
+        audio = self.prepare_audio(audio)
+        print(f"🔄 Transcribing Arabic speech ({self.backend.name})...")
 
-        # Try Google Speech Recognition first
         try:
-            text = self.recognizer.recognize_google(audio, language="ar-AR")
+            text = self.backend.transcribe(audio)
+            print(f"⏱️ {self.backend.name} took {self.backend.last_latency:.2f}s")
             if text and text.strip():
                 print(f"✅ Transcribed: '{text}'")
                 return text.strip()
@@ -78,7 +247,7 @@ class VoiceRecorder:
                 return ""
 
         except sr.UnknownValueError:
-            print("❌ Google could not understand the Arabic speech")
+            print(f"❌ {self.backend.name} could not understand the Arabic speech")
             print("💡 Possible reasons:")
             print("   - Background noise too loud")
             print("   - Speech too fast/unclear")
@@ -86,23 +255,76 @@ class VoiceRecorder:
             return ""
 
         except sr.RequestError as e:
-            print(f"❌ Google API error: {e}")
-            print("💡 Check your internet connection!")
+            print(f"❌ {self.backend.name} recognizer error: {e}")
+            if self.backend.name == "google":
+                print("💡 Check your internet connection!")
             return ""
 
         except Exception as e:
             print(f"❌ Unexpected transcription error: {e}")
             return ""
 
-    def quick_record_and_transcribe(self, duration=12):
+    def stream_chunks(self, chunk_seconds=3.0, stop_event=None, max_seconds=30):
+        """
+        Capture continuously from the microphone and yield an AudioData for
+        every `chunk_seconds` of audio as soon as it closes. The stream stays
+        open between chunks; capture ends when stop_event is set or after
+        max_seconds, yielding whatever partial chunk is left.
+        """
+        if not self.microphone:
+            print("❌ No microphone available")
+            return
+
+        with self._mic_lock, self.microphone as source:
+            reads_per_chunk = max(1, int(round(chunk_seconds * source.SAMPLE_RATE / source.CHUNK)))
+            max_reads = int(max_seconds * source.SAMPLE_RATE / source.CHUNK) if max_seconds else None
+            buffers = []
+            reads = 0
+            print(f"🎤 Streaming in {chunk_seconds:.1f}s chunks...")
+            while not (stop_event and stop_event.is_set()):
+                if max_reads is not None and reads >= max_reads:
+                    break
+                buffers.append(source.stream.read(source.CHUNK))
+                reads += 1
+                if len(buffers) >= reads_per_chunk:
+                    yield sr.AudioData(b"".join(buffers), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+                    buffers = []
+            if buffers:
+                yield sr.AudioData(b"".join(buffers), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+        print("✅ Streaming stopped")
+
+    def transcribe_long(self, audio):
+        """
+        Transcribe a possibly long recording: past SPLIT_MIN_SECONDS it is cut
+        into chunks at pauses, which are transcribed concurrently (with
+        timeouts and retries) and stitched back together.
+        """
+        if audio is None or not HAVE_VAD:
+            return self.transcribe_audio(audio)
+        seconds = len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
+        if seconds <= SPLIT_MIN_SECONDS:
+            return self.transcribe_audio(audio)
+        prepared = self.prepare_audio(audio)
+        # preprocessing moves the noise floor, so the chunker re-estimates it
+        noise_floor_db = self.noise_floor_db if prepared is audio else None
+        from chunked_transcription import transcribe_parallel
+        print(f"🔄 Transcribing {seconds:.1f}s recording in parallel chunks ({self.backend.name})...")
+        text = transcribe_parallel(self.backend, prepared, noise_floor_db)
+        if text:
+            print(f"✅ Transcribed: '{text}'")
+        else:
+            print("❌ No chunk could be transcribed")
+        return text
+
+    def quick_record_and_transcribe(self, duration=12, end_silence=None):
         """Quick record and transcribe with detailed logging"""
         print(f"\n{'=' * 50}")
         print("🎯 STARTING VOICE RECOGNITION")
         print(f"{'=' * 50}")
 
-        audio = self.record_audio(duration)
+        audio = self.record_audio(duration, end_silence)
         if audio:
-            result = self.transcribe_audio(audio)
+            result = self.transcribe_long(audio)
             print(f"{'=' * 50}")
             print(f"📝 FINAL RESULT: '{result}'")
             print(f"{'=' * 50}")
@@ -117,7 +339,7 @@ class VoiceRecorder:
             return False, "No microphone detected"
 
         try:
-            with self.microphone as source:
+            with self._mic_lock, self.microphone as source:
                 print("Testing microphone... say something!")
                 audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=3)
                 return True, "Microphone working"